@@ -3,29 +3,74 @@
 # =====================================================
 
 import os
+import re
 import json
+import hashlib
+import asyncio
+import time
+import weakref
 import textwrap
-from dataclasses import dataclass
-from typing import Dict, Any, List, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Type
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-import google.generativeai as genai
+from google.generativeai.types import generation_types
+from pydantic import BaseModel
+
+from json_stream import IncrementalJSONParser
+from llm_cache import cache_key, llm_cache
+from llm_providers import create_provider, model_registry
+from llm_schemas import (
+    EvaluationOutput,
+    GoalsOutput,
+    MaterialAdaptationOutput,
+    MaterialPersonalizationOutput,
+    OriginalAnalysis,
+    PEIOutput,
+    ProfileOutput,
+    ReportSectionOutput,
+    ResourcesOutput,
+    ResponseDigestOutput,
+    ReviewOutput,
+    StrategiesOutput,
+    gemini_schema,
+    inline_schema_hint,
+    schema_fingerprint,
+    structured_output_stats,
+    validate_output,
+)
+from rate_limit import gemini_rate_limiter
 
 load_dotenv()
 
 # ----------------- Config Gemini -----------------
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise RuntimeError("Defina GOOGLE_API_KEY no seu .env")
-genai.configure(api_key=GOOGLE_API_KEY)
+# Nada de rede nem de credenciais no import: genai.configure roda na primeira
+# chamada, então main.py sobe (e pode ser importado) sem GOOGLE_API_KEY.
+# As chamadas passam pelo provider ativo (LLM_PROVIDER, ver llm_providers.py).
+
+# Saída estruturada: o formato vai como response_schema nativo (llm_schemas.py)
+# em vez do SCHEMA de exemplo no prompt, e as entradas vão em JSON compacto.
+# Com 0 volta ao prompt antigo (o schema só valida a resposta).
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") not in ("0", "false", "False")
+
+# PEI: 'single' (padrão) pede o PEI inteiro numa chamada só; 'sectioned' gera as
+# seções independentes em paralelo (latência ~ seção mais lenta), ao custo de 10
+# chamadas por PEI, cada uma com o contexto inteiro (~10x tokens de entrada e RPM)
+PEI_GENERATION_MODE = os.getenv("PEI_GENERATION_MODE", "single")
+
+# Material: 'staged' analisa cada material uma vez (cache por hash do conteúdo) e só
+# personaliza por aluno; 'single' faz análise + adaptação numa chamada por aluno
+MATERIAL_ADAPTATION_MODE = os.getenv("MATERIAL_ADAPTATION_MODE", "staged")
+MATERIAL_ANALYSIS_MEMORY = int(os.getenv("MATERIAL_ANALYSIS_MEMORY", "256"))  # análises guardadas no processo
 
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 
 def _make_model(system_instruction: str):
-    return genai.GenerativeModel(
-        model_name=GEMINI_MODEL,
-        system_instruction=system_instruction
-    )
+    return llm_provider.model(system_instruction)
 
 # =====================================================
 # Funções utilitárias
@@ -41,27 +86,295 @@ def _clean_json_text(txt: str) -> dict:
             return json.loads(txt[s:e+1])
         raise ValueError("Não foi possível parsear JSON da resposta do modelo.")
 
-def llm_json(user_prompt: str, system: str) -> dict:
+# Recebe (nome da seção, valor) durante a geração em streaming
+SectionCallback = Callable[[str, Any], Awaitable[None]]
+
+# ----------------- Concorrência das chamadas assíncronas -----------------
+# Limite global e por agente de chamadas em voo; uma geração leva 20-60 s,
+# então o limite controla custo/quota, não threads (nenhuma fica bloqueada).
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_AGENT_CONCURRENCY = {
+    "pei_generator": int(os.getenv("LLM_PEI_CONCURRENCY", "8")),
+    "material_adapter": int(os.getenv("LLM_MATERIAL_CONCURRENCY", "16")),
+    # Modo por seções: ~10 chamadas curtas por PEI
+    "pei_section": int(os.getenv("LLM_PEI_SECTION_CONCURRENCY", "32")),
+    # Modo progressivo: resumo de cada resposta assim que ela chega
+    "response_digest": int(os.getenv("LLM_RESPONSE_DIGEST_CONCURRENCY", "8")),
+    "material_analysis": int(os.getenv("LLM_MATERIAL_ANALYSIS_CONCURRENCY", "8")),
+}
+
+
+class LLMConcurrency:
     """
-    Chama o Gemini e retorna SEMPRE dict.
+    Global + per-agent semaphores for llm_json_async. asyncio semaphores are
+    bound to one event loop, so each loop gets its own set (same limits).
     """
-    model = _make_model(system_instruction=system)
-    prompt = (
+
+    def __init__(self, global_limit: int = LLM_MAX_CONCURRENCY, agent_limits: Optional[Dict[str, int]] = None):
+        self.global_limit = global_limit
+        self.agent_limits = dict(agent_limits if agent_limits is not None else LLM_AGENT_CONCURRENCY)
+        self._by_loop: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.wait_seconds = 0.0
+
+    def _semaphores(self, agent: str) -> Tuple[asyncio.Semaphore, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._by_loop.setdefault(loop, {})
+            if "*" not in semaphores:
+                semaphores["*"] = asyncio.Semaphore(self.global_limit)
+            if agent not in semaphores:
+                semaphores[agent] = asyncio.Semaphore(self.agent_limits.get(agent, self.global_limit))
+            return semaphores["*"], semaphores[agent]
+
+    @asynccontextmanager
+    async def slot(self, agent: str):
+        global_semaphore, agent_semaphore = self._semaphores(agent)
+        start = time.perf_counter()
+        acquired = False
+        with self._lock:
+            self.waiting += 1
+        try:
+            # Agente primeiro: um agente no limite não segura vagas globais
+            async with agent_semaphore, global_semaphore:
+                acquired = True
+                with self._lock:
+                    self.waiting -= 1
+                    self.in_flight += 1
+                    self.calls += 1
+                    self.wait_seconds += time.perf_counter() - start
+                    self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                try:
+                    yield
+                finally:
+                    with self._lock:
+                        self.in_flight -= 1
+        finally:
+            if not acquired:  # cancelado enquanto esperava vaga
+                with self._lock:
+                    self.waiting -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "global_limit": self.global_limit,
+                "agent_limits": self.agent_limits,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "peak_in_flight": self.peak_in_flight,
+                "calls": self.calls,
+                "avg_wait_ms": round(self.wait_seconds / self.calls * 1000, 2) if self.calls else 0.0,
+            }
+
+
+llm_concurrency = LLMConcurrency()
+
+
+def _json_prompt(user_prompt: str) -> str:
+    return (
         user_prompt
         + "\n\nIMPORTANTE: Responda ESTRITAMENTE em JSON válido. Sem explicações fora do JSON."
     )
-    resp = model.generate_content(prompt)
-    text = getattr(resp, "text", None)
+
+
+@lru_cache(maxsize=None)
+def _generation_config(response_schema: Type[BaseModel]) -> Dict[str, Any]:
+    # Convertido para protos.Schema uma vez só; o SDK reaproveita o objeto a cada chamada
+    return generation_types.to_generation_config_dict({
+        "response_mime_type": "application/json",
+        "response_schema": gemini_schema(response_schema),
+    })
+
+
+def _prepare_call(
+    user_prompt: str, system: str, response_schema: Optional[Type[BaseModel]]
+) -> Tuple[str, str, Dict[str, Any]]:
+    """Prompt, cache key and extra generate_content kwargs of one LLM call"""
+    if response_schema is not None and LLM_STRUCTURED_OUTPUT:
+        prompt = user_prompt
+        key = cache_key(llm_provider.model_name, system, prompt, schema=schema_fingerprint(response_schema))
+        return prompt, key, {"generation_config": _generation_config(response_schema)}
+    prompt = _json_prompt(user_prompt)
+    return prompt, cache_key(llm_provider.model_name, system, prompt), {}
+
+
+def _record_prompt(response_schema: Optional[Type[BaseModel]], prompt: str, legacy_prompt_chars: Optional[int]):
+    schema_chars = 0
+    if response_schema is not None and LLM_STRUCTURED_OUTPUT:
+        schema_chars = len(json.dumps(gemini_schema(response_schema), ensure_ascii=False, separators=(",", ":")))
+    structured_output_stats.record_prompt(response_schema, len(prompt), schema_chars, legacy_prompt_chars or len(prompt))
+
+
+def _parse_output(text: str, response_schema: Optional[Type[BaseModel]]) -> dict:
+    try:
+        result = _clean_json_text(text)
+    except ValueError:
+        structured_output_stats.record_failure(response_schema, "parse_failures")
+        raise
+    if response_schema is not None:
+        validate_output(response_schema, result)
+    return result
+
+
+def _response_text(resp) -> str:
+    try:
+        text = resp.text
+    except (AttributeError, ValueError):  # .text levanta ValueError quando não há partes
+        text = None
     if not text:
         try:
             text = "".join([p.text for p in resp.candidates[0].content.parts])
         except Exception:
             raise RuntimeError("Resposta vazia do Gemini.")
-    return _clean_json_text(text)
+    return text
+
+
+# Estimativa reservada no bucket de tokens/min antes da chamada; acertada
+# com o usage_metadata da resposta (prompt ~4 caracteres por token)
+LLM_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "4096"))
+
+
+def _estimate_tokens(system: str, prompt: str) -> int:
+    return (len(system) + len(prompt)) // 4 + LLM_OUTPUT_TOKENS_ESTIMATE
+
+
+def _usage_tokens(resp) -> Optional[int]:
+    usage = getattr(resp, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) or None
+
+
+def _prompt_tokens(resp) -> Optional[int]:
+    usage = getattr(resp, "usage_metadata", None)
+    return getattr(usage, "prompt_token_count", None) or None
+
+
+def llm_json(
+    user_prompt: str,
+    system: str,
+    use_cache: bool = True,
+    response_schema: Optional[Type[BaseModel]] = None,
+    legacy_prompt_chars: Optional[int] = None,
+) -> dict:
+    """
+    Chama o Gemini e retorna SEMPRE dict.
+    
+    Respostas ficam no llm_cache (chave: modelo + system + prompt);
+    use_cache=False força uma chamada nova e não grava o resultado.
+    
+    Com response_schema (llm_schemas.py) e LLM_STRUCTURED_OUTPUT, o formato vai
+    como schema nativo do Gemini; a resposta é validada contra ele.
+    legacy_prompt_chars é o tamanho do mesmo prompt no formato antigo, só para
+    as métricas de economia.
+    """
+    prompt, key, call_kwargs = _prepare_call(user_prompt, system, response_schema)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            return cached
+    
+    model = _make_model(system_instruction=system)
+    estimated = _estimate_tokens(system, prompt)
+    _record_prompt(response_schema, prompt, legacy_prompt_chars)
+    # Espera vaga nos buckets de rpm/tpm e repete 429/5xx com backoff (rate_limit.py)
+    resp = gemini_rate_limiter.call(lambda: model.generate_content(prompt, **call_kwargs), estimated)
+    gemini_rate_limiter.record_usage(estimated, _usage_tokens(resp))
+    structured_output_stats.record_prompt_tokens(response_schema, _prompt_tokens(resp))
+    result = _parse_output(_response_text(resp), response_schema)
+    if use_cache:
+        llm_cache.put(key, llm_provider.model_name, result)
+    return result
+
+
+async def llm_json_async(
+    user_prompt: str,
+    system: str,
+    agent: str = "default",
+    use_cache: bool = True,
+    on_section: Optional[SectionCallback] = None,
+    item_paths: Sequence[Sequence[str]] = (),
+    response_schema: Optional[Type[BaseModel]] = None,
+    legacy_prompt_chars: Optional[int] = None,
+) -> dict:
+    """
+    Versão assíncrona de llm_json (generate_content_async do SDK).
+    
+    A chamada espera vaga no semáforo global e no do agente (llm_concurrency);
+    o cache é consultado antes, então hits não ocupam vaga.
+    
+    Com on_section, a resposta vem em streaming e cada seção de primeiro nível
+    (e cada item dos arrays em item_paths) é entregue assim que fica completa,
+    antes do fim da geração. Num hit de cache as seções são entregues de uma vez.
+    """
+    prompt, key, call_kwargs = _prepare_call(user_prompt, system, response_schema)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            if on_section:
+                for name, value in IncrementalJSONParser(item_paths).feed(json.dumps(cached, ensure_ascii=False)):
+                    await on_section(name, value)
+            return cached
+    
+    model = _make_model(system_instruction=system)
+    usage: Dict[str, Optional[int]] = {}
+    
+    async def generate() -> Tuple[str, Optional[int]]:
+        async with llm_concurrency.slot(agent):
+            if on_section is None:
+                resp = await model.generate_content_async(prompt, **call_kwargs)
+                usage["prompt"] = _prompt_tokens(resp)
+                return _response_text(resp), _usage_tokens(resp)
+            # Numa nova tentativa o parser recomeça; o cliente substitui as seções pelo nome
+            parser = IncrementalJSONParser(item_paths)
+            tokens = None
+            async for chunk in await model.generate_content_async(prompt, stream=True, **call_kwargs):
+                tokens = _usage_tokens(chunk) or tokens
+                usage["prompt"] = _prompt_tokens(chunk) or usage.get("prompt")
+                try:
+                    piece = _response_text(chunk)
+                except RuntimeError:
+                    continue  # pedaço sem texto (ex.: só metadados/finish_reason)
+                for name, value in parser.feed(piece):
+                    await on_section(name, value)
+            return parser.text, tokens
+    
+    # A espera pelos buckets acontece fora do semáforo: quem está na fila não ocupa vaga
+    estimated = _estimate_tokens(system, prompt)
+    _record_prompt(response_schema, prompt, legacy_prompt_chars)
+    text, tokens = await gemini_rate_limiter.call_async(generate, estimated)
+    gemini_rate_limiter.record_usage(estimated, tokens)
+    structured_output_stats.record_prompt_tokens(response_schema, usage.get("prompt"))
+    result = _parse_output(text, response_schema)
+    if use_cache:
+        llm_cache.put(key, llm_provider.model_name, result)
+    return result
 
 def pretty(obj: Any) -> str:
     return json.dumps(obj, ensure_ascii=False, indent=2)
 
+
+def compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _compact_prompt(prompt: str) -> str:
+    """Drop the template indentation and blank-line runs (they are tokens too)"""
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(line.strip() for line in prompt.strip().splitlines()))
+
+
+def _structured(structured: Optional[bool]) -> bool:
+    return LLM_STRUCTURED_OUTPUT if structured is None else structured
+
+
+def _legacy_prompt_chars(build_prompt: Callable[..., str], *args, **kwargs) -> Optional[int]:
+    """Size of the old-format prompt (SCHEMA example + indent=2), for the savings metrics"""
+    if not LLM_STRUCTURED_OUTPUT:
+        return None
+    return len(_json_prompt(build_prompt(*args, structured=False, **kwargs)))
+
 # =====================================================
 # Definições de Dados
 # =====================================================
@@ -83,6 +396,8 @@ class ProfessionalResponse:
     professional_name: str
     responses: Dict[str, Any]
     timestamp: str
+    digest: Optional[Dict[str, Any]] = None  # ResponseDigestAgent (modo progressivo): usado no lugar das respostas
+
 
 @dataclass
 class PEIDocument:
@@ -97,6 +412,82 @@ class PEIDocument:
     evaluation_criteria: Dict[str, Any]
     confidence_score: int
     generated_at: str
+    sections: Optional[Dict[str, Any]] = None  # estado por seção da geração (regeneração incremental)
+    warnings: List[str] = field(default_factory=list)  # pontos a revisar (PEI.ai_warnings)
+    suggestions: List[str] = field(default_factory=list)  # sugestões para a equipe (PEI.ai_suggestions)
+
+
+def response_fingerprint(response: ProfessionalResponse) -> str:
+    """Hash of one response's content (stored digests and incremental regeneration compare it)"""
+    payload = [response.professional_id, response.professional_type, response.professional_name, response.responses]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+@dataclass(frozen=True)
+class PEISection:
+    """Parte do PEI gerada numa chamada própria (modo por seções)"""
+    name: str
+    schema: Type[BaseModel]
+    task: str
+
+
+class ResponseDigestAgent:
+    """
+    Agente que resume UMA resposta de profissional assim que ela chega
+    (modo progressivo): achados por seção do relatório, com a fonte.
+    A geração final do PEI recebe esses resumos no lugar das respostas.
+    """
+    
+    SYSTEM_INSTRUCTION = textwrap.dedent("""
+    Você é um especialista em educação especial que prepara a elaboração de
+    Planos Educacionais Individualizados (PEI) no Brasil.
+    
+    Você recebe a resposta de UM profissional (psicólogo, professor, pais,
+    terapeuta) sobre um aluno e extrai, sem inventar nada, os achados
+    relevantes para o PEI, organizados por área.
+    """)
+    
+    SCHEMA_HINT = "Responda no formato JSON do schema de resposta."
+    
+    @staticmethod
+    def build_prompt(student: StudentInfo, response: ProfessionalResponse, structured: Optional[bool] = None) -> str:
+        if _structured(structured):
+            schema_hint = ResponseDigestAgent.SCHEMA_HINT
+        else:
+            schema_hint = inline_schema_hint(ResponseDigestOutput)
+        prompt = f"""
+        Extraia os achados da resposta abaixo sobre o aluno {student.name}
+        ({student.grade}; necessidades: {', '.join(student.special_needs)}).
+        Use frases curtas e específicas; deixe a lista vazia quando a resposta não tratar do assunto.
+        
+        === {response.professional_type.upper()} - {response.professional_name} ===
+        {compact(response.responses)}
+        
+        {schema_hint}
+        """
+        return _compact_prompt(prompt)
+    
+    @staticmethod
+    def run(student: StudentInfo, response: ProfessionalResponse, use_cache: bool = True) -> Dict[str, Any]:
+        return llm_json(
+            ResponseDigestAgent.build_prompt(student, response),
+            system=ResponseDigestAgent.SYSTEM_INSTRUCTION,
+            use_cache=use_cache,
+            response_schema=ResponseDigestOutput,
+        )
+    
+    @staticmethod
+    async def run_async(student: StudentInfo, response: ProfessionalResponse, use_cache: bool = True) -> Dict[str, Any]:
+        return await llm_json_async(
+            ResponseDigestAgent.build_prompt(student, response),
+            system=ResponseDigestAgent.SYSTEM_INSTRUCTION,
+            agent="response_digest",
+            use_cache=use_cache,
+            response_schema=ResponseDigestOutput,
+        )
 
 # =====================================================
 # AGENTE 1: PEI Generator
@@ -235,20 +626,59 @@ class PEIGeneratorAgent:
     }
     """)
     
+    # Com saída estruturada o formato vai no response_schema (llm_schemas.PEIOutput)
+    SCHEMA_HINT = "Responda no formato JSON do schema de resposta."
+    
+    # Modo por seções: as partes independentes do PEI saem em paralelo, todas a
+    # partir do mesmo resumo das respostas (build_context)
+    REPORT_PARTS = ("cognitive_development", "attention_concentration", "socioemotional", "communication")
+    SECTIONS = (
+        PEISection("detailed_report.cognitive_development", ReportSectionOutput,
+                   "Escreva o relatório de desenvolvimento cognitivo do aluno (3-4 parágrafos)."),
+        PEISection("detailed_report.attention_concentration", ReportSectionOutput,
+                   "Escreva o relatório de atenção e concentração do aluno (2-3 parágrafos)."),
+        PEISection("detailed_report.socioemotional", ReportSectionOutput,
+                   "Escreva o relatório socioemocional do aluno (2-3 parágrafos)."),
+        PEISection("detailed_report.communication", ReportSectionOutput,
+                   "Escreva o relatório de comunicação do aluno (2-3 parágrafos)."),
+        PEISection("profile", ProfileOutput,
+                   "Identifique o aluno (idade calculada pela data de nascimento) e liste de 4 a 6 "
+                   "potencialidades (strengths) e de 4 a 6 dificuldades (difficulties)."),
+        PEISection("educational_goals", GoalsOutput,
+                   "Defina metas de curto (3 meses), médio (6 meses) e longo prazo (12 meses), "
+                   "com o prazo entre parênteses em cada meta."),
+        PEISection("methodological_strategies", StrategiesOutput,
+                   "Liste estratégias metodológicas para apresentação do conteúdo, atividades e ambiente."),
+        PEISection("assistive_resources", ResourcesOutput,
+                   "Liste os recursos de tecnologia assistiva necessários e os recomendados."),
+        PEISection("evaluation_criteria", EvaluationOutput,
+                   "Defina as adaptações de avaliação, o peso (%) de cada instrumento (somando 100) e o foco da avaliação."),
+        PEISection("review", ReviewOutput,
+                   "Calcule confidence_score: completude das respostas (40%), convergência entre "
+                   "profissionais (30%) e especificidade das informações (30%). Liste pontos a revisar "
+                   "(warnings) e sugestões para a equipe (suggestions)."),
+    )
+    
     @staticmethod
-    def run(
+    def response_body(response: ProfessionalResponse, serialize: Callable[[Any], str]) -> str:
+        # Resumo pronto (ResponseDigestAgent): a síntese só combina os achados
+        if response.digest is not None:
+            return f"Achados (resumo da resposta):\n{compact(response.digest)}"
+        return f"Respostas:\n{serialize(response.responses)}"
+    
+    @staticmethod
+    def build_prompt(
         student: StudentInfo,
-        responses: List[ProfessionalResponse]
-    ) -> PEIDocument:
-        """
-        Gera PEI completo baseado nas respostas dos profissionais
-        """
-        
+        responses: List[ProfessionalResponse],
+        structured: Optional[bool] = None
+    ) -> str:
+        structured = _structured(structured)
+        serialize = compact if structured else pretty
         # Preparar contexto das respostas
         responses_text = "\n\n".join([
             f"=== {r.professional_type.upper()} - {r.professional_name} ===\n"
             f"Timestamp: {r.timestamp}\n"
-            f"Respostas:\n{pretty(r.responses)}"
+            f"{PEIGeneratorAgent.response_body(r, serialize)}"
             for r in responses
         ])
         
@@ -278,11 +708,143 @@ class PEIGeneratorAgent:
            - Convergência entre profissionais (30%)
            - Especificidade das informações (30%)
         
-        {PEIGeneratorAgent.SCHEMA}
+        {PEIGeneratorAgent.SCHEMA_HINT if structured else PEIGeneratorAgent.SCHEMA}
         """
+        return _compact_prompt(prompt) if structured else prompt
+    
+    @staticmethod
+    def build_context(student: StudentInfo, responses: List[ProfessionalResponse]) -> str:
+        """Contexto comum de todas as seções: aluno + respostas, montado uma vez por geração"""
+        responses_text = "\n\n".join(
+            f"=== {r.professional_type.upper()} - {r.professional_name} ===\n{PEIGeneratorAgent.response_body(r, compact)}"
+            for r in responses
+        )
+        context = f"""
+        Você vai gerar UMA SEÇÃO do Plano Educacional Individualizado (PEI) do aluno abaixo,
+        a partir das respostas de {len(responses)} profissionais. As demais seções são geradas à parte.
         
-        result = llm_json(prompt, system=PEIGeneratorAgent.SYSTEM_INSTRUCTION)
+        === INFORMAÇÕES DO ALUNO ===
+        Nome: {student.name}
+        Data de Nascimento: {student.birth_date}
+        Série: {student.grade}
+        Necessidades Especiais: {', '.join(student.special_needs)}
+        Possui Laudo: {'Sim' if student.has_diagnosis else 'Não'}
+        
+        === RESPOSTAS DOS PROFISSIONAIS ===
+        {responses_text}
         
+        === INSTRUÇÕES ===
+        Identifique padrões e convergências nas respostas; base as recomendações na LBI
+        (Lei 13.146/2015); use linguagem clara para educadores; seja específico e prático;
+        cite a fonte (profissional) das informações.
+        """
+        return _compact_prompt(context)
+    
+    @staticmethod
+    def build_section_prompt(context: str, section: PEISection, structured: Optional[bool] = None) -> str:
+        # Resumo primeiro: o prefixo é o mesmo em todas as chamadas da geração
+        if _structured(structured):
+            schema_hint = PEIGeneratorAgent.SCHEMA_HINT
+        else:
+            schema_hint = inline_schema_hint(section.schema)
+        return f"{context}\n\n=== SEÇÃO: {section.name} ===\n{section.task}\n{schema_hint}"
+    
+    @staticmethod
+    def section_events(section: PEISection, result: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        if section.name.startswith("detailed_report."):
+            return [(section.name, result)]
+        return [(name, value) for name, value in result.items() if name != "sources"]
+    
+    @staticmethod
+    def section_key(section: PEISection) -> str:
+        # Mudou a tarefa ou o schema da seção: o resultado antigo não vale mais
+        return _sha256(f"{section.task}\0{schema_fingerprint(section.schema)}")
+    
+    @staticmethod
+    def cited(sources: List[str], responses: List[ProfessionalResponse]) -> Optional[List[str]]:
+        """professional_ids named in `sources`; None (depends on every response) when none is recognized"""
+        text = "\n".join(sources).casefold()
+        ids = sorted(r.professional_id for r in responses if r.professional_name.casefold() in text)
+        return ids or None
+    
+    @staticmethod
+    def reusable_sections(
+        previous: Optional[Dict[str, Any]],
+        student: StudentInfo,
+        responses: List[ProfessionalResponse]
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Seções da última geração que podem ser reaproveitadas: nenhuma resposta
+        citada em sources mudou. Resposta nova ou dados do aluno alterados
+        regeneram tudo; seção sem fonte reconhecida (e a revisão) sempre é regenerada.
+        """
+        if not previous or previous.get("context") != _sha256(compact(asdict(student))):
+            return {}
+        old = previous.get("responses", {})
+        new = {r.professional_id: response_fingerprint(r) for r in responses}
+        if set(new) - set(old):
+            return {}  # informação nova pode entrar em qualquer seção
+        changed = {professional_id for professional_id, fingerprint in old.items() if new.get(professional_id) != fingerprint}
+        reused = {}
+        for section in PEIGeneratorAgent.SECTIONS:
+            state = previous.get("sections", {}).get(section.name)
+            if (
+                state
+                and state.get("prompt") == PEIGeneratorAgent.section_key(section)
+                and state.get("depends_on") is not None
+                and not changed.intersection(state["depends_on"])
+            ):
+                reused[section.name] = state["result"]
+        return reused
+    
+    @staticmethod
+    def section_state(
+        student: StudentInfo,
+        responses: List[ProfessionalResponse],
+        results: Dict[str, Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """O que a próxima geração precisa para saber o que reaproveitar (PEIDocument.sections)"""
+        return {
+            "context": _sha256(compact(asdict(student))),
+            "responses": {r.professional_id: response_fingerprint(r) for r in responses},
+            "sections": {
+                section.name: {
+                    "prompt": PEIGeneratorAgent.section_key(section),
+                    "depends_on": PEIGeneratorAgent.cited(results[section.name].get("sources", []), responses),
+                    "result": results[section.name],
+                }
+                for section in PEIGeneratorAgent.SECTIONS
+            },
+        }
+    
+    @staticmethod
+    def finish_sections(
+        student: StudentInfo,
+        responses: List[ProfessionalResponse],
+        results: Dict[str, Dict[str, Any]]
+    ) -> PEIDocument:
+        document = PEIGeneratorAgent.to_document(PEIGeneratorAgent.assemble(results))
+        document.sections = PEIGeneratorAgent.section_state(student, responses, results)
+        return document
+    
+    @staticmethod
+    def assemble(results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Junta as seções no formato do PEIOutput (o mesmo da geração numa chamada só)"""
+        parts = {part: results[f"detailed_report.{part}"] for part in PEIGeneratorAgent.REPORT_PARTS}
+        assembled: Dict[str, Any] = {
+            "detailed_report": {
+                **{part: value.get("text", "") for part, value in parts.items()},
+                "sources": {part: value.get("sources", []) for part, value in parts.items()},
+            }
+        }
+        for name, value in results.items():
+            if not name.startswith("detailed_report."):
+                assembled.update({key: item for key, item in value.items() if key != "sources"})
+        validate_output(PEIOutput, assembled)
+        return assembled
+    
+    @staticmethod
+    def to_document(result: Dict[str, Any]) -> PEIDocument:
         return PEIDocument(
             student_identification=result["student_identification"],
             detailed_report=result["detailed_report"],
@@ -293,13 +855,304 @@ class PEIGeneratorAgent:
             assistive_resources=result["assistive_resources"],
             evaluation_criteria=result["evaluation_criteria"],
             confidence_score=result["confidence_score"],
-            generated_at=datetime.now().isoformat()
+            generated_at=datetime.now().isoformat(),
+            warnings=result.get("warnings", []),
+            suggestions=result.get("suggestions", [])
         )
+    
+    @staticmethod
+    def run(
+        student: StudentInfo,
+        responses: List[ProfessionalResponse],
+        use_cache: bool = True,
+        previous: Optional[Dict[str, Any]] = None
+    ) -> PEIDocument:
+        """
+        Gera PEI completo baseado nas respostas dos profissionais
+        (PEI_GENERATION_MODE=sectioned: uma chamada por seção, em paralelo;
+        com `previous`, o PEIDocument.sections da última geração, só as seções
+        afetadas pelas respostas alteradas são geradas de novo)
+        """
+        if PEI_GENERATION_MODE == "sectioned":
+            context = PEIGeneratorAgent.build_context(student, responses)
+            reused = PEIGeneratorAgent.reusable_sections(previous, student, responses)
+            if reused:
+                print(f"♻️ {len(reused)}/{len(PEIGeneratorAgent.SECTIONS)} seções reaproveitadas da última geração")
+            
+            def generate(section: PEISection) -> Tuple[str, Dict[str, Any]]:
+                if section.name in reused:
+                    return section.name, reused[section.name]
+                return section.name, llm_json(
+                    PEIGeneratorAgent.build_section_prompt(context, section),
+                    system=PEIGeneratorAgent.SYSTEM_INSTRUCTION,
+                    use_cache=use_cache,
+                    response_schema=section.schema,
+                )
+            
+            sections = PEIGeneratorAgent.SECTIONS
+            limit = LLM_AGENT_CONCURRENCY.get("pei_section", LLM_MAX_CONCURRENCY)
+            with ThreadPoolExecutor(max_workers=min(len(sections), limit)) as pool:
+                results = dict(pool.map(generate, sections))
+            return PEIGeneratorAgent.finish_sections(student, responses, results)
+        
+        prompt = PEIGeneratorAgent.build_prompt(student, responses)
+        result = llm_json(
+            prompt,
+            system=PEIGeneratorAgent.SYSTEM_INSTRUCTION,
+            use_cache=use_cache,
+            response_schema=PEIOutput,
+            legacy_prompt_chars=_legacy_prompt_chars(PEIGeneratorAgent.build_prompt, student, responses),
+        )
+        return PEIGeneratorAgent.to_document(result)
+    
+    @staticmethod
+    async def run_async(
+        student: StudentInfo,
+        responses: List[ProfessionalResponse],
+        use_cache: bool = True,
+        on_section: Optional[SectionCallback] = None,
+        previous: Optional[Dict[str, Any]] = None
+    ) -> PEIDocument:
+        """
+        Versão assíncrona de run (não bloqueia thread durante a geração).
+        on_section recebe cada seção do PEI assim que ela é gerada.
+        
+        No modo por seções as chamadas saem juntas (semáforo 'pei_section') e o
+        tempo total fica perto do da seção mais lenta; cada seção vai para
+        on_section quando a sua chamada termina. Seções reaproveitadas de
+        `previous` vão para on_section na hora.
+        """
+        if PEI_GENERATION_MODE == "sectioned":
+            context = PEIGeneratorAgent.build_context(student, responses)
+            reused = PEIGeneratorAgent.reusable_sections(previous, student, responses)
+            if reused:
+                print(f"♻️ {len(reused)}/{len(PEIGeneratorAgent.SECTIONS)} seções reaproveitadas da última geração")
+            
+            async def generate(section: PEISection) -> Tuple[str, Dict[str, Any]]:
+                if section.name in reused:
+                    result = reused[section.name]
+                else:
+                    result = await llm_json_async(
+                        PEIGeneratorAgent.build_section_prompt(context, section),
+                        system=PEIGeneratorAgent.SYSTEM_INSTRUCTION,
+                        agent="pei_section",
+                        use_cache=use_cache,
+                        response_schema=section.schema,
+                    )
+                if on_section is not None:
+                    for name, value in PEIGeneratorAgent.section_events(section, result):
+                        await on_section(name, value)
+                return section.name, result
+            
+            results = dict(await asyncio.gather(*(generate(section) for section in PEIGeneratorAgent.SECTIONS)))
+            return PEIGeneratorAgent.finish_sections(student, responses, results)
+        
+        prompt = PEIGeneratorAgent.build_prompt(student, responses)
+        result = await llm_json_async(
+            prompt,
+            system=PEIGeneratorAgent.SYSTEM_INSTRUCTION,
+            agent="pei_generator",
+            use_cache=use_cache,
+            on_section=on_section,
+            response_schema=PEIOutput,
+            legacy_prompt_chars=_legacy_prompt_chars(PEIGeneratorAgent.build_prompt, student, responses),
+        )
+        return PEIGeneratorAgent.to_document(result)
+
+# =====================================================
+# Divisão de materiais longos (map-reduce)
+# =====================================================
+
+# Acima disso o material é adaptado em partes, em paralelo (~3k tokens por parte)
+MATERIAL_CHUNK_CHARS = int(os.getenv("MATERIAL_CHUNK_CHARS", "12000"))
+MATERIAL_MAX_CHUNKS = int(os.getenv("MATERIAL_MAX_CHUNKS", "16"))
+
+_HEADING = re.compile(
+    r"^\s*(cap[ií]tulo|unidade|m[óo]dulo|se[çc][ãa]o|aula|parte|t[óo]pico)\b|^\s*\d+(\.\d+)*[.)]?\s+\S",
+    re.IGNORECASE,
+)
+
+
+def _is_heading(paragraph: str) -> bool:
+    first_line = paragraph.strip().split("\n", 1)[0]
+    return len(first_line) <= 80 and bool(_HEADING.match(first_line) or (first_line.isupper() and len(first_line) > 3))
+
+
+def _split_long(paragraph: str, max_chars: int) -> List[str]:
+    """Break a paragraph bigger than max_chars at line, then sentence boundaries"""
+    pieces: List[str] = []
+    current = ""
+    for unit in re.split(r"(?<=\n)|(?<=[.!?])\s+", paragraph):
+        while len(unit) > max_chars:
+            pieces.append(unit[:max_chars])
+            unit = unit[max_chars:]
+        if current and len(current) + len(unit) + 1 > max_chars:
+            pieces.append(current.strip())
+            current = ""
+        current += unit if current.endswith("\n") or not current else " " + unit
+    if current.strip():
+        pieces.append(current.strip())
+    return pieces
+
+
+def split_material_text(text: str, max_chars: int = MATERIAL_CHUNK_CHARS, max_chunks: int = MATERIAL_MAX_CHUNKS) -> List[str]:
+    """
+    Divide o texto extraído em partes de até ~max_chars, respeitando parágrafos
+    e, quando possível, começando cada parte num título de seção/capítulo.
+    """
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text]
+    # Não passar de max_chunks chamadas: partes maiores em apostilas enormes
+    max_chars = max(max_chars, -(-len(text) // max_chunks))
+    chunks = _pack_paragraphs(text, max_chars)
+    while len(chunks) > max_chunks:
+        max_chars = int(max_chars * 1.25)
+        chunks = _pack_paragraphs(text, max_chars)
+    return chunks
+
+
+def _pack_paragraphs(text: str, max_chars: int) -> List[str]:
+    paragraphs: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        if paragraph.strip():
+            paragraphs.extend(_split_long(paragraph.strip(), max_chars) if len(paragraph) > max_chars else [paragraph.strip()])
+    
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for paragraph in paragraphs:
+        # Começa parte nova num título se a atual já passou da metade
+        at_heading = _is_heading(paragraph) and size >= max_chars // 2
+        if current and (size + len(paragraph) + 2 > max_chars or at_heading):
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _unique(items: List[Any]) -> List[Any]:
+    seen, result = set(), []
+    for item in items:
+        key = json.dumps(item, ensure_ascii=False, sort_keys=True) if not isinstance(item, str) else item.strip().lower()
+        if key not in seen:
+            seen.add(key)
+            result.append(item)
+    return result
 
 # =====================================================
 # AGENTE 2: Material Adapter
 # =====================================================
 
+class MaterialAnalysisAgent:
+    """
+    Etapa 1 da adaptação: análise do material (tipo de conteúdo, complexidade,
+    conceitos, objetivos), que depende só do texto. Fica guardada pelo hash do
+    conteúdo: alunos que recebem o mesmo material dividem uma única chamada,
+    mesmo quando pedem ao mesmo tempo.
+    """
+    
+    SYSTEM_INSTRUCTION = textwrap.dedent("""
+    Você é um especialista em análise de materiais didáticos da educação básica
+    brasileira. Você classifica o conteúdo e identifica conceitos e objetivos
+    de aprendizagem, sem adaptar o material.
+    """)
+    
+    _lock = threading.Lock()
+    _flights: "OrderedDict[str, Future]" = OrderedDict()  # hash -> análise (pronta ou em andamento)
+    _stats = {"generated": 0, "reused": 0}
+    
+    @staticmethod
+    def key(text: str, material_metadata: Dict[str, Any]) -> str:
+        return _sha256(compact([material_metadata.get("subject"), material_metadata.get("grade"), text]))
+    
+    @staticmethod
+    def build_prompt(text: str, material_metadata: Dict[str, Any], structured: Optional[bool] = None) -> str:
+        if _structured(structured):
+            schema_hint = "Responda no formato JSON do schema de resposta."
+        else:
+            schema_hint = inline_schema_hint(OriginalAnalysis)
+        prompt = f"""
+        Analise o material didático abaixo.
+        Disciplina: {material_metadata.get('subject', 'Não especificada')}
+        Série: {material_metadata.get('grade', 'Não especificada')}
+        
+        Conteúdo:
+        {text}
+        
+        {schema_hint}
+        """
+        return _compact_prompt(prompt)
+    
+    @staticmethod
+    def _claim(key: str) -> Tuple[Future, bool]:
+        """Future of the analysis for `key` and whether the caller must produce it"""
+        with MaterialAnalysisAgent._lock:
+            flights = MaterialAnalysisAgent._flights
+            if key in flights:
+                flights.move_to_end(key)
+                MaterialAnalysisAgent._stats["reused"] += 1
+                return flights[key], False
+            future: Future = Future()
+            flights[key] = future
+            MaterialAnalysisAgent._stats["generated"] += 1
+            while len(flights) > MATERIAL_ANALYSIS_MEMORY:
+                flights.popitem(last=False)
+            return future, True
+    
+    @staticmethod
+    def _fail(key: str, future: Future, error: BaseException):
+        # Falhou: a próxima tentativa chama o LLM de novo
+        with MaterialAnalysisAgent._lock:
+            if MaterialAnalysisAgent._flights.get(key) is future:
+                del MaterialAnalysisAgent._flights[key]
+        future.set_exception(error)
+    
+    @staticmethod
+    def analyze(text: str, material_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        key = MaterialAnalysisAgent.key(text, material_metadata)
+        future, owner = MaterialAnalysisAgent._claim(key)
+        if not owner:
+            return future.result()
+        try:
+            # Sempre pelo llm_cache (mesmo em regeneração forçada): o texto é o mesmo
+            future.set_result(llm_json(
+                MaterialAnalysisAgent.build_prompt(text, material_metadata),
+                system=MaterialAnalysisAgent.SYSTEM_INSTRUCTION,
+                response_schema=OriginalAnalysis,
+            ))
+        except BaseException as e:
+            MaterialAnalysisAgent._fail(key, future, e)
+            raise
+        return future.result()
+    
+    @staticmethod
+    async def analyze_async(text: str, material_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        key = MaterialAnalysisAgent.key(text, material_metadata)
+        future, owner = MaterialAnalysisAgent._claim(key)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            future.set_result(await llm_json_async(
+                MaterialAnalysisAgent.build_prompt(text, material_metadata),
+                system=MaterialAnalysisAgent.SYSTEM_INSTRUCTION,
+                agent="material_analysis",
+                response_schema=OriginalAnalysis,
+            ))
+        except BaseException as e:
+            MaterialAnalysisAgent._fail(key, future, e)
+            raise
+        return future.result()
+    
+    @staticmethod
+    def stats() -> Dict[str, int]:
+        with MaterialAnalysisAgent._lock:
+            return {**MaterialAnalysisAgent._stats, "cached": len(MaterialAnalysisAgent._flights)}
+
+
 class MaterialAdapterAgent:
     """
     Agente responsável por adaptar materiais didáticos baseado no PEI
@@ -388,16 +1241,33 @@ class MaterialAdapterAgent:
     }
     """)
     
+    # Blocos e atividades chegam um a um no streaming (adapted_content_structure só fecha no fim)
+    STREAMED_ITEMS = (
+        ("adapted_content_structure", "blocks"),
+        ("adapted_content_structure", "practice_activities"),
+    )
+    
+    SCHEMA_HINT = "Responda no formato JSON do schema de resposta, sem emojis ou markdown, apenas texto corrido puro."
+    
     @staticmethod
-    def run(
+    def build_prompt(
         original_material_text: str,
         material_metadata: Dict[str, Any],
-        pei_document: PEIDocument
-    ) -> Dict[str, Any]:
-        """
-        Adapta material didático baseado no PEI do aluno
-        """
-        
+        pei_document: PEIDocument,
+        part: Optional[Tuple[int, int]] = None,
+        structured: Optional[bool] = None,
+        analysis: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """analysis: original_analysis pronta (MaterialAnalysisAgent); a resposta fica sem ela"""
+        structured = _structured(structured)
+        if analysis is None:
+            schema_hint = MaterialAdapterAgent.SCHEMA_HINT if structured else MaterialAdapterAgent.SCHEMA
+            analysis_text = ""
+        else:
+            schema_hint = MaterialAdapterAgent.SCHEMA_HINT if structured else inline_schema_hint(
+                MaterialPersonalizationOutput, ", sem emojis ou markdown, apenas texto corrido puro"
+            )
+            analysis_text = f"=== ANÁLISE DO MATERIAL (já feita, não repita) ===\n        {compact(analysis)}\n\n        "
         # Extrair informações relevantes do PEI
         pei_summary = {
             "special_needs": pei_document.student_identification["special_needs"],
@@ -416,11 +1286,11 @@ class MaterialAdapterAgent:
         Disciplina: {material_metadata.get('subject', 'Não especificada')}
         Série: {material_metadata.get('grade', 'Não especificada')}
         
-        Conteúdo:
+        {MaterialAdapterAgent._part_note(part)}Conteúdo:
         {original_material_text}
         
-        === RESUMO DO PEI DO ALUNO ===
-        {pretty(pei_summary)}
+        {analysis_text}=== RESUMO DO PEI DO ALUNO ===
+        {compact(pei_summary) if structured else pretty(pei_summary)}
         
         === DIRETRIZES DE ADAPTAÇÃO ===
         1. VISUAL: Transformar conceitos abstratos em representações visuais
@@ -440,17 +1310,191 @@ class MaterialAdapterAgent:
         - Blocos longos → Segmentos curtos com pausas
         - Apenas teoria → Teoria + prática integrada
         
-        {MaterialAdapterAgent.SCHEMA}
+        {schema_hint}
         """
+        return _compact_prompt(prompt) if structured else prompt
+    
+    @staticmethod
+    def _part_note(part: Optional[Tuple[int, int]]) -> str:
+        if part is None:
+            return ""
+        index, total = part
+        return (
+            f"ATENÇÃO: este é o trecho {index} de {total} de um material longo; os outros trechos "
+            f"são adaptados separadamente. Adapte APENAS este trecho, sem resumir os demais.\n\n        "
+        )
+    
+    @staticmethod
+    def merge_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Reduce: junta as adaptações de cada trecho num único resultado no SCHEMA
+        (blocos e atividades em ordem e renumerados, listas sem repetição)
+        """
+        if len(results) == 1:
+            return results[0]
+        
+        def collect(getter) -> List[Any]:
+            items: List[Any] = []
+            for result in results:
+                value = getter(result)
+                items.extend(value if isinstance(value, list) else [value] if value else [])
+            return items
+        
+        analyses = [r.get("original_analysis") or {} for r in results]
+        content_types = _unique([a.get("content_type") for a in analyses if a.get("content_type")])
+        complexity_order = ["baixo", "médio", "alto"]
+        complexities = [a.get("complexity_level") for a in analyses if a.get("complexity_level") in complexity_order]
+        structures = [r.get("adapted_content_structure") or {} for r in results]
+        
+        blocks = collect(lambda r: (r.get("adapted_content_structure") or {}).get("blocks"))
+        for number, block in enumerate(blocks, start=1):
+            if isinstance(block, dict):
+                block["block_number"] = number
         
-        result = llm_json(prompt, system=MaterialAdapterAgent.SYSTEM_INSTRUCTION)
+        scores = [r.get("pei_compatibility_score") for r in results if isinstance(r.get("pei_compatibility_score"), (int, float))]
+        compatibility_keys = _unique([key for r in results for key in (r.get("compatibility_analysis") or {})])
         
+        return {
+            "original_analysis": {
+                "content_type": content_types[0] if len(content_types) == 1 else "misto",
+                "complexity_level": max(complexities, key=complexity_order.index) if complexities else "",
+                "main_concepts": _unique(collect(lambda r: (r.get("original_analysis") or {}).get("main_concepts"))),
+                "learning_objectives": _unique(collect(lambda r: (r.get("original_analysis") or {}).get("learning_objectives"))),
+                "estimated_time": sum(a.get("estimated_time") or 0 for a in analyses if isinstance(a.get("estimated_time"), (int, float))),
+            },
+            "adaptations_applied": _unique(collect(lambda r: r.get("adaptations_applied"))),
+            "adapted_content_structure": {
+                "title": structures[0].get("title", ""),
+                "introduction": structures[0].get("introduction", {}),
+                "blocks": blocks,
+                "practice_activities": collect(lambda r: (r.get("adapted_content_structure") or {}).get("practice_activities")),
+                "summary": "\n\n".join(_unique([st.get("summary") for st in structures if st.get("summary")])),
+                "evaluation_suggestion": "\n\n".join(_unique([st.get("evaluation_suggestion") for st in structures if st.get("evaluation_suggestion")])),
+            },
+            "pei_compatibility_score": round(sum(scores) / len(scores)) if scores else 0,
+            "compatibility_analysis": {
+                key: _unique(collect(lambda r, key=key: (r.get("compatibility_analysis") or {}).get(key)))
+                for key in compatibility_keys
+            },
+            "teacher_notes": _unique(collect(lambda r: r.get("teacher_notes"))),
+            "warnings": _unique(collect(lambda r: r.get("warnings"))),
+        }
+    
+    @staticmethod
+    def to_result(material_metadata: Dict[str, Any], result: Dict[str, Any], chunks: int = 1) -> Dict[str, Any]:
         return {
             "status": "success",
             "original_metadata": material_metadata,
             "adaptation_result": result,
+            "chunks": chunks,
             "generated_at": datetime.now().isoformat()
         }
+    
+    @staticmethod
+    def run(
+        original_material_text: str,
+        material_metadata: Dict[str, Any],
+        pei_document: PEIDocument,
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Adapta material didático baseado no PEI do aluno
+        (materiais longos: um trecho por chamada, em paralelo, depois merge_results;
+        MATERIAL_ADAPTATION_MODE=staged: análise compartilhada + personalização)
+        """
+        chunks = split_material_text(original_material_text)
+        
+        def adapt(index: int, chunk: str) -> Dict[str, Any]:
+            args = (chunk, material_metadata, pei_document)
+            part = (index, len(chunks)) if len(chunks) > 1 else None
+            if MATERIAL_ADAPTATION_MODE == "staged":
+                analysis = MaterialAnalysisAgent.analyze(chunk, material_metadata)
+                personalization = llm_json(
+                    MaterialAdapterAgent.build_prompt(*args, part=part, analysis=analysis),
+                    system=MaterialAdapterAgent.SYSTEM_INSTRUCTION,
+                    use_cache=use_cache,
+                    response_schema=MaterialPersonalizationOutput,
+                    legacy_prompt_chars=_legacy_prompt_chars(MaterialAdapterAgent.build_prompt, *args, part=part),
+                )
+                return {"original_analysis": analysis, **personalization}
+            return llm_json(
+                MaterialAdapterAgent.build_prompt(*args, part=part),
+                system=MaterialAdapterAgent.SYSTEM_INSTRUCTION,
+                use_cache=use_cache,
+                response_schema=MaterialAdaptationOutput,
+                legacy_prompt_chars=_legacy_prompt_chars(MaterialAdapterAgent.build_prompt, *args, part=part),
+            )
+        
+        if len(chunks) == 1:
+            results = [adapt(1, chunks[0])]
+        else:
+            limit = LLM_AGENT_CONCURRENCY.get("material_adapter", LLM_MAX_CONCURRENCY)
+            with ThreadPoolExecutor(max_workers=min(len(chunks), limit)) as pool:
+                results = list(pool.map(adapt, range(1, len(chunks) + 1), chunks))
+        return MaterialAdapterAgent.to_result(material_metadata, MaterialAdapterAgent.merge_results(results), len(chunks))
+    
+    @staticmethod
+    async def run_async(
+        original_material_text: str,
+        material_metadata: Dict[str, Any],
+        pei_document: PEIDocument,
+        use_cache: bool = True,
+        on_section: Optional[SectionCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Versão assíncrona de run (não bloqueia thread durante a geração).
+        on_section recebe cada seção e cada bloco do material adaptado assim que é gerado.
+        
+        Materiais longos: os trechos são adaptados em paralelo (limitados pelo
+        semáforo do agente). Durante a geração saem só os blocos/atividades de cada
+        trecho ('parts[i].adapted_content_structure.blocks[j]'); as seções completas
+        são entregues depois do merge.
+        
+        No modo staged cada trecho espera a sua análise (compartilhada entre os
+        alunos) e só a personalização é gerada para este aluno.
+        """
+        chunks = split_material_text(original_material_text)
+        
+        async def adapt(index: int, chunk: str) -> Dict[str, Any]:
+            args = (chunk, material_metadata, pei_document)
+            part = (index, len(chunks)) if len(chunks) > 1 else None
+            callback = on_section
+            if on_section is not None and part is not None:
+                async def callback(name: str, value: Any):
+                    if "[" in name:  # itens de blocks/practice_activities
+                        await on_section(f"parts[{index}].{name}", value)
+            if MATERIAL_ADAPTATION_MODE == "staged":
+                analysis = await MaterialAnalysisAgent.analyze_async(chunk, material_metadata)
+                if on_section is not None and part is None:
+                    await on_section("original_analysis", analysis)
+                personalization = await llm_json_async(
+                    MaterialAdapterAgent.build_prompt(*args, part=part, analysis=analysis),
+                    system=MaterialAdapterAgent.SYSTEM_INSTRUCTION,
+                    agent="material_adapter",
+                    use_cache=use_cache,
+                    on_section=callback,
+                    item_paths=MaterialAdapterAgent.STREAMED_ITEMS,
+                    response_schema=MaterialPersonalizationOutput,
+                    legacy_prompt_chars=_legacy_prompt_chars(MaterialAdapterAgent.build_prompt, *args, part=part),
+                )
+                return {"original_analysis": analysis, **personalization}
+            return await llm_json_async(
+                MaterialAdapterAgent.build_prompt(*args, part=part),
+                system=MaterialAdapterAgent.SYSTEM_INSTRUCTION,
+                agent="material_adapter",
+                use_cache=use_cache,
+                on_section=callback,
+                item_paths=MaterialAdapterAgent.STREAMED_ITEMS,
+                response_schema=MaterialAdaptationOutput,
+                legacy_prompt_chars=_legacy_prompt_chars(MaterialAdapterAgent.build_prompt, *args, part=part),
+            )
+        
+        results = await asyncio.gather(*(adapt(i, chunk) for i, chunk in enumerate(chunks, start=1)))
+        result = MaterialAdapterAgent.merge_results(list(results))
+        if on_section is not None and len(chunks) > 1:
+            for name, value in result.items():
+                await on_section(name, value)
+        return MaterialAdapterAgent.to_result(material_metadata, result, len(chunks))
 
 # =====================================================
 # AGENTE 3: Workflow Orchestrator
@@ -584,30 +1628,23 @@ class PEAIOrchestrator:
     """
     
     @staticmethod
-    def generate_pei(
-        student: StudentInfo,
-        professional_responses: List[ProfessionalResponse]
-    ) -> Dict[str, Any]:
-        """
-        Fluxo completo: coleta de respostas → geração de PEI
-        """
-        
+    def _completion_status(professional_responses: List[ProfessionalResponse]) -> Dict[str, Any]:
         # Verificar se todas as respostas foram coletadas
-        status = WorkflowOrchestratorAgent.check_completion_status(
+        return WorkflowOrchestratorAgent.check_completion_status(
             total_professionals=len(professional_responses),
             responses_received=professional_responses
         )
-        
-        if not status["is_complete"]:
-            return {
-                "status": "incomplete",
-                "message": "Nem todos os profissionais responderam ainda",
-                "completion_status": status
-            }
-        
-        # Gerar PEI com o agente
-        pei_document = PEIGeneratorAgent.run(student, professional_responses)
-        
+    
+    @staticmethod
+    def _incomplete(status: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "status": "incomplete",
+            "message": "Nem todos os profissionais responderam ainda",
+            "completion_status": status
+        }
+    
+    @staticmethod
+    def _pei_result(pei_document: PEIDocument, status: Dict[str, Any]) -> Dict[str, Any]:
         return {
             "status": "success",
             "pei_document": {
@@ -620,16 +1657,59 @@ class PEAIOrchestrator:
                 "assistive_resources": pei_document.assistive_resources,
                 "evaluation_criteria": pei_document.evaluation_criteria,
                 "confidence_score": pei_document.confidence_score,
-                "generated_at": pei_document.generated_at
+                "generated_at": pei_document.generated_at,
+                "sections": pei_document.sections,
+                "warnings": pei_document.warnings,
+                "suggestions": pei_document.suggestions
             },
             "completion_status": status
         }
     
+    @staticmethod
+    def generate_pei(
+        student: StudentInfo,
+        professional_responses: List[ProfessionalResponse],
+        use_cache: bool = True,
+        previous: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Fluxo completo: coleta de respostas → geração de PEI
+        (previous: "sections" do resultado anterior, para regenerar só o que mudou)
+        """
+        status = PEAIOrchestrator._completion_status(professional_responses)
+        if not status["is_complete"]:
+            return PEAIOrchestrator._incomplete(status)
+        
+        # Gerar PEI com o agente
+        pei_document = PEIGeneratorAgent.run(student, professional_responses, use_cache=use_cache, previous=previous)
+        return PEAIOrchestrator._pei_result(pei_document, status)
+    
+    @staticmethod
+    async def generate_pei_async(
+        student: StudentInfo,
+        professional_responses: List[ProfessionalResponse],
+        use_cache: bool = True,
+        on_section: Optional[SectionCallback] = None,
+        previous: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Versão assíncrona de generate_pei
+        """
+        status = PEAIOrchestrator._completion_status(professional_responses)
+        if not status["is_complete"]:
+            return PEAIOrchestrator._incomplete(status)
+        
+        pei_document = await PEIGeneratorAgent.run_async(
+            student, professional_responses, use_cache=use_cache, on_section=on_section, previous=previous
+        )
+        return PEAIOrchestrator._pei_result(pei_document, status)
+    
     @staticmethod
     def adapt_material(
         material_text: str,
         material_metadata: Dict[str, Any],
-        pei_document: PEIDocument
+        pei_document: PEIDocument,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         Fluxo: material original → material adaptado
@@ -638,10 +1718,59 @@ class PEAIOrchestrator:
         adaptation = MaterialAdapterAgent.run(
             material_text,
             material_metadata,
-            pei_document
+            pei_document,
+            use_cache=use_cache
         )
         
         return adaptation
+    
+    @staticmethod
+    async def adapt_material_async(
+        material_text: str,
+        material_metadata: Dict[str, Any],
+        pei_document: PEIDocument,
+        use_cache: bool = True,
+        on_section: Optional[SectionCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Versão assíncrona de adapt_material
+        """
+        return await MaterialAdapterAgent.run_async(
+            material_text,
+            material_metadata,
+            pei_document,
+            use_cache=use_cache,
+            on_section=on_section
+        )
+
+# Formato de resposta de cada agente, para o provider fake quando a chamada
+# não leva response_schema (LLM_STRUCTURED_OUTPUT=0)
+AGENT_SCHEMAS = {
+    PEIGeneratorAgent.SYSTEM_INSTRUCTION: PEIOutput,
+    MaterialAdapterAgent.SYSTEM_INSTRUCTION: MaterialAdaptationOutput,
+    ResponseDigestAgent.SYSTEM_INSTRUCTION: ResponseDigestOutput,
+    MaterialAnalysisAgent.SYSTEM_INSTRUCTION: OriginalAnalysis,
+}
+
+llm_provider = create_provider(schemas=AGENT_SCHEMAS)
+
+
+def warm_models() -> bool:
+    """
+    Prepara os modelos dos agentes antes do primeiro job.
+    Sem GOOGLE_API_KEY só avisa: a API sobe e os jobs de IA falham com erro claro.
+    """
+    try:
+        llm_provider.warm([
+            PEIGeneratorAgent.SYSTEM_INSTRUCTION,
+            MaterialAdapterAgent.SYSTEM_INSTRUCTION,
+            ResponseDigestAgent.SYSTEM_INSTRUCTION,
+            MaterialAnalysisAgent.SYSTEM_INSTRUCTION,
+        ])
+    except RuntimeError as e:
+        print(f"⚠️ Gemini não configurado: {e}")
+        return False
+    return True
 
 # =====================================================
 # CLI para Testes
@@ -0,0 +1,333 @@
+"""
+Fila durável de jobs de IA (tabela ai_jobs) e pool de workers
+
+Substitui o BackgroundTasks do FastAPI para process_pei_with_ai e
+adapt_material_with_ai: o job é gravado no banco na mesma transação que o
+originou, e um pool de workers (dentro da API ou num processo separado,
+ver ai_worker.py) faz o claim com lease, executa, e marca o resultado.
+O pool roda num event loop: handlers async def esperam o LLM sem prender
+uma thread, então dezenas de gerações cabem em voo num único processo.
+
+- Claim: compare-and-set no status/lease; no PostgreSQL com SKIP LOCKED,
+  então vários processos de worker podem rodar em paralelo.
+- Lease: renovada periodicamente enquanto o job roda; se o processo morrer,
+  a lease vence e outro worker retoma o job.
+- Retries: backoff exponencial com jitter até max_attempts; o handler
+  levanta PermanentJobError para falhar sem novas tentativas.
+- Single-flight: nunca há dois jobs do mesmo tipo rodando para o mesmo alvo.
+"""
+import asyncio
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from database import AIJob
+from db_writer import writer
+
+AI_JOB_LEASE_SECONDS = int(os.getenv("AI_JOB_LEASE_SECONDS", "300"))
+AI_JOB_MAX_ATTEMPTS = int(os.getenv("AI_JOB_MAX_ATTEMPTS", "3"))
+AI_JOB_RETRY_BASE_SECONDS = float(os.getenv("AI_JOB_RETRY_BASE_SECONDS", "30"))
+AI_JOB_RETRY_MAX_SECONDS = float(os.getenv("AI_JOB_RETRY_MAX_SECONDS", "600"))
+AI_JOB_POLL_SECONDS = float(os.getenv("AI_JOB_POLL_SECONDS", "1.0"))
+
+# Acorda os workers deste processo quando um job é enfileirado aqui
+_job_available = threading.Event()
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (e.g. the target row is gone)"""
+
+
+@dataclass
+class JobKind:
+    handler: Callable[[str], Union[None, Awaitable[None]]]  # recebe o target_id (sync ou async def); levanta exceção em caso de falha
+    on_give_up: Optional[Callable[[str, str], None]] = None  # (target_id, erro) após a última tentativa
+
+
+def enqueue(
+    session: Session,
+    kind: str,
+    target_id: str,
+    input_fingerprint: Optional[str] = None,
+    max_attempts: int = AI_JOB_MAX_ATTEMPTS,
+    force: bool = False,
+) -> AIJob:
+    """Add a job inside the caller's transaction (use from a db_writer unit)"""
+    job = AIJob(
+        id=str(uuid.uuid4()),
+        kind=kind,
+        target_id=target_id,
+        input_fingerprint=input_fingerprint,
+        force=force,
+        status='queued',
+        attempts=0,
+        max_attempts=max_attempts,
+        run_after=datetime.utcnow(),
+    )
+    session.add(job)
+    _job_available.set()
+    return job
+
+
+def enqueue_job(kind: str, target_id: str) -> str:
+    """Enqueue through the single writer and return the job id once committed"""
+    return writer.execute(lambda session: enqueue(session, kind, target_id).id)
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with ±20% jitter, capped at AI_JOB_RETRY_MAX_SECONDS"""
+    delay = min(AI_JOB_RETRY_MAX_SECONDS, AI_JOB_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_next(owner: str, kinds: List[str], lease_seconds: int = AI_JOB_LEASE_SECONDS) -> Optional[AIJob]:
+    """Claim the oldest runnable job (queued and due, or running with an expired lease)"""
+    def claim(session: Session) -> Optional[AIJob]:
+        now = datetime.utcnow()
+        runnable = or_(
+            (AIJob.status == 'queued') & (AIJob.run_after <= now),
+            (AIJob.status == 'running') & (AIJob.lease_expires_at < now),
+        )
+        candidates = session.query(AIJob.id, AIJob.status, AIJob.kind, AIJob.target_id).filter(
+            AIJob.kind.in_(kinds), runnable
+        ).order_by(AIJob.run_after, AIJob.id).limit(8).with_for_update(skip_locked=True).all()
+
+        for job_id, status, kind, target_id in candidates:
+            # Single-flight por alvo: espera o job que já está rodando para o mesmo PEI/material
+            busy = session.query(AIJob.id).filter(
+                AIJob.kind == kind,
+                AIJob.target_id == target_id,
+                AIJob.status == 'running',
+                AIJob.lease_expires_at >= now,
+                AIJob.id != job_id,
+            ).first()
+            if busy:
+                continue
+            # Compare-and-set: só um worker (de qualquer processo) vence o claim
+            claimed = session.execute(
+                update(AIJob)
+                .where(AIJob.id == job_id, AIJob.status == status, runnable)
+                .values(
+                    status='running',
+                    attempts=AIJob.attempts + 1,
+                    lease_owner=owner,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    updated_at=now,
+                )
+            ).rowcount
+            if claimed:
+                return session.get(AIJob, job_id, populate_existing=True)
+        return None
+
+    return writer.execute(claim)
+
+
+def renew_leases(owner: str, job_ids: List[str], lease_seconds: int = AI_JOB_LEASE_SECONDS):
+    if not job_ids:
+        return
+
+    def renew(session: Session):
+        session.execute(
+            update(AIJob)
+            .where(AIJob.id.in_(job_ids), AIJob.lease_owner == owner, AIJob.status == 'running')
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        )
+    writer.execute(renew)
+
+
+def finish(job_id: str, owner: str, error: Optional[str] = None, permanent: bool = False) -> Optional[AIJob]:
+    """Mark a job succeeded, or failed/rescheduled. Returns the job if it gave up for good."""
+    def apply(session: Session) -> Optional[AIJob]:
+        job = session.get(AIJob, job_id)
+        if job is None or job.lease_owner != owner or job.status != 'running':
+            return None  # lease perdida: outro worker assumiu o job
+        now = datetime.utcnow()
+        job.lease_owner = None
+        job.lease_expires_at = None
+        if error is None:
+            job.status = 'succeeded'
+            job.last_error = None
+            job.finished_at = now
+            return None
+        job.last_error = error
+        if permanent or job.attempts >= job.max_attempts:
+            job.status = 'failed'
+            job.finished_at = now
+            return job
+        job.status = 'queued'
+        job.run_after = now + timedelta(seconds=retry_delay(job.attempts))
+        return None
+
+    return writer.execute(apply)
+
+
+def recover_abandoned() -> int:
+    """Requeue running jobs whose lease expired (worker died); returns how many"""
+    def apply(session: Session) -> int:
+        now = datetime.utcnow()
+        return session.execute(
+            update(AIJob)
+            .where(AIJob.status == 'running', AIJob.lease_expires_at < now)
+            .values(status='queued', lease_owner=None, lease_expires_at=None, run_after=now)
+        ).rowcount
+
+    recovered = writer.execute(apply)
+    if recovered:
+        _job_available.set()
+    return recovered
+
+
+class JobWorkerPool:
+    """
+    Runs jobs of the registered kinds on one event loop thread.
+
+    Coroutine handlers (async def) await the LLM without holding a thread, so
+    `concurrency` bounds jobs in flight, not threads; plain functions still
+    work and run on the loop's executor. Claims and DB bookkeeping go through
+    the executor too, since they block on the db_writer.
+    """
+
+    def __init__(self, kinds: Dict[str, JobKind], concurrency: int = 2, lease_seconds: int = AI_JOB_LEASE_SECONDS):
+        self.kinds = kinds
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._running: Dict[str, str] = {}  # job_id -> kind
+        self._lock = threading.Lock()
+        self.stats = {"succeeded": 0, "retried": 0, "failed": 0}
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        loop_thread = threading.Thread(target=self._run_loop, name="ai-worker-loop", daemon=True)
+        loop_thread.start()
+        self._threads.append(loop_thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="ai-worker-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        print(f"🤖 AI worker pool started ({self.concurrency} concurrent jobs, owner {self.owner})")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        _job_available.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def running(self) -> int:
+        with self._lock:
+            return len(self._running)
+
+    def _run_loop(self):
+        loop = asyncio.new_event_loop()
+        # Handlers síncronos ocupam uma thread cada; o resto do executor é para claims/escritas
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency + 2, thread_name_prefix="ai-worker"))
+        try:
+            loop.run_until_complete(self._dispatch())
+        finally:
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+
+    async def _dispatch(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        def done(task: asyncio.Task):
+            tasks.discard(task)
+            slots.release()
+
+        while not self._stop.is_set():
+            await slots.acquire()
+            try:
+                job = await asyncio.to_thread(claim_next, self.owner, list(self.kinds), self.lease_seconds)
+            except Exception as e:
+                print(f"⚠️ AI worker could not claim a job: {e}")
+                job = None
+            if job is None:
+                slots.release()
+                await asyncio.to_thread(self._wait_for_jobs)
+                continue
+            task = asyncio.create_task(self._run(job), name=f"ai-job-{job.id}")
+            tasks.add(task)
+            task.add_done_callback(done)
+
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def _wait_for_jobs(self):
+        _job_available.wait(AI_JOB_POLL_SECONDS)
+        _job_available.clear()
+
+    async def _run(self, job: AIJob):
+        kind = self.kinds[job.kind]
+        with self._lock:
+            self._running[job.id] = job.kind
+        print(f"▶️  Job {job.kind} {job.target_id} (attempt {job.attempts}/{job.max_attempts})")
+        error, permanent = None, False
+        try:
+            if asyncio.iscoroutinefunction(kind.handler):
+                await kind.handler(job.target_id)
+            else:
+                await asyncio.to_thread(kind.handler, job.target_id)
+        except PermanentJobError as e:
+            error, permanent = str(e), True
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+
+        try:
+            gave_up = await asyncio.to_thread(finish, job.id, self.owner, error, permanent)
+        except Exception as e:
+            # A lease vence e outro worker (ou o recover na subida) retoma o job
+            print(f"⚠️ Could not record result of job {job.id}: {e}")
+            return
+        outcome = "succeeded" if error is None else ("retried" if gave_up is None else "failed")
+        with self._lock:
+            self.stats[outcome] += 1
+        if outcome == "retried":
+            print(f"🔁 Job {job.kind} {job.target_id} failed, will retry: {error}")
+        elif outcome == "failed":
+            print(f"❌ Job {job.kind} {job.target_id} failed for good: {error}")
+            if kind.on_give_up:
+                await asyncio.to_thread(kind.on_give_up, job.target_id, error)
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            with self._lock:
+                job_ids = list(self._running)
+            try:
+                renew_leases(self.owner, job_ids, self.lease_seconds)
+            except Exception as e:
+                print(f"⚠️ Could not renew AI job leases: {e}")
+
+
+def run_worker_forever(kinds: Dict[str, JobKind], concurrency: int):
+    """Entry point for a dedicated worker process"""
+    recovered = recover_abandoned()
+    if recovered:
+        print(f"♻️  Requeued {recovered} abandoned job(s)")
+    pool = JobWorkerPool(kinds, concurrency=concurrency)
+    pool.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("🛑 Stopping AI workers...")
+        pool.stop()
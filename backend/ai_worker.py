@@ -0,0 +1,33 @@
+"""
+Processo dedicado de workers de IA
+
+Consome a fila ai_jobs (geração de PEI e adaptação de materiais) fora do
+processo da API, então o throughput de IA escala sem afetar a latência dos
+endpoints. Rode a API com AI_WORKERS_IN_API=0 quando usar este processo.
+
+Uso:
+    python ai_worker.py [--workers 16]
+
+--workers é o número de jobs em voo; os handlers são assíncronos, então
+não é preciso uma thread por geração.
+"""
+import argparse
+import os
+
+from ai import warm_models
+from ai_jobs import run_worker_forever
+from database import Base, engine
+from main import AI_JOB_KINDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workers da fila de jobs de IA")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("AI_WORKERS", "16")))
+    args = parser.parse_args()
+    Base.metadata.create_all(bind=engine)  # cria ai_jobs em bancos antigos
+    warm_models()
+    run_worker_forever(AI_JOB_KINDS, concurrency=args.workers)
+
+
+if __name__ == "__main__":
+    main()
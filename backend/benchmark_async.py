@@ -0,0 +1,105 @@
+"""
+Benchmark: consultas lentas em endpoints async travam o event loop?
+
+Sobe um app FastAPI mínimo com um endpoint `async def` que faz uma consulta
+lenta de duas formas - com a sessão síncrona (como get_db) e com a sessão
+async (get_async_db / aiosqlite) - e mede a latência de um endpoint /ping
+enquanto a consulta lenta está em andamento.
+
+Uso:
+    python benchmark_async.py [--slow-rows 3000000] [--pings 20]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from database import create_async_sqlite_engine, create_sqlite_engine
+
+SLOW_QUERY = text("""
+    WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :rows)
+    SELECT COUNT(*) FROM c
+""")
+
+
+def build_app(db_path: str, slow_rows: int) -> FastAPI:
+    SyncSession = sessionmaker(bind=create_sqlite_engine(db_path))
+    AsyncSession = async_sessionmaker(create_async_sqlite_engine(db_path))
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/slow-sync")
+    async def slow_sync():
+        db = SyncSession()
+        try:
+            return {"count": db.execute(SLOW_QUERY, {"rows": slow_rows}).scalar()}
+        finally:
+            db.close()
+
+    @app.get("/slow-async")
+    async def slow_async():
+        async with AsyncSession() as db:
+            return {"count": (await db.execute(SLOW_QUERY, {"rows": slow_rows})).scalar()}
+
+    return app
+
+
+async def measure(app: FastAPI, slow_path: str, pings: int, interval: float = 0.02) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.get("/ping")  # aquece
+        start = time.perf_counter()
+        slow = asyncio.create_task(client.get(slow_path))
+
+        # Um ping a cada `interval`; a latência conta a partir do horário
+        # planejado, então tempo com o event loop travado também entra na conta
+        latencies = []
+        for i in range(pings):
+            planned = start + i * interval
+            await asyncio.sleep(max(0.0, planned - time.perf_counter()))
+            await client.get("/ping")
+            latencies.append((time.perf_counter() - planned) * 1000)
+
+        await slow
+        slow_ms = (time.perf_counter() - start) * 1000
+    return {
+        "slow_ms": slow_ms,
+        "pings": len(latencies),
+        "max_ms": max(latencies),
+        "median_ms": statistics.median(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latência de /ping durante uma consulta lenta")
+    parser.add_argument("--slow-rows", type=int, default=3_000_000)
+    parser.add_argument("--pings", type=int, default=20)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="peai_bench_"), "bench.db")
+    app = build_app(db_path, args.slow_rows)
+
+    print("\n" + "=" * 70)
+    print("⏱️  BENCHMARK ASYNC - latência de /ping durante consulta lenta")
+    print("=" * 70)
+    print(f"{'Sessão':<20} {'Consulta (ms)':>14} {'Ping mediana (ms)':>18} {'Ping máx (ms)':>14}")
+    print("-" * 70)
+    for label, path in (("síncrona (get_db)", "/slow-sync"), ("async (aiosqlite)", "/slow-async")):
+        result = asyncio.run(measure(app, path, args.pings))
+        print(f"{label:<20} {result['slow_ms']:>14.1f} {result['median_ms']:>18.1f} {result['max_ms']:>14.1f}")
+    print("=" * 70 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Preâmbulo comum dos benchmarks de ponta a ponta
+
+Usado por benchmark_pipeline.py, benchmark_material_batch.py e
+benchmark_progressive_pei.py. Chame setup() ANTES de importar main/database:
+ele aponta o banco e o cache do LLM para um diretório temporário (apagado na
+saída), liga o provider fake e desliga os workers da API. Cada benchmark roda
+o seu próprio JobWorkerPool com running_app().
+"""
+import atexit
+import io
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+
+PARAGRAPH = (
+    "A fotossíntese é o processo pelo qual plantas, algas e algumas bactérias convertem energia "
+    "luminosa em energia química. Ocorre nos cloroplastos e produz glicose e oxigênio a partir de "
+    "gás carbônico e água. "
+)
+
+
+def setup(name: str, quota: bool = False) -> str:
+    """Create the temporary workdir (removed at exit), set the env and chdir into it"""
+    workdir = tempfile.mkdtemp(prefix=f"peai_{name}_")
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+    os.environ.setdefault("DATABASE_PATH", os.path.join(workdir, f"{name}.db"))
+    os.environ.setdefault("LLM_CACHE_PATH", os.path.join(workdir, "llm_cache.db"))
+    os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    os.environ.setdefault("GENERATION_SSE_POLL_SECONDS", "0.05")
+    if not quota:
+        # Sem a cota real do Gemini: mede o pipeline, não o limitador
+        os.environ.setdefault("GEMINI_RPM", "1000000")
+        os.environ.setdefault("GEMINI_TPM", "1000000000")
+    os.environ["AI_WORKERS_IN_API"] = "0"  # o pool do benchmark é criado em running_app()
+    os.chdir(workdir)  # adapted_pdfs/ é relativo ao diretório atual
+    return workdir
+
+
+def material_pdf(pages: int, label: str = "") -> bytes:
+    """A text PDF with `pages` pages; a different `label` changes the content (and the hash)"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    for page in range(pages):
+        text = pdf.beginText(40, 800)
+        text.textLine(f"Capítulo {page + 1}: Fotossíntese" + (f" ({label})" if label else ""))
+        for line in range(45):
+            text.textLine(PARAGRAPH[(line * 7) % 60:][:90])
+        pdf.drawText(text)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def seed_peis(prefix: str, count: int, status: str = 'in_collection', professionals: int = 0,
+              responses: int = 0) -> list:
+    """Create `count` students ({prefix}_{i}), each with one PEI (pei_{prefix}_{i}); returns the student ids"""
+    from database import PEI, ProfessionalResponse, SessionLocal, Student
+
+    approved = status == 'concluido'
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        for i in range(count):
+            db.add(Student(id=f"{prefix}_{i}", name=f"Aluno {prefix} {i}", grade="9º Ano",
+                           birth_date="15/03/2010", status='active' if approved else 'resend_form',
+                           hasAccess=approved))
+            db.add(PEI(
+                id=f"pei_{prefix}_{i}",
+                student_id=f"{prefix}_{i}",
+                status=status,
+                special_needs="TEA (Nível 1), TDAH",
+                has_diagnosis='Sim',
+                professionals=json.dumps([
+                    {"id": f"p{j}", "name": f"Profissional {j}", "type": "professor", "phone": ""}
+                    for j in range(professionals)
+                ]) if professionals else None,
+                # PEI aprovado já tem o conteúdo gerado que a adaptação de material usa
+                strengths=json.dumps(["Memória visual", "Interesse por ciências"], ensure_ascii=False) if approved else None,
+                difficulties=json.dumps(["Atenção sustentada"], ensure_ascii=False) if approved else None,
+                created_at=now,
+            ))
+            for j in range(responses):
+                db.add(ProfessionalResponse(
+                    id=f"r_{prefix}_{i}_{j}",
+                    pei_id=f"pei_{prefix}_{i}",
+                    professional_id=f"p{j}",
+                    professional_type='professor',
+                    professional_name=f"Profissional {j}",
+                    responses=json.dumps({
+                        "attention_concentration": f"Aluno {i} mantém foco por 15-20 minutos ({j}).",
+                        "strategies_that_work": "Mapas mentais, exemplos práticos, divisão de tarefas em etapas.",
+                    }, ensure_ascii=False),
+                    submitted_at=now,
+                ))
+        db.commit()
+    finally:
+        db.close()
+    return [f"{prefix}_{i}" for i in range(count)]
+
+
+@contextmanager
+def running_app(workers: int):
+    """API TestClient with a JobWorkerPool of `workers` concurrent jobs running"""
+    from fastapi.testclient import TestClient
+
+    import main
+    from ai_jobs import JobWorkerPool
+
+    pool = JobWorkerPool(main.AI_JOB_KINDS, concurrency=workers)
+    with TestClient(main.app) as client:
+        pool.start()
+        try:
+            yield client
+        finally:
+            pool.stop()
@@ -0,0 +1,220 @@
+"""
+Benchmark: throughput misto de leitura/escrita no SQLite
+
+1. Compara o perfil 'legacy' (sem pragmas) com o perfil 'production'
+   (WAL, busy_timeout, synchronous=NORMAL, mmap, cache).
+2. Compara envios concorrentes de respostas com um commit por request
+   contra o escritor único com group commit (db_writer.DatabaseWriter).
+
+Usa bancos temporários - o backend/students.db nunca é tocado.
+
+Uso:
+    python benchmark_db.py [--seconds 5] [--readers 4] [--writers 2] [--peis 2000] [--submitters 16]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, Student, PEI, ProfessionalResponse, SQLITE_PROFILES, create_sqlite_engine
+from db_writer import DatabaseWriter
+
+
+def seed(session_factory, total_peis: int):
+    db = session_factory()
+    try:
+        students = [
+            Student(id=f"s{i}", name=f"Aluno {i}", status='active', hasAccess=True)
+            for i in range(total_peis)
+        ]
+        peis = [
+            PEI(
+                id=f"pei_{i}",
+                student_id=f"s{i}",
+                status='completed',
+                professionals='[]',
+                cognitive_report="x" * 2000,
+                created_at=datetime.utcnow(),
+            )
+            for i in range(total_peis)
+        ]
+        db.add_all(students)
+        db.add_all(peis)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_profile(profile_name: str, seconds: float, readers: int, writers: int, total_peis: int) -> dict:
+    tmp_dir = tempfile.mkdtemp(prefix="peai_bench_")
+    db_path = os.path.join(tmp_dir, "bench.db")
+    profile = SQLITE_PROFILES[profile_name]
+
+    write_engine = create_sqlite_engine(db_path, profile=profile)
+    read_engine = create_sqlite_engine(db_path, profile=profile, read_only=True)
+    Base.metadata.create_all(bind=write_engine)
+    WriteSession = sessionmaker(bind=write_engine, autoflush=False)
+    ReadSession = sessionmaker(bind=read_engine, autoflush=False)
+    seed(WriteSession, total_peis)
+
+    counters = {"reads": 0, "writes": 0, "lock_errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def reader():
+        while time.perf_counter() < deadline:
+            db = ReadSession()
+            try:
+                db.query(PEI).order_by(PEI.created_at.desc()).limit(50).all()
+                with lock:
+                    counters["reads"] += 1
+            except OperationalError:
+                with lock:
+                    counters["lock_errors"] += 1
+            finally:
+                db.close()
+
+    def writer():
+        while time.perf_counter() < deadline:
+            db = WriteSession()
+            try:
+                pei = db.get(PEI, f"pei_{uuid.uuid4().int % total_peis}")
+                pei.ai_processing_status = 'processing'
+                pei.cognitive_report = uuid.uuid4().hex * 50
+                db.commit()
+                with lock:
+                    counters["writes"] += 1
+            except OperationalError:
+                db.rollback()
+                with lock:
+                    counters["lock_errors"] += 1
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    write_engine.dispose()
+    read_engine.dispose()
+
+    return {
+        "profile": profile_name,
+        "reads_per_s": counters["reads"] / seconds,
+        "writes_per_s": counters["writes"] / seconds,
+        "lock_errors": counters["lock_errors"],
+    }
+
+
+def run_submissions(use_writer: bool, seconds: float, submitters: int, total_peis: int) -> dict:
+    """Simula uma rajada de envios de formulário (ProfessionalResponse)"""
+    tmp_dir = tempfile.mkdtemp(prefix="peai_bench_")
+    db_path = os.path.join(tmp_dir, "bench.db")
+
+    write_engine = create_sqlite_engine(db_path, profile=SQLITE_PROFILES["production"], begin_mode="IMMEDIATE")
+    Base.metadata.create_all(bind=write_engine)
+    WriteSession = sessionmaker(bind=write_engine, autoflush=False)
+    seed(WriteSession, total_peis)
+
+    db_writer = DatabaseWriter(write_engine) if use_writer else None
+    counters = {"commits": 0, "lock_errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def new_response():
+        return ProfessionalResponse(
+            id=str(uuid.uuid4()),
+            pei_id=f"pei_{uuid.uuid4().int % total_peis}",
+            professional_id=uuid.uuid4().hex[:8],
+            professional_type='professor',
+            professional_name='Bench',
+            responses='{"q1": "resposta"}',
+            submitted_at=datetime.utcnow(),
+        )
+
+    def submitter():
+        while time.perf_counter() < deadline:
+            try:
+                if db_writer:
+                    response = new_response()
+                    db_writer.execute(lambda session: session.add(response))
+                else:
+                    db = WriteSession()
+                    try:
+                        db.add(new_response())
+                        db.commit()
+                    finally:
+                        db.close()
+                with lock:
+                    counters["commits"] += 1
+            except OperationalError:
+                with lock:
+                    counters["lock_errors"] += 1
+
+    threads = [threading.Thread(target=submitter) for _ in range(submitters)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    batches = None
+    if db_writer:
+        db_writer.stop()
+        batches = db_writer.stats["commits"]
+    write_engine.dispose()
+
+    return {
+        "mode": "group commit" if use_writer else "commit por request",
+        "submits_per_s": counters["commits"] / seconds,
+        "transactions": batches if batches is not None else counters["commits"],
+        "lock_errors": counters["lock_errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de leitura/escrita do SQLite")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--peis", type=int, default=2000)
+    parser.add_argument("--submitters", type=int, default=16)
+    args = parser.parse_args()
+
+    print("\n" + "=" * 70)
+    print("📊 BENCHMARK SQLITE - leitura/escrita concorrentes")
+    print(f"   {args.readers} leitores, {args.writers} escritores, {args.seconds}s por perfil, {args.peis} PEIs")
+    print("=" * 70)
+    print(f"{'Perfil':<12} {'Leituras/s':>12} {'Escritas/s':>12} {'Erros de lock':>15}")
+    print("-" * 70)
+    for profile_name in ("legacy", "production"):
+        result = run_profile(profile_name, args.seconds, args.readers, args.writers, args.peis)
+        print(
+            f"{result['profile']:<12} {result['reads_per_s']:>12.1f} "
+            f"{result['writes_per_s']:>12.1f} {result['lock_errors']:>15}"
+        )
+    print("=" * 70)
+
+    print(f"\n📨 ENVIO DE RESPOSTAS - {args.submitters} requests concorrentes, {args.seconds}s por modo")
+    print("=" * 70)
+    print(f"{'Modo':<20} {'Envios/s':>12} {'Transações':>12} {'Erros de lock':>15}")
+    print("-" * 70)
+    for use_writer in (False, True):
+        result = run_submissions(use_writer, args.seconds, args.submitters, args.peis)
+        print(
+            f"{result['mode']:<20} {result['submits_per_s']:>12.1f} "
+            f"{result['transactions']:>12} {result['lock_errors']:>15}"
+        )
+    print("=" * 70 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: cadastro de alunos um a um vs importação em lote
+
+Sobe a API num banco temporário e cadastra N alunos de duas formas:
+N chamadas a POST /api/students e uma chamada a POST /api/students/import
+(CSV e JSON). O backend/students.db nunca é tocado.
+
+Uso:
+    python benchmark_import.py [--students 2000]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="peai_import_"), "import.db"))
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def students(prefix: str, total: int) -> list:
+    return [
+        {"id": f"{prefix}{i}", "name": f"Aluno {prefix}{i}", "status": "pending_form", "hasAccess": False}
+        for i in range(total)
+    ]
+
+
+def as_csv(rows: list) -> bytes:
+    lines = ["id,name,status,hasAccess"]
+    lines += [f"{r['id']},{r['name']},{r['status']},{str(r['hasAccess']).lower()}" for r in rows]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description="Cadastro um a um vs importação em lote")
+    parser.add_argument("--students", type=int, default=2000)
+    args = parser.parse_args()
+
+    with TestClient(main.app) as client:
+        results = []
+
+        start = time.perf_counter()
+        for student in students("one_", args.students):
+            response = client.post("/api/students", json=student)
+            assert response.status_code == 201, response.text
+        results.append(("POST /api/students x N", time.perf_counter() - start, args.students))
+
+        for label, content_type, body in (
+            ("import CSV", "text/csv", as_csv(students("csv_", args.students))),
+            ("import JSON", "application/json", json.dumps(students("json_", args.students)).encode()),
+        ):
+            start = time.perf_counter()
+            response = client.post("/api/students/import", content=body, headers={"content-type": content_type})
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, response.text
+            results.append((label, elapsed, response.json()["created"]))
+
+    print("\n" + "=" * 70)
+    print(f"📥 BENCHMARK IMPORTAÇÃO - {args.students} alunos")
+    print("=" * 70)
+    print(f"{'Modo':<26} {'Tempo (s)':>10} {'Criados':>10} {'Alunos/s':>12}")
+    print("-" * 70)
+    for label, elapsed, created in results:
+        print(f"{label:<26} {elapsed:>10.2f} {created:>10} {created / elapsed:>12.1f}")
+    print("=" * 70 + "\n")
+
+
+if __name__ == "__main__":
+    main_benchmark()
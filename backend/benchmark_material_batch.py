@@ -0,0 +1,179 @@
+"""
+Benchmark: material para a turma inteira, aluno por aluno vs. upload em lote
+
+Sobe a API contra um banco temporário com o provider de LLM fake e mede,
+para N alunos com PEI aprovado:
+
+1. uma adaptação sozinha (a referência: o tempo de um aluno);
+2. aluno por aluno: um POST /api/students/{id}/materials/upload por aluno,
+   como o GenerateClass.tsx fazia (o PDF sobe e é extraído N vezes);
+3. em lote: um POST /api/materials/batch-upload com todos os alunos (mais
+   um aluno sem PEI aprovado, que deve voltar em 'rejected'), acompanhando o
+   progresso por GET /api/materials/batches/{id}/events até o 'done'.
+
+Cada modo usa um PDF diferente, para não reaproveitar a análise do anterior.
+Mostra o tempo do upload, o tempo até todos os materiais prontos, quantas
+vezes o texto foi extraído e a razão em relação a uma adaptação.
+
+Uso:
+    python benchmark_material_batch.py [--students 30] [--workers 16] [--latency 1.0] [--pages 2]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from benchmark_common import material_pdf, running_app, seed_peis, setup
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Material para a turma: aluno por aluno vs. lote")
+    parser.add_argument("--students", type=int, default=30, help="alunos da turma")
+    parser.add_argument("--workers", type=int, default=16, help="jobs simultâneos no pool (ai_worker.py: 16)")
+    parser.add_argument("--latency", type=float, default=1.0, help="latência do provider fake em segundos")
+    parser.add_argument("--pages", type=int, default=2, help="páginas do PDF")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+os.environ["LLM_FAKE_LATENCY_SECONDS"] = str(ARGS.latency)
+setup("batch")
+
+from fastapi.testclient import TestClient
+
+import main
+from ai import MaterialAnalysisAgent
+from database import AdaptedMaterial, SessionLocal
+
+extractions = 0
+_extract_text_from_pdf = main.extract_text_from_pdf
+
+
+def counting_extract(pdf_file: bytes) -> str:
+    global extractions
+    extractions += 1
+    return _extract_text_from_pdf(pdf_file)
+
+
+main.extract_text_from_pdf = counting_extract
+
+
+def wait_materials(student_ids: list, timeout: float = 3600) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = SessionLocal()
+        try:
+            rows = db.query(AdaptedMaterial.status).filter(AdaptedMaterial.student_id.in_(student_ids)).all()
+        finally:
+            db.close()
+        if len(rows) >= len(student_ids) and all(status != 'processing' for (status,) in rows):
+            return {status: sum(s == status for (s,) in rows) for status in ('completed', 'error')}
+        time.sleep(0.05)
+    raise TimeoutError(f"materiais não terminaram em {timeout:.0f}s")
+
+
+def upload_one(client: TestClient, student_id: str, pdf: bytes):
+    response = client.post(
+        f"/api/students/{student_id}/materials/upload",
+        files={"file": ("fotossintese.pdf", pdf, "application/pdf")},
+        data={"title": "Fotossíntese", "subject": "Ciências", "grade": "9º Ano"},
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"upload falhou: {response.status_code} {response.text}")
+
+
+def run_single(client: TestClient) -> dict:
+    global extractions
+    student_ids = seed_peis("solo", 1, status='concluido')
+    extractions = 0
+    start = time.perf_counter()
+    upload_one(client, student_ids[0], material_pdf(ARGS.pages, "solo"))
+    uploaded = time.perf_counter() - start
+    counts = wait_materials(student_ids)
+    return {"upload": uploaded, "elapsed": time.perf_counter() - start, "extractions": extractions, **counts}
+
+
+def run_per_student(client: TestClient) -> dict:
+    global extractions
+    student_ids = seed_peis("each", ARGS.students, status='concluido')
+    pdf = material_pdf(ARGS.pages, "each")
+    extractions = 0
+    start = time.perf_counter()
+    for student_id in student_ids:
+        upload_one(client, student_id, pdf)
+    uploaded = time.perf_counter() - start
+    counts = wait_materials(student_ids)
+    return {"upload": uploaded, "elapsed": time.perf_counter() - start, "extractions": extractions, **counts}
+
+
+def run_batch(client: TestClient) -> dict:
+    global extractions
+    student_ids = seed_peis("batch", ARGS.students, status='concluido')
+    pending = seed_peis("pending", 1)
+    extractions = 0
+    start = time.perf_counter()
+    response = client.post(
+        "/api/materials/batch-upload",
+        files={"file": ("fotossintese.pdf", material_pdf(ARGS.pages, "batch"), "application/pdf")},
+        data={"title": "Fotossíntese", "subject": "Ciências", "grade": "9º Ano",
+              "student_ids": json.dumps(student_ids + pending + student_ids[:1])},
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"upload em lote falhou: {response.status_code} {response.text}")
+    batch = response.json()
+    uploaded = time.perf_counter() - start
+
+    # Progresso agregado por SSE até o 'done'
+    progress_events, done = 0, None
+    with client.stream("GET", f"/api/materials/batches/{batch['batch_id']}/events") as stream:
+        event = None
+        for line in stream.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                if event == 'progress':
+                    progress_events += 1
+                elif event == 'done':
+                    done = json.loads(line[len("data: "):])
+                    break
+    elapsed = time.perf_counter() - start
+
+    summary = client.get(f"/api/materials/batches/{batch['batch_id']}").json()
+    ok = (
+        batch["total"] == len(student_ids)
+        and [r["student_id"] for r in batch["rejected"]] == pending
+        and summary["counts"]["completed"] == len(student_ids)
+        and all(m["download_url"] for m in summary["materials"])
+        and done == {"status": "completed"}
+    )
+    return {"upload": uploaded, "elapsed": elapsed, "extractions": extractions,
+            "completed": summary["counts"]["completed"], "error": summary["counts"]["error"],
+            "progress_events": progress_events, "ok": ok}
+
+
+def run() -> int:
+    print(f"🧪 {ARGS.students} alunos, {ARGS.workers} workers, fake {ARGS.latency}s, PDF de {ARGS.pages} página(s)\n")
+    with running_app(ARGS.workers) as client:
+        single = run_single(client)
+        per_student = run_per_student(client)
+        batch = run_batch(client)
+
+    print(f"{'modo':<16} {'alunos':>6} {'extrações':>9} {'upload (s)':>10} {'total (s)':>9} {'x 1 aluno':>9} {'falhas':>7}")
+    print("-" * 72)
+    for label, students, r in (("1 aluno", 1, single), ("aluno por aluno", ARGS.students, per_student),
+                               ("lote", ARGS.students, batch)):
+        print(f"{label:<16} {students:>6} {r['extractions']:>9} {r['upload']:>10.2f} {r['elapsed']:>9.2f} "
+              f"{r['elapsed'] / single['elapsed']:>9.1f} {r['error']:>7}")
+    analyses = MaterialAnalysisAgent.stats()
+    print(f"\nLote: {batch['progress_events']} eventos de progresso; "
+          f"análises: {analyses['generated']} geradas, {analyses['reused']} reaproveitadas")
+    failed = single["error"] + per_student["error"] + batch["error"]
+    if failed or not batch["ok"]:
+        print(f"❌ lote inconsistente ou {failed} material(is) com erro")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,123 @@
+"""
+Benchmark: vazão do pipeline de IA de ponta a ponta, sem rede
+
+Sobe a API contra um banco temporário com o provider de LLM fake (ou replay,
+ver llm_providers.py) e mede o pipeline completo:
+
+1. PEIs: N alunos com respostas dos profissionais -> jobs process_pei ->
+   geração (streaming + eventos SSE) -> PEI gravado
+2. Materiais: upload de PDF pela API (extração de texto) -> jobs
+   adapt_material -> adaptação -> PDF adaptado gerado e gravado
+
+Mostra jobs/s, latência por job (p50/p95, da fila ao fim) e o pico de
+chamadas ao LLM em voo. O limite de taxa do Gemini fica alto por padrão;
+com --quota ele usa GEMINI_RPM/GEMINI_TPM para simular a cota real.
+
+Uso:
+    python benchmark_pipeline.py [--students 50] [--workers 16] [--latency 1.0] [--pages 2]
+    LLM_PROVIDER=replay python benchmark_pipeline.py   # respostas gravadas com LLM_PROVIDER=record
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from benchmark_common import material_pdf, running_app, seed_peis, setup
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Vazão do pipeline de IA com LLM offline")
+    parser.add_argument("--students", type=int, default=50, help="alunos (1 PEI e 1 material cada)")
+    parser.add_argument("--responses", type=int, default=3, help="respostas de profissionais por PEI")
+    parser.add_argument("--workers", type=int, default=16, help="jobs simultâneos no pool")
+    parser.add_argument("--latency", type=float, default=None, help="latência do provider fake em segundos")
+    parser.add_argument("--pages", type=int, default=2, help="páginas do PDF de cada material")
+    parser.add_argument("--quota", action="store_true", help="respeitar GEMINI_RPM/GEMINI_TPM (padrão: sem limite)")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+if ARGS.latency is not None:
+    os.environ["LLM_FAKE_LATENCY_SECONDS"] = str(ARGS.latency)
+
+WORKDIR = setup("pipeline", quota=ARGS.quota)
+
+import main
+from ai import MaterialAnalysisAgent, llm_concurrency, llm_provider
+from database import PEI, AIJob, SessionLocal
+from db_writer import writer
+
+
+def wait_for_jobs(kind: str, expected: int, timeout: float = 3600) -> list:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = SessionLocal()
+        try:
+            jobs = db.query(AIJob).filter(AIJob.kind == kind).all()
+        finally:
+            db.close()
+        if len(jobs) >= expected and all(job.status in ('succeeded', 'failed') for job in jobs):
+            return jobs
+        time.sleep(0.1)
+    raise TimeoutError(f"{kind}: jobs não terminaram em {timeout:.0f}s")
+
+
+def report(label: str, jobs: list, elapsed: float):
+    latencies = sorted((job.finished_at - job.created_at).total_seconds() for job in jobs if job.finished_at)
+    failed = sum(job.status == 'failed' for job in jobs)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(f"{label:<12} {len(jobs):>6} {failed:>7} {elapsed:>9.2f} {len(jobs) / elapsed:>9.2f} "
+          f"{statistics.median(latencies) if latencies else 0.0:>9.2f} {p95:>9.2f}")
+    return failed
+
+
+def run() -> int:
+    print(f"🧪 Provider: {llm_provider.stats()}")
+    print(f"   {ARGS.students} alunos, {ARGS.workers} workers, PDFs de {ARGS.pages} página(s)\n")
+    with running_app(ARGS.workers) as client:
+        seed_peis("bp", ARGS.students, professionals=ARGS.responses, responses=ARGS.responses)
+
+        # 1) PEIs
+        start = time.perf_counter()
+        for i in range(ARGS.students):
+            writer.execute(lambda session, i=i: main.queue_pei_processing(session, f"pei_bp_{i}"))
+        pei_jobs = wait_for_jobs('process_pei', ARGS.students)
+        pei_elapsed = time.perf_counter() - start
+
+        # 2) Materiais (PEI aprovado é pré-requisito do upload)
+        def approve(session):
+            session.query(PEI).filter(PEI.id.like("pei_bp_%")).update({PEI.status: 'concluido'}, synchronize_session=False)
+        writer.execute(approve)
+        pdf = material_pdf(ARGS.pages)
+        start = time.perf_counter()
+        for i in range(ARGS.students):
+            response = client.post(
+                f"/api/students/bp_{i}/materials/upload",
+                files={"file": ("fotossintese.pdf", pdf, "application/pdf")},
+                data={"title": "Fotossíntese", "subject": "Ciências", "grade": "9º Ano"},
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"upload falhou: {response.status_code} {response.text}")
+        upload_elapsed = time.perf_counter() - start
+        material_jobs = wait_for_jobs('adapt_material', ARGS.students)
+        material_elapsed = time.perf_counter() - start
+
+    print(f"{'etapa':<12} {'jobs':>6} {'falhas':>7} {'total (s)':>9} {'jobs/s':>9} {'p50 (s)':>9} {'p95 (s)':>9}")
+    print("-" * 68)
+    failed = report("PEI", pei_jobs, pei_elapsed)
+    failed += report("material", material_jobs, material_elapsed)
+    pdfs = len(os.listdir(os.path.join(WORKDIR, "adapted_pdfs"))) if os.path.isdir(os.path.join(WORKDIR, "adapted_pdfs")) else 0
+    llm = llm_concurrency.stats()
+    print(f"\nUploads: {upload_elapsed:.2f}s; PDFs adaptados: {pdfs}")
+    print(f"LLM: {llm['calls']} chamadas, pico de {llm['peak_in_flight']} em voo; provider: {llm_provider.stats()}")
+    analyses = MaterialAnalysisAgent.stats()
+    print(f"Análises de material: {analyses['generated']} geradas, {analyses['reused']} reaproveitadas")
+    if failed:
+        print(f"❌ {failed} job(s) falharam")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,163 @@
+"""
+Benchmark: tempo entre a última resposta e o PEI pronto, com e sem o modo progressivo
+
+Sobe a API contra um banco temporário com o provider de LLM fake e, para
+cada modo (PEI_PROGRESSIVE_DIGESTS desligado e ligado):
+
+1. cria N PEIs com K profissionais;
+2. envia pela API as K-1 primeiras respostas de cada PEI e espera a fila
+   esvaziar (no modo progressivo é aqui que os resumos são gerados);
+3. envia a última resposta de cada PEI e mede até o PEI ficar pronto.
+
+O fake simula a latência de uma chamada real: um custo fixo mais um custo
+por mil tokens de entrada (prefill) e de saída (--input-rate/--output-rate).
+Mostra a latência da última resposta ao PEI pronto (p50/p95) e o tamanho
+médio do prompt da geração final por PEI.
+
+Uso:
+    python benchmark_progressive_pei.py [--peis 10] [--professionals 4] [--workers 16]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from benchmark_common import running_app, seed_peis, setup
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Latência da última resposta ao PEI pronto")
+    parser.add_argument("--peis", type=int, default=10)
+    parser.add_argument("--professionals", type=int, default=4, help="profissionais (respostas) por PEI")
+    parser.add_argument("--workers", type=int, default=16, help="jobs simultâneos no pool")
+    parser.add_argument("--latency", type=float, default=0.5, help="custo fixo de cada chamada (s)")
+    parser.add_argument("--input-rate", type=float, default=0.2, help="segundos por mil tokens de entrada")
+    parser.add_argument("--output-rate", type=float, default=5.0, help="segundos por mil tokens de saída")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+os.environ["LLM_FAKE_LATENCY_SECONDS"] = str(ARGS.latency)
+os.environ["LLM_FAKE_SECONDS_PER_1K_INPUT_TOKENS"] = str(ARGS.input_rate)
+os.environ["LLM_FAKE_SECONDS_PER_1K_OUTPUT_TOKENS"] = str(ARGS.output_rate)
+setup("progressive")
+
+from fastapi.testclient import TestClient
+
+import main
+from ai import PEIGeneratorAgent
+from database import PEI, AIJob, SessionLocal
+from llm_schemas import structured_output_stats
+
+# Uma resposta de formulário real: várias perguntas abertas, respondidas em parágrafos
+ANSWER = (
+    "Observo que o aluno mantém o foco por 15 a 20 minutos em atividades expositivas e por mais "
+    "tempo quando a tarefa envolve material concreto ou recursos visuais. Em situações de barulho "
+    "ou mudança de rotina fica agitado e precisa de um momento de pausa antes de retomar. "
+)
+QUESTIONS = [
+    "cognitive_development", "attention_concentration", "learning_style", "classroom_performance",
+    "social_interaction", "communication", "strategies_that_work", "challenges",
+]
+
+
+def submit(client: TestClient, pei_id: str, professional: int):
+    response = client.post(f"/api/pei/{pei_id}/responses", json={
+        "professional_id": f"p{professional}",
+        "responses": {question: f"{ANSWER}({question}, {professional})" for question in QUESTIONS},
+    })
+    if response.status_code != 201:
+        raise RuntimeError(f"resposta falhou: {response.status_code} {response.text}")
+
+
+def wait_idle(timeout: float = 3600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = SessionLocal()
+        try:
+            active = db.query(AIJob).filter(AIJob.status.in_(('queued', 'running'))).count()
+        finally:
+            db.close()
+        if not active:
+            return
+        time.sleep(0.05)
+    raise TimeoutError(f"a fila não esvaziou em {timeout:.0f}s")
+
+
+def final_prompt_chars() -> int:
+    # Prompts da geração final: todas as chamadas do PEIGeneratorAgent (por seção ou única)
+    stats = structured_output_stats.stats()
+    schemas = {section.schema.__name__ for section in PEIGeneratorAgent.SECTIONS} | {"PEIOutput"}
+    return sum(entry["prompt_chars"] for name, entry in stats.items() if name in schemas)
+
+
+def run_mode(client: TestClient, progressive: bool) -> dict:
+    main.PEI_PROGRESSIVE_DIGESTS = progressive
+    prefix = "prog" if progressive else "base"
+    seed_peis(prefix, ARGS.peis, professionals=ARGS.professionals)
+    pei_ids = [f"pei_{prefix}_{i}" for i in range(ARGS.peis)]
+
+    start = time.perf_counter()
+    for pei_id in pei_ids:
+        for professional in range(ARGS.professionals - 1):
+            submit(client, pei_id, professional)
+    wait_idle()
+    collection = time.perf_counter() - start
+
+    prompt_chars = final_prompt_chars()
+    submitted = {}
+    start = time.perf_counter()
+    for pei_id in pei_ids:
+        submitted[pei_id] = datetime.utcnow()
+        submit(client, pei_id, ARGS.professionals - 1)
+    wait_idle()
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    try:
+        peis = db.query(PEI).filter(PEI.id.in_(pei_ids)).all()
+        latencies = sorted((pei.ai_processed_at - submitted[pei.id]).total_seconds() for pei in peis if pei.ai_processed_at)
+        failed = sum(pei.ai_processing_status != 'completed' for pei in peis)
+        digested = sum(len(json.loads(pei.ai_response_digests or "{}")) for pei in peis)
+    finally:
+        db.close()
+    return {
+        "collection": collection,
+        "elapsed": elapsed,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": latencies[max(int(len(latencies) * 0.95) - 1, 0)] if latencies else 0.0,
+        "prompt_chars": (final_prompt_chars() - prompt_chars) // max(ARGS.peis, 1),
+        "digests": digested,
+        "failed": failed,
+    }
+
+
+def run() -> int:
+    print(f"🧪 {ARGS.peis} PEIs x {ARGS.professionals} profissionais, {ARGS.workers} workers; "
+          f"fake: {ARGS.latency}s + {ARGS.input_rate}s/1k entrada + {ARGS.output_rate}s/1k saída\n")
+    results = {}
+    with running_app(ARGS.workers) as client:
+        for progressive in (False, True):
+            results[progressive] = run_mode(client, progressive)
+
+    print(f"{'modo':<12} {'coleta (s)':>10} {'resumos':>8} {'prompt final':>13} {'total (s)':>10} {'p50 (s)':>8} {'p95 (s)':>8}")
+    print("-" * 76)
+    for progressive, label in ((False, "normal"), (True, "progressivo")):
+        r = results[progressive]
+        print(f"{label:<12} {r['collection']:>10.2f} {r['digests']:>8} {r['prompt_chars']:>13} "
+              f"{r['elapsed']:>10.2f} {r['p50']:>8.2f} {r['p95']:>8.2f}")
+    base, progressive = results[False], results[True]
+    if base["p50"]:
+        print(f"\nÚltima resposta → PEI pronto (p50): {1 - progressive['p50'] / base['p50']:.0%} mais rápido")
+    failed = base["failed"] + progressive["failed"]
+    if failed:
+        print(f"❌ {failed} PEI(s) não ficaram prontos")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
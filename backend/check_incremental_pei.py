@@ -0,0 +1,142 @@
+"""
+Regeneração incremental do PEI: só as seções afetadas pelas respostas alteradas
+
+Gera o PEI por seções (PEI_GENERATION_MODE=sectioned) com o provider fake,
+que aqui cita em sources os profissionais de um mapa fixo (SOURCES). Depois
+corrige respostas e gera de novo passando o estado da geração anterior
+(PEIDocument.sections), conferindo que:
+- só as seções que citam a resposta alterada (e a revisão) vão ao LLM;
+- as seções reaproveitadas ficam idênticas às da geração anterior;
+- resposta nova ou dados do aluno alterados regeneram tudo.
+
+Mostra as chamadas e os tokens estimados de cada geração. Nenhuma chamada de
+rede é feita. Sai com código 1 se algo falhar.
+
+Uso:
+    python check_incremental_pei.py
+"""
+import asyncio
+import copy
+import dataclasses
+import json
+import os
+import re
+import sys
+import tempfile
+
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="peai_incremental_"), "llm_cache.db"))
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["LLM_FAKE_LATENCY_SECONDS"] = "0"
+os.environ["PEI_GENERATION_MODE"] = "sectioned"
+os.environ.setdefault("GEMINI_RPM", "1000000")
+os.environ.setdefault("GEMINI_TPM", "1000000000")
+
+import ai
+from ai import PEIGeneratorAgent, ProfessionalResponse
+from check_structured_output import RESPONSES, STUDENT
+from llm_providers import FakeProvider, _response
+
+ANA, ROBERTO, MARCIA = "Ana Costa (Psicóloga)", "Roberto Lima (Professor)", "Márcia Oliveira (Responsável)"
+
+# Quem cada seção cita (o Gemini preenche sources a partir das respostas)
+SOURCES = {
+    "detailed_report.cognitive_development": [ANA, ROBERTO],
+    "detailed_report.attention_concentration": [ANA],
+    "detailed_report.socioemotional": [MARCIA],
+    "detailed_report.communication": [ROBERTO],
+    "profile": [ANA, ROBERTO, MARCIA],
+    "educational_goals": [ANA, ROBERTO],
+    "methodological_strategies": [ROBERTO],
+    "assistive_resources": [MARCIA],
+    "evaluation_criteria": [ROBERTO],
+}
+
+_SECTION = re.compile(r"=== SEÇÃO: (\S+) ===")
+
+
+class CitingModel:
+    """Fake model whose sources follow SOURCES; records each section sent to the LLM"""
+
+    def __init__(self, provider: "CitingProvider", inner):
+        self.provider = provider
+        self.inner = inner
+
+    async def generate_content_async(self, prompt, **kwargs):
+        resp = await self.inner.generate_content_async(prompt, **kwargs)
+        section = _SECTION.search(prompt).group(1)
+        value = json.loads(resp.text)
+        if "sources" in value:
+            value["sources"] = SOURCES[section]
+        self.provider.sent.append(section)
+        self.provider.tokens += (len(prompt) + len(resp.text)) // 4
+        return _response(json.dumps(value, ensure_ascii=False), None, None)
+
+
+class CitingProvider(FakeProvider):
+    def __init__(self):
+        super().__init__(latency=0.0, schemas=ai.AGENT_SCHEMAS)
+        self.sent = []
+        self.tokens = 0
+
+    def model(self, system_instruction: str):
+        return CitingModel(self, super().model(system_instruction))
+
+
+def corrected(responses, professional_id: str, **answers):
+    responses = copy.deepcopy(responses)
+    for response in responses:
+        if response.professional_id == professional_id:
+            response.responses.update(answers)
+    return responses
+
+
+async def generate(provider: CitingProvider, student, responses, previous=None):
+    provider.sent, provider.tokens = [], 0
+    document = await PEIGeneratorAgent.run_async(student, responses, use_cache=False, previous=previous)
+    return document, sorted(provider.sent), provider.tokens
+
+
+async def main() -> int:
+    provider = CitingProvider()
+    ai.llm_provider = provider
+    full, sent, full_tokens = await generate(provider, STUDENT, RESPONSES)
+    every = sorted(section.name for section in PEIGeneratorAgent.SECTIONS)
+
+    marcia = corrected(RESPONSES, "prof_003", challenges="Barulho o deixa irritado; usa fones com abafador.")
+    roberto = corrected(RESPONSES, "prof_002", social_interaction="Agora participa de grupos de até 4 alunos.")
+    newcomer = RESPONSES + [ProfessionalResponse(
+        professional_id="prof_004", professional_type="fonoaudiologo", professional_name="Luiza Reis",
+        responses={"communication": "Vocabulário amplo; dificuldade com linguagem figurada."},
+        timestamp="2025-03-04T10:00:00",
+    )]
+    older = dataclasses.replace(STUDENT, grade="1º Ano EM")
+    cases = [
+        ("resposta de Márcia corrigida", STUDENT, marcia, sorted([
+            "detailed_report.socioemotional", "profile", "assistive_resources", "review"])),
+        ("resposta de Roberto corrigida", STUDENT, roberto, sorted([
+            "detailed_report.cognitive_development", "detailed_report.communication", "profile",
+            "educational_goals", "methodological_strategies", "evaluation_criteria", "review"])),
+        ("profissional novo", STUDENT, newcomer, every),
+        ("série do aluno alterada", older, RESPONSES, every),
+    ]
+
+    ok = sent == every
+    print(f"{'geração':<32} {'seções':>7} {'tokens':>8} {'vs completa':>12}")
+    print("-" * 62)
+    print(f"{'completa':<32} {len(sent):>7} {full_tokens:>8} {'100%':>12}")
+    for label, student, responses, expected in cases:
+        document, sent, tokens = await generate(provider, student, responses, previous=full.sections)
+        reused = set(every) - set(sent)
+        same = all(document.sections["sections"][name]["result"] == full.sections["sections"][name]["result"]
+                   for name in reused)
+        case_ok = sent == expected and same
+        ok = ok and case_ok
+        print(f"{label:<32} {len(sent):>7} {tokens:>8} {tokens / full_tokens:>12.0%} {'✅' if case_ok else '❌'}")
+        if not case_ok:
+            print(f"   esperado {expected}\n   enviado  {sent}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,149 @@
+"""
+Regressão de N+1: quantidade de comandos SQL por endpoint
+
+Sobe a API contra um banco temporário, cria PEIs com respostas e conta os
+comandos SQL emitidos por cada endpoint. A contagem precisa ser a mesma
+com 1 PEI e com muitos PEIs; caso contrário o script sai com código 1.
+Também confere que um GET repetido do PEI sai do pei_cache (só a consulta
+de versão) e que uma escrita invalida a entrada.
+
+Com DATABASE_URL=postgresql://... roda contra o PostgreSQL - use um banco
+descartável, o seed apaga os PEIs existentes.
+
+Uso:
+    python check_query_counts.py
+"""
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="peai_counts_"), "counts.db"))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from database import PEI, ProfessionalResponse, SessionLocal, Student, engine, read_engine
+
+# (endpoint, máximo de comandos esperado) - {pei_id}/{student_id} do primeiro PEI
+ENDPOINTS = [
+    ("/api/peis", 2),
+    ("/api/peis?limit=10", 2),
+    ("/api/students/{student_id}/pei", 3),
+    ("/api/pei/{pei_id}", 2),
+    ("/api/pei/{pei_id}/status", 2),
+]
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(("BEGIN", "PRAGMA", "SAVEPOINT", "RELEASE")):
+            statements.append(statement)
+
+    for e in (engine, read_engine):
+        event.listen(e, "before_cursor_execute", on_execute)
+    try:
+        yield statements
+    finally:
+        for e in (engine, read_engine):
+            event.remove(e, "before_cursor_execute", on_execute)
+
+
+def seed(total_peis: int, responses_per_pei: int = 3):
+    db = SessionLocal()
+    try:
+        db.query(ProfessionalResponse).delete()
+        db.query(PEI).delete()
+        db.query(Student).filter(Student.id.like("qc_%")).delete(synchronize_session=False)
+        now = datetime.utcnow()
+        for i in range(total_peis):
+            professionals = [
+                {"id": f"p{j}", "name": f"Profissional {j}", "type": "professor", "phone": ""}
+                for j in range(responses_per_pei)
+            ]
+            db.add(Student(id=f"qc_{i}", name=f"Aluno QC {i}", status='resend_form', hasAccess=False))
+            db.add(PEI(
+                id=f"pei_qc_{i}",
+                student_id=f"qc_{i}",
+                status='in_collection',
+                professionals=json.dumps(professionals),
+                created_at=now - timedelta(minutes=i),
+            ))
+            for j in range(responses_per_pei):
+                db.add(ProfessionalResponse(
+                    id=f"r_qc_{i}_{j}",
+                    pei_id=f"pei_qc_{i}",
+                    professional_id=f"p{j}",
+                    professional_type='professor',
+                    professional_name=f"Profissional {j}",
+                    responses=json.dumps({"resposta": "x" * 500}),
+                    submitted_at=now,
+                ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def measure(client: TestClient) -> dict:
+    counts = {}
+    for path, _ in ENDPOINTS:
+        url = path.format(pei_id="pei_qc_0", student_id="qc_0")
+        with count_statements() as statements:
+            response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} retornou {response.status_code}: {response.text}")
+        counts[path] = len(statements)
+    return counts
+
+
+def check_cache(client: TestClient) -> int:
+    """Repeat read = 1 statement; a write through update_pei_fields must show up"""
+    url = "/api/pei/pei_qc_0"
+    client.get(url)
+    with count_statements() as statements:
+        cached = client.get(url)
+    main.update_pei_fields("pei_qc_0", cognitive_report="relatório atualizado")
+    updated = client.get(url).json()
+
+    failures = 0
+    ok = len(statements) == 1 and cached.status_code == 200
+    failures += 0 if ok else 1
+    print(f"{'✅' if ok else '❌'} {'GET repetido (cache)':<34} {len(statements):>7} comando(s)")
+    ok = updated["cognitive_report"] == "relatório atualizado"
+    failures += 0 if ok else 1
+    print(f"{'✅' if ok else '❌'} {'invalidação após escrita':<34}")
+    print(f"   pei_cache: {main.pei_cache.stats()}")
+    return failures
+
+
+def run() -> int:
+    with TestClient(main.app) as client:
+        seed(1)
+        small = measure(client)
+        seed(25)
+        large = measure(client)
+
+        failures = 0
+        print(f"\n{'Endpoint':<36} {'1 PEI':>7} {'25 PEIs':>8} {'Máx':>5}")
+        print("-" * 60)
+        for path, expected in ENDPOINTS:
+            ok = small[path] == large[path] <= expected
+            failures += 0 if ok else 1
+            print(f"{'✅' if ok else '❌'} {path:<34} {small[path]:>7} {large[path]:>8} {expected:>5}")
+        failures += check_cache(client)
+
+    print()
+    if failures:
+        print(f"❌ {failures} verificação(ões) falharam (comandos SQL variáveis/acima do esperado ou cache)")
+        return 1
+    print("✅ Número de comandos SQL fixo em todos os endpoints e cache de PEI consistente")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run())
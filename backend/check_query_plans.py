@@ -0,0 +1,182 @@
+"""
+Regressão de planos de consulta
+
+Roda EXPLAIN QUERY PLAN para as consultas quentes de cada endpoint do
+main.py num banco temporário criado a partir dos modelos e falha (exit 1)
+se alguma delas cair num full table scan.
+
+Uso:
+    python check_query_plans.py
+"""
+import os
+import sys
+import tempfile
+
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_, select
+
+from database import (
+    Base, Student, Respondent, PEI, ProfessionalResponse, AdaptedMaterial, AIJob, GenerationEvent,
+    create_sqlite_engine,
+)
+
+KEYSET_TS = datetime(2025, 1, 1)
+
+# (endpoint, consulta) - manter em sincronia com as consultas do main.py
+ENDPOINT_QUERIES = [
+    ("GET /api/students/{id}", select(Student).where(Student.id == "1")),
+    (
+        "GET /api/students?pei_status=concluido (colegas do lote)",
+        select(Student)
+        .where(select(PEI.id).where(PEI.student_id == Student.id, PEI.status == "concluido").exists())
+        .order_by(Student.name, Student.id)
+        .limit(101),
+    ),
+    ("POST /api/pei (busca aluno por nome)", select(Student).where(Student.name == "Ana Clara Silva")),
+    ("POST /api/pei (PEI existente)", select(PEI).where(PEI.student_id == "1")),
+    ("GET /api/students/{id}/respondents", select(Respondent).where(Respondent.student_id == "1")),
+    ("GET /api/peis", select(PEI).order_by(PEI.created_at.desc())),
+    (
+        "GET /api/peis?cursor=... (keyset)",
+        select(PEI)
+        .where(or_(PEI.created_at < KEYSET_TS, and_(PEI.created_at == KEYSET_TS, PEI.id < "pei_1")))
+        .order_by(PEI.created_at.desc(), PEI.id.desc())
+        .limit(51),
+    ),
+    (
+        "GET /api/peis?status=...",
+        select(PEI).where(PEI.status == "completed").order_by(PEI.created_at.desc(), PEI.id.desc()).limit(51),
+    ),
+    (
+        "GET /api/peis?ai_processing_status=...",
+        select(PEI)
+        .where(PEI.ai_processing_status == "completed")
+        .order_by(PEI.created_at.desc(), PEI.id.desc())
+        .limit(51),
+    ),
+    ("GET /api/peis/counts", select(PEI.status, func.count(PEI.id)).group_by(PEI.status)),
+    ("GET /api/pei/{id}", select(PEI).where(PEI.id == "pei_1")),
+    (
+        "GET /api/students/{id}/pei",
+        select(PEI).where(PEI.student_id == "1").order_by(PEI.created_at.desc()).limit(1),
+    ),
+    (
+        "POST /api/pei/{id}/responses (duplicada)",
+        select(ProfessionalResponse).where(
+            ProfessionalResponse.pei_id == "pei_1",
+            ProfessionalResponse.professional_id == "p1",
+        ),
+    ),
+    (
+        "GET /api/pei/{id}/responses e /status",
+        select(ProfessionalResponse).where(ProfessionalResponse.pei_id == "pei_1"),
+    ),
+    (
+        "POST /api/students/{id}/materials/upload (PEI aprovado)",
+        select(PEI).where(PEI.student_id == "1", PEI.status == "concluido"),
+    ),
+    (
+        "GET /api/students/{id}/materials",
+        select(AdaptedMaterial)
+        .where(AdaptedMaterial.student_id == "1")
+        .order_by(AdaptedMaterial.uploaded_at.desc()),
+    ),
+    ("GET /api/materials/{id}", select(AdaptedMaterial).where(AdaptedMaterial.id == "m1")),
+    (
+        "GET /api/materials/batches/{id} e /events (progresso do lote)",
+        select(AdaptedMaterial.id, AdaptedMaterial.status, Student.name)
+        .outerjoin(Student, Student.id == AdaptedMaterial.student_id)
+        .where(AdaptedMaterial.batch_id == "batch_1")
+        .order_by(AdaptedMaterial.student_id),
+    ),
+    (
+        "GET /api/.../events (início da execução mais recente)",
+        select(func.max(GenerationEvent.id)).where(
+            GenerationEvent.target_kind == "pei",
+            GenerationEvent.target_id == "pei_1",
+            GenerationEvent.event == "queued",
+        ),
+    ),
+    (
+        "GET /api/.../events (poll do SSE)",
+        select(GenerationEvent)
+        .where(
+            GenerationEvent.target_kind == "pei",
+            GenerationEvent.target_id == "pei_1",
+            GenerationEvent.id > 10,
+        )
+        .order_by(GenerationEvent.id)
+        .limit(100),
+    ),
+    (
+        "queue_pei_processing (job ativo do PEI)",
+        select(AIJob)
+        .where(
+            AIJob.kind == "process_pei",
+            AIJob.target_id == "pei_1",
+            AIJob.status.in_(["queued", "running"]),
+        )
+        .order_by(AIJob.created_at),
+    ),
+    (
+        "load_pei_ai_inputs (job forçado em execução)",
+        select(AIJob.id).where(
+            AIJob.kind == "process_pei",
+            AIJob.target_id == "pei_1",
+            AIJob.status == "running",
+            AIJob.force.is_(True),
+        ),
+    ),
+    (
+        "ai_jobs.claim_next (worker)",
+        select(AIJob.id, AIJob.status)
+        .where(
+            AIJob.kind.in_(["process_pei", "adapt_material"]),
+            or_(
+                and_(AIJob.status == "queued", AIJob.run_after <= KEYSET_TS),
+                and_(AIJob.status == "running", AIJob.lease_expires_at < KEYSET_TS),
+            ),
+        )
+        .order_by(AIJob.run_after, AIJob.id)
+        .limit(8),
+    ),
+]
+
+
+def is_full_scan(detail: str) -> bool:
+    # "SCAN tabela" sem índice = leitura da tabela inteira
+    return detail.startswith("SCAN ") and " USING " not in detail
+
+
+def main() -> int:
+    tmp_dir = tempfile.mkdtemp(prefix="peai_plans_")
+    engine = create_sqlite_engine(os.path.join(tmp_dir, "plans.db"))
+    Base.metadata.create_all(bind=engine)
+
+    failures = 0
+    with engine.connect() as conn:
+        for endpoint, query in ENDPOINT_QUERIES:
+            compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+            plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").fetchall()
+            details = [row[3] for row in plan]
+            scans = [d for d in details if is_full_scan(d)]
+            if scans:
+                failures += 1
+                print(f"❌ {endpoint}")
+            else:
+                print(f"✅ {endpoint}")
+            for detail in details:
+                print(f"      {detail}")
+
+    engine.dispose()
+    print()
+    if failures:
+        print(f"❌ {failures} consulta(s) com full table scan")
+        return 1
+    print("✅ Nenhuma consulta faz full table scan")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
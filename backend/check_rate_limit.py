@@ -0,0 +1,167 @@
+"""
+Rajadas de chamadas ao Gemini contra um backend falso com cota
+
+Simula a turma inteira subindo materiais de uma vez: N chamadas simultâneas
+de llm_json_async contra um modelo falso que aplica uma cota de requisições
+por janela (429 com "retry in Xs", como a API) e devolve 503 de vez em quando.
+Sem limitador, parte das chamadas falha; com o gemini_rate_limiter configurado
+um pouco abaixo da cota, todas precisam passar. Confere também a leitura de
+retry-after e o caminho síncrono (llm_json). Sai com código 1 se algo falhar.
+Nenhuma chamada de rede é feita.
+
+Uso:
+    python check_rate_limit.py [--calls 40]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="peai_rl_"), "llm_cache.db"))
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+
+from google.api_core import exceptions as api_exceptions
+
+import ai
+from rate_limit import RateLimiter, retry_after
+
+QUOTA = 10  # requisições por janela no backend falso
+WINDOW = 1.0  # segundos (escala de tempo reduzida: a cota real é por minuto)
+LATENCY = 0.05
+
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeGeminiBackend:
+    """Quota-enforcing stand-in for the Gemini API (sliding window, 429 + 503)"""
+
+    def __init__(self, quota: int, window: float, fail_every: int = 0):
+        self.quota = quota
+        self.window = window
+        self.fail_every = fail_every
+        self.accepted = deque()
+        self.requests = 0
+        self.rejected_429 = 0
+        self.failed_503 = 0
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            while self.accepted and now - self.accepted[0] >= self.window:
+                self.accepted.popleft()
+            if len(self.accepted) >= self.quota:
+                self.rejected_429 += 1
+                wait = self.window - (now - self.accepted[0])
+                raise api_exceptions.ResourceExhausted(f"Quota exceeded. Please retry in {wait:.2f}s.")
+            if self.fail_every and self.requests % self.fail_every == 0:
+                self.failed_503 += 1
+                raise api_exceptions.ServiceUnavailable("The model is overloaded.")
+            self.accepted.append(now)
+
+    def model(self):
+        backend = self
+
+        class Model:
+            def generate_content(self, prompt):
+                backend._admit()
+                time.sleep(LATENCY)
+                return _Response(json.dumps({"ok": True}))
+
+            async def generate_content_async(self, prompt, stream=False):
+                backend._admit()
+                await asyncio.sleep(LATENCY)
+                return _Response(json.dumps({"ok": True}))
+
+        return Model()
+
+
+async def burst(calls: int) -> tuple:
+    results = await asyncio.gather(
+        *(ai.llm_json_async(f"material {i}", system="teste", use_cache=False) for i in range(calls)),
+        return_exceptions=True,
+    )
+    failed = [r for r in results if isinstance(r, Exception)]
+    return len(results) - len(failed), failed
+
+
+def run_scenario(label: str, calls: int, limiter: RateLimiter, backend: FakeGeminiBackend) -> bool:
+    ai.gemini_rate_limiter = limiter
+    ai.model_registry.get = lambda *args, **kwargs: backend.model()
+    start = time.perf_counter()
+    ok, failed = asyncio.run(burst(calls))
+    elapsed = time.perf_counter() - start
+    stats = limiter.stats()
+    print(f"{label:<28} {ok:>4}/{calls:<4} {elapsed:>7.2f}s  429={backend.rejected_429:<3} 503={backend.failed_503:<3} "
+          f"retries={stats['retries']:<3} throttled={stats['throttled']:<3} max_wait={stats['max_wait_seconds']:.2f}s")
+    return not failed
+
+
+def main_check():
+    parser = argparse.ArgumentParser(description="Rajadas contra backend falso com cota")
+    parser.add_argument("--calls", type=int, default=40)
+    args = parser.parse_args()
+    ok = True
+
+    print("\n" + "=" * 100)
+    print(f"🚦 RATE LIMIT - {args.calls} chamadas simultâneas, cota {QUOTA} req/{WINDOW:.0f}s")
+    print("=" * 100)
+
+    # Sem limitador e sem retry: a rajada estoura a cota
+    no_limit = RateLimiter(rpm=0, tpm=0, max_retries=0)
+    survived = run_scenario("sem limitador", args.calls, no_limit, FakeGeminiBackend(QUOTA, WINDOW))
+    if survived:
+        print("❌ A rajada deveria estourar a cota do backend falso")
+        ok = False
+
+    # Limitador a 90% da cota (na mesma escala de tempo): a rajada é espaçada
+    rpm = QUOTA * 0.9 * 60 / WINDOW
+    limited = RateLimiter(rpm=rpm, tpm=0, retry_base=0.05, retry_max=1.0, window_seconds=WINDOW)
+    if not run_scenario("com limitador", args.calls, limited, FakeGeminiBackend(QUOTA, WINDOW)):
+        print("❌ Chamadas falharam mesmo com o limitador")
+        ok = False
+
+    # Backend instável: 503 a cada 7 requisições, cota apertada -> retry com backoff
+    flaky = RateLimiter(rpm=QUOTA * 2 * 60 / WINDOW, tpm=0, retry_base=0.05, retry_max=1.0, max_retries=6, window_seconds=WINDOW)
+    if not run_scenario("limitador + 429/503", args.calls, flaky, FakeGeminiBackend(QUOTA, WINDOW, fail_every=7)):
+        print("❌ Retries não absorveram os 429/503")
+        ok = False
+    elif flaky.stats()["retries"] == 0:
+        print("❌ Esperava retries no cenário instável")
+        ok = False
+
+    # Caminho síncrono (llm_json) com o mesmo limitador
+    ai.gemini_rate_limiter = RateLimiter(rpm=rpm, tpm=0, retry_base=0.05, retry_max=1.0, window_seconds=WINDOW)
+    sync_backend = FakeGeminiBackend(QUOTA, WINDOW, fail_every=5)
+    ai.model_registry.get = lambda *args, **kwargs: sync_backend.model()
+    try:
+        for i in range(12):
+            ai.llm_json(f"sync {i}", system="teste", use_cache=False)
+        print(f"{'llm_json síncrono':<28}   12/12   retries={ai.gemini_rate_limiter.stats()['retries']}")
+    except Exception as e:
+        print(f"❌ llm_json síncrono falhou: {e}")
+        ok = False
+
+    hint = retry_after(api_exceptions.ResourceExhausted("Quota exceeded. Please retry in 12.5s."))
+    if hint != 12.5:
+        print(f"❌ retry-after lido errado: {hint}")
+        ok = False
+    print("=" * 100)
+
+    if not ok:
+        sys.exit(1)
+    print("✅ Rajadas espaçadas pelo limitador e 429/5xx absorvidos por retry\n")
+
+
+if __name__ == "__main__":
+    main_check()
@@ -0,0 +1,230 @@
+"""
+Saída estruturada dos agentes: tamanho dos prompts e consistência dos schemas
+
+Monta os prompts do PEIGeneratorAgent e do MaterialAdapterAgent com os dados
+de exemplo nos dois formatos: o antigo (SCHEMA de exemplo no prompt, entradas
+com indent=2) e o estruturado (response_schema nativo, entradas compactas).
+Mostra os tokens estimados de cada um. O schema nativo também é entrada; ele
+aparece à parte, medido como JSON compacto (estimativa conservadora).
+
+Confere ainda que:
+- os schemas Pydantic (llm_schemas.py) viram protos.Schema do SDK;
+- o JSON de exemplo de cada SCHEMA valida contra o modelo correspondente;
+- llm_json_async manda o generation_config e conta as falhas de parse.
+
+Com --count-tokens e GOOGLE_API_KEY, os tokens dos prompts vêm de
+model.count_tokens em vez da estimativa. Sem essa opção nenhuma chamada de
+rede é feita. Sai com código 1 se algo falhar.
+
+Uso:
+    python check_structured_output.py [--count-tokens]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(tempfile.mkdtemp(prefix="peai_so_"), "llm_cache.db"))
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+
+from google.generativeai.types import generation_types
+
+import ai
+from ai import MaterialAdapterAgent, PEIGeneratorAgent, ProfessionalResponse, StudentInfo
+from llm_schemas import MaterialAdaptationOutput, PEIOutput, gemini_schema, structured_output_stats
+
+STUDENT = StudentInfo(
+    name="Pedro Oliveira",
+    birth_date="15/03/2010",
+    grade="9º Ano",
+    special_needs=["TEA (Nível 1)", "TDAH"],
+    has_diagnosis=True,
+)
+
+RESPONSES = [
+    ProfessionalResponse(
+        professional_id="prof_001",
+        professional_type="psicologo",
+        professional_name="Ana Costa",
+        responses={
+            "cognitive_development": "Pedro apresenta QI na média (95), com pico em raciocínio espacial. Dificuldade com abstrações.",
+            "attention_concentration": "Mantém foco por 15-20 minutos. Atividades manipuláveis estendem para 30-35 min.",
+            "learning_style": "Visual e cinestésico. Responde bem a diagramas e experimentos práticos.",
+        },
+        timestamp="2025-03-01T10:00:00",
+    ),
+    ProfessionalResponse(
+        professional_id="prof_002",
+        professional_type="professor",
+        professional_name="Roberto Lima",
+        responses={
+            "classroom_performance": "Excelente em matemática quando usa recursos visuais. Dificuldade com interpretação de texto.",
+            "social_interaction": "Prefere trabalhar individualmente, mas aceita grupos pequenos (2-3 alunos).",
+            "strategies_that_work": "Mapas mentais, exemplos práticos, divisão de tarefas em etapas.",
+        },
+        timestamp="2025-03-02T10:00:00",
+    ),
+    ProfessionalResponse(
+        professional_id="prof_003",
+        professional_type="responsavel",
+        professional_name="Márcia Oliveira",
+        responses={
+            "home_behavior": "Organizado quando tem checklist visual. Ansioso antes de provas.",
+            "interests": "Astronomia, jogos de lógica, tecnologia.",
+            "challenges": "Barulho o deixa muito irritado. Precisa de rotina estruturada.",
+        },
+        timestamp="2025-03-03T10:00:00",
+    ),
+]
+
+MATERIAL = """
+Equações do 2º Grau
+
+Uma equação do segundo grau é toda equação da forma ax² + bx + c = 0,
+onde a, b e c são números reais e a ≠ 0.
+
+Para resolver essas equações, utilizamos a fórmula de Bhaskara:
+x = (-b ± √(b²-4ac)) / 2a
+
+Exemplo: x² - 5x + 6 = 0
+a=1, b=-5, c=6
+Δ = 25 - 24 = 1
+x' = 3, x'' = 2
+"""
+
+MATERIAL_METADATA = {"title": "Equações do 2º Grau - Teoria", "subject": "Matemática", "grade": "9º Ano"}
+
+
+def _first_option(value):
+    """'teórico|prático|misto' -> 'teórico' (os exemplos listam as opções dos enums)"""
+    if isinstance(value, dict):
+        return {key: _first_option(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_first_option(item) for item in value]
+    return value.split("|")[0] if isinstance(value, str) else value
+
+
+def _schema_example(schema_text: str) -> dict:
+    return _first_option(json.loads(schema_text[schema_text.index("{"):schema_text.rindex("}") + 1]))
+
+
+PEI_EXAMPLE = _schema_example(PEIGeneratorAgent.SCHEMA)
+PEI_DOCUMENT = PEIGeneratorAgent.to_document(PEI_EXAMPLE)
+MATERIAL_EXAMPLE = _schema_example(MaterialAdapterAgent.SCHEMA)
+
+
+def _schema_chars(schema) -> int:
+    return len(json.dumps(gemini_schema(schema), ensure_ascii=False, separators=(",", ":")))
+
+
+def prompt_sizes(count_tokens: bool) -> bool:
+    cases = [
+        ("PEI", PEIOutput, lambda structured: PEIGeneratorAgent.build_prompt(STUDENT, RESPONSES, structured=structured),
+         PEIGeneratorAgent.SYSTEM_INSTRUCTION),
+        ("Material", MaterialAdaptationOutput,
+         lambda structured: MaterialAdapterAgent.build_prompt(MATERIAL, MATERIAL_METADATA, PEI_DOCUMENT, structured=structured),
+         MaterialAdapterAgent.SYSTEM_INSTRUCTION),
+    ]
+    unit = "tokens" if count_tokens else "tokens estimados (~4 caracteres por token)"
+    print(f"{'agente':<10} {'antigo':>8} {'novo':>8} {'schema':>8} {'prompt':>8} {'líquido':>8}")
+    ok = True
+    for label, schema, build, system in cases:
+        legacy = ai._json_prompt(build(False))
+        structured = build(True)
+        if count_tokens:
+            model = ai.model_registry.get(system)
+            legacy_tokens = model.count_tokens(legacy).total_tokens
+            structured_tokens = model.count_tokens(structured).total_tokens
+            schema_tokens = model.count_tokens(json.dumps(gemini_schema(schema), ensure_ascii=False)).total_tokens
+        else:
+            legacy_tokens = len(legacy) // 4
+            structured_tokens = len(structured) // 4
+            schema_tokens = _schema_chars(schema) // 4
+        prompt_saved = 1 - structured_tokens / legacy_tokens
+        net_saved = 1 - (structured_tokens + schema_tokens) / legacy_tokens
+        print(f"{label:<10} {legacy_tokens:>8} {structured_tokens:>8} {schema_tokens:>8} {prompt_saved:>8.0%} {net_saved:>8.0%}")
+        if structured_tokens >= legacy_tokens:
+            print(f"❌ {label}: o prompt estruturado não ficou menor")
+            ok = False
+        if net_saved < 0:
+            print(f"❌ {label}: prompt + schema ficaram maiores que o prompt antigo")
+            ok = False
+    print(f"   ({unit})")
+    return ok
+
+
+def schemas_consistent() -> bool:
+    ok = True
+    for schema, example in ((PEIOutput, PEI_EXAMPLE), (MaterialAdaptationOutput, MATERIAL_EXAMPLE)):
+        try:
+            config = generation_types.to_generation_config_dict({
+                "response_mime_type": "application/json",
+                "response_schema": gemini_schema(schema),
+            })
+            fields = len(config["response_schema"].properties)
+            schema.model_validate(example)
+            print(f"✅ {schema.__name__}: protos.Schema com {fields} campos; exemplo do SCHEMA válido")
+        except Exception as e:
+            print(f"❌ {schema.__name__}: {e}")
+            ok = False
+    return ok
+
+
+async def parse_path() -> bool:
+    """llm_json_async com um modelo falso: schema enviado, resposta validada, falhas contadas"""
+    seen_configs = []
+    replies = [json.dumps(MATERIAL_EXAMPLE, ensure_ascii=False), '{"original_analysis": {"content_type": ']
+
+    class _Response:
+        def __init__(self, text: str):
+            self.text = text
+            self.usage_metadata = None
+
+    class Model:
+        async def generate_content_async(self, prompt, stream=False, generation_config=None):
+            seen_configs.append(generation_config)
+            return _Response(replies.pop(0))
+
+    ai.model_registry.get = lambda *args, **kwargs: Model()
+    prompt = MaterialAdapterAgent.build_prompt(MATERIAL, MATERIAL_METADATA, PEI_DOCUMENT)
+    kwargs = dict(system=MaterialAdapterAgent.SYSTEM_INSTRUCTION, use_cache=False, response_schema=MaterialAdaptationOutput)
+    result = await ai.llm_json_async(prompt, **kwargs)
+    try:
+        await ai.llm_json_async(prompt, **kwargs)
+        truncated_failed = False
+    except ValueError:
+        truncated_failed = True
+
+    stats = structured_output_stats.stats()["MaterialAdaptationOutput"]
+    ok = (
+        result == MATERIAL_EXAMPLE
+        and truncated_failed
+        and all(config and config.get("response_mime_type") == "application/json" for config in seen_configs)
+        and stats["calls"] == 2 and stats["parse_failures"] == 1
+    )
+    print(f"{'✅' if ok else '❌'} llm_json_async: generation_config enviado, "
+          f"parse_failures={stats['parse_failures']}/{stats['calls']}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Saída estruturada: prompts e schemas dos agentes")
+    parser.add_argument("--count-tokens", action="store_true", help="contar tokens com a API (requer GOOGLE_API_KEY)")
+    args = parser.parse_args()
+
+    if not ai.LLM_STRUCTURED_OUTPUT:
+        print("⚠️ LLM_STRUCTURED_OUTPUT=0: os agentes estão usando o prompt antigo")
+
+    print("\n📏 Tamanho dos prompts\n")
+    ok = prompt_sizes(args.count_tokens)
+    print("\n🧩 Schemas\n")
+    ok = schemas_consistent() and ok
+    ok = asyncio.run(parse_path()) and ok
+    print("\nEm produção: GET /api/ai/stats → structured_output (economia estimada e taxa de falhas de parse)")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
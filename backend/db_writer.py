@@ -0,0 +1,142 @@
+"""
+Escritor único do banco (group commit)
+
+O SQLite serializa escritores: quando vários requests e tarefas em background
+fazem commit ao mesmo tempo, eles disputam o lock e acabam em retries.
+Aqui todas as escritas viram unidades de trabalho numa fila; uma thread
+dedicada aplica várias unidades numa mesma transação e faz um único commit.
+
+Cada unidade é uma função que recebe a sessão do escritor e roda dentro de
+um SAVEPOINT próprio, então a falha de uma unidade não derruba as outras
+do mesmo lote. O chamador recebe um Future (ou await via `run`).
+"""
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import create_database_engine
+
+WorkUnit = Callable[[Session], Any]
+
+
+class DatabaseWriter:
+    """Applies queued units of work in batched transactions on one thread"""
+
+    def __init__(self, bind, max_batch_size: int = 64, max_batch_delay: float = 0.0):
+        # expire_on_commit=False: objetos retornados continuam legíveis após o commit
+        self._session_factory = sessionmaker(bind=bind, autoflush=False, expire_on_commit=False)
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self._queue: "queue.Queue[Tuple[WorkUnit, Future] | None]" = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.stats = {"units": 0, "batches": 0, "commits": 0, "failed_units": 0}
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        with self._lock:
+            if not self._thread:
+                return
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, work: WorkUnit) -> Future:
+        """Queue a unit of work; the future resolves with its return value after commit"""
+        self.start()
+        future: Future = Future()
+        self._queue.put((work, future))
+        return future
+
+    def execute(self, work: WorkUnit) -> Any:
+        """Submit and block until the unit is committed (for sync code)"""
+        return self.submit(work).result()
+
+    async def run(self, work: WorkUnit) -> Any:
+        """Submit and await the committed result (for async endpoints)"""
+        return await asyncio.wrap_future(self.submit(work))
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            # Junta no mesmo commit tudo o que acumulou enquanto o lote anterior
+            # era gravado (e, se configurado, o que chegar em max_batch_delay)
+            while len(batch) < self.max_batch_size:
+                try:
+                    if self.max_batch_delay > 0:
+                        item = self._queue.get(timeout=self.max_batch_delay)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._apply_batch(batch)
+            if stopping:
+                return
+
+    def _apply_batch(self, batch: List[Tuple[WorkUnit, Future]]):
+        session = self._session_factory()
+        results = []
+        try:
+            for work, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                savepoint = session.begin_nested()
+                try:
+                    value = work(session)
+                    session.flush()
+                    savepoint.commit()
+                    results.append((future, value, None))
+                except Exception as e:
+                    savepoint.rollback()
+                    results.append((future, None, e))
+
+            session.commit()
+            self.stats["commits"] += 1
+        except Exception as commit_error:
+            session.rollback()
+            # Commit falhou: nenhuma unidade do lote foi persistida
+            applied = {id(future) for future, _, _ in results}
+            results = [
+                (future, None, error or commit_error)
+                for future, _, error in results
+            ] + [
+                (future, None, commit_error)
+                for _, future in batch
+                if id(future) not in applied and future.running()
+            ]
+        finally:
+            session.close()
+
+        self.stats["batches"] += 1
+        for future, value, error in results:
+            self.stats["units"] += 1
+            if error is not None:
+                self.stats["failed_units"] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(value)
+
+
+# Engine próprio do escritor: no SQLite, BEGIN IMMEDIATE pega o lock de escrita
+# logo no início do lote (sem upgrade de leitura para escrita no meio da
+# transação); no PostgreSQL basta uma conexão, já que só esta thread escreve
+writer_engine = create_database_engine(begin_mode="IMMEDIATE", pool_size=1)
+writer = DatabaseWriter(writer_engine)
@@ -0,0 +1,133 @@
+"""
+Progresso das gerações de IA (tabela generation_events) servido por SSE
+
+Enquanto o LLM responde em streaming, cada seção que fica pronta (ver
+json_stream.py) vira uma linha em generation_events, gravada pelo db_writer.
+Os endpoints /events fazem polling dessa tabela e repassam as linhas como
+Server-Sent Events, então funcionam mesmo com os workers em outro processo
+(ai_worker.py). O cliente pode reconectar com Last-Event-ID.
+
+Uma execução começa com 'queued' (gravado junto com o job) e termina com
+'done' ou 'error'; ao enfileirar uma nova, os eventos das anteriores já
+terminadas são apagados.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal, GenerationEvent
+from db_writer import writer
+
+GENERATION_SSE_POLL_SECONDS = float(os.getenv("GENERATION_SSE_POLL_SECONDS", "0.5"))
+GENERATION_SSE_KEEPALIVE_SECONDS = 15.0
+GENERATION_SSE_MAX_SECONDS = float(os.getenv("GENERATION_SSE_MAX_SECONDS", "600"))
+
+TERMINAL_EVENTS = ('done', 'error')
+
+
+def _for_target(target_kind: str, target_id: str):
+    return (GenerationEvent.target_kind == target_kind, GenerationEvent.target_id == target_id)
+
+
+def add_event(
+    session: Session,
+    target_kind: str,
+    target_id: str,
+    event: str,
+    name: Optional[str] = None,
+    payload: Any = None,
+):
+    session.add(GenerationEvent(
+        target_kind=target_kind,
+        target_id=target_id,
+        event=event,
+        name=name,
+        payload=json.dumps(payload, ensure_ascii=False) if payload is not None else None,
+    ))
+
+
+def start_run(session: Session, target_kind: str, target_id: str):
+    """Mark a new generation as queued, dropping finished runs (inside the caller's writer unit)"""
+    last_terminal = session.scalar(
+        select(func.max(GenerationEvent.id)).where(
+            *_for_target(target_kind, target_id), GenerationEvent.event.in_(TERMINAL_EVENTS)
+        )
+    )
+    if last_terminal is not None:
+        session.execute(
+            delete(GenerationEvent).where(*_for_target(target_kind, target_id), GenerationEvent.id <= last_terminal)
+        )
+    add_event(session, target_kind, target_id, 'queued')
+
+
+def record_event(target_kind: str, target_id: str, event: str, name: Optional[str] = None, payload: Any = None):
+    """Write one event through the single writer (sync code, e.g. on_give_up callbacks)"""
+    writer.execute(lambda session: add_event(session, target_kind, target_id, event, name, payload))
+
+
+class GenerationRecorder:
+    """Events of one generation run, written from the async job handlers"""
+
+    def __init__(self, target_kind: str, target_id: str):
+        self.target_kind = target_kind
+        self.target_id = target_id
+        self.sections = 0
+
+    async def emit(self, event: str, name: Optional[str] = None, payload: Any = None):
+        await writer.run(lambda session: add_event(session, self.target_kind, self.target_id, event, name, payload))
+
+    async def section(self, name: str, value: Any):
+        """on_section callback for the streaming agents"""
+        self.sections += 1
+        await self.emit('section', name, value)
+
+
+def format_sse(event_id: int, event: str, data: dict) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_events(target_kind: str, target_id: str, last_event_id: Optional[int] = None) -> AsyncIterator[str]:
+    """SSE body: events of the latest run (or after Last-Event-ID) until 'done'/'error'"""
+    async with AsyncSessionLocal() as session:
+        if last_event_id is None:
+            # Sem Last-Event-ID: desde o início da execução mais recente
+            queued = await session.scalar(
+                select(func.max(GenerationEvent.id)).where(
+                    *_for_target(target_kind, target_id), GenerationEvent.event == 'queued'
+                )
+            )
+            last_event_id = queued - 1 if queued is not None else 0
+
+    yield f"retry: {int(GENERATION_SSE_POLL_SECONDS * 4000)}\n\n"
+    started = last_activity = time.monotonic()
+    while time.monotonic() - started < GENERATION_SSE_MAX_SECONDS:
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                select(GenerationEvent)
+                .where(*_for_target(target_kind, target_id), GenerationEvent.id > last_event_id)
+                .order_by(GenerationEvent.id)
+                .limit(100)
+            )).scalars().all()
+
+        for row in rows:
+            last_event_id = row.id
+            yield format_sse(row.id, row.event, {
+                "name": row.name,
+                "payload": json.loads(row.payload) if row.payload is not None else None,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+            })
+            if row.event in TERMINAL_EVENTS:
+                return
+
+        if rows:
+            last_activity = time.monotonic()
+        else:
+            if time.monotonic() - last_activity >= GENERATION_SSE_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_activity = time.monotonic()
+            await asyncio.sleep(GENERATION_SSE_POLL_SECONDS)
@@ -0,0 +1,131 @@
+"""
+Parser incremental do JSON que o LLM devolve em streaming
+
+O Gemini manda a resposta em pedaços; em vez de esperar o JSON inteiro, o
+parser acompanha a estrutura caractere a caractere e entrega cada seção de
+primeiro nível (`strengths`, `detailed_report`, ...) assim que ela fecha.
+Itens de arrays aninhados também podem ser entregues um a um
+(ex.: `adapted_content_structure.blocks`), já que uma seção grande como
+`adapted_content_structure` só fecharia no fim da resposta.
+
+Texto antes do primeiro `{` (ex.: ```json) é ignorado, como em _clean_json_text.
+"""
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+# (nome, valor): "strengths" ou "adapted_content_structure.blocks[0]"
+Section = Tuple[str, Any]
+
+
+class _Frame:
+    __slots__ = ("kind", "start", "key", "index", "expect_key")
+
+    def __init__(self, kind: str, start: int):
+        self.kind = kind  # 'object' | 'array'
+        self.start = start
+        self.key: Optional[str] = None
+        self.index = -1
+        self.expect_key = kind == "object"
+
+
+class IncrementalJSONParser:
+    """
+    Feed text chunks with `feed`; each call returns the sections completed by
+    that chunk. `item_paths` lists key paths of arrays whose elements should
+    be emitted individually, e.g. [("adapted_content_structure", "blocks")].
+    """
+
+    def __init__(self, item_paths: Sequence[Sequence[str]] = ()):
+        self.item_paths = {tuple(path) for path in item_paths}
+        self.text = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._started = False
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._scalar_start: Optional[int] = None
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def feed(self, chunk: str) -> List[Section]:
+        self.text += chunk
+        completed: List[Section] = []
+        text = self.text
+        pos = self._pos
+        while pos < len(text) and not self._done:
+            ch = text[pos]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append(_Frame("object", pos))
+                pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if frame.kind == "object" and frame.expect_key:
+                        frame.key = json.loads(text[self._string_start:pos + 1])
+                        frame.expect_key = False
+                    else:
+                        self._value_done(self._string_start, pos + 1, completed)
+                pos += 1
+                continue
+
+            if self._scalar_start is not None:
+                if ch in ",}] \t\r\n":
+                    self._value_done(self._scalar_start, pos, completed)
+                    self._scalar_start = None
+                else:
+                    pos += 1
+                    continue
+
+            frame = self._stack[-1]
+            if ch == '"':
+                self._in_string = True
+                self._string_start = pos
+                if not (frame.kind == "object" and frame.expect_key):
+                    self._begin_value(frame)
+            elif ch in "{[":
+                self._begin_value(frame)
+                self._stack.append(_Frame("object" if ch == "{" else "array", pos))
+            elif ch in "}]":
+                closed = self._stack.pop()
+                if not self._stack:
+                    self._done = True
+                else:
+                    self._value_done(closed.start, pos + 1, completed)
+            elif ch == ",":
+                if frame.kind == "object":
+                    frame.expect_key = True
+            elif ch not in ": \t\r\n":
+                self._begin_value(frame)
+                self._scalar_start = pos
+            pos += 1
+        self._pos = pos
+        return completed
+
+    def _begin_value(self, frame: _Frame):
+        if frame.kind == "array":
+            frame.index += 1
+
+    def _path(self) -> Tuple[str, ...]:
+        return tuple(frame.key for frame in self._stack if frame.kind == "object")
+
+    def _value_done(self, start: int, end: int, completed: List[Section]):
+        parent = self._stack[-1]
+        depth = len(self._stack)
+        if depth == 1 and parent.key is not None:
+            completed.append((parent.key, json.loads(self.text[start:end])))
+        elif parent.kind == "array" and self._path() in self.item_paths and self._stack[-2].kind == "object":
+            name = ".".join(self._path()) + f"[{parent.index}]"
+            completed.append((name, json.loads(self.text[start:end])))
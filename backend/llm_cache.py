@@ -0,0 +1,178 @@
+"""
+Cache persistente das respostas do LLM (SQLite)
+
+Reprocessar um PEI ou adaptar de novo o mesmo material com o PEI inalterado
+gera exatamente o mesmo prompt; em vez de pagar outra chamada ao Gemini, a
+resposta (já parseada) é devolvida do cache em milissegundos.
+
+A chave é o sha256 de modelo + system instruction + prompt (+ response_schema,
+quando a chamada usa saída estruturada). As entradas expiram após
+LLM_CACHE_TTL_SECONDS e, quando o arquivo passa de LLM_CACHE_MAX_BYTES, as
+menos usadas recentemente são removidas (LRU).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(BASE_DIR, "llm_cache.db"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") not in ("0", "false", "False")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Eviction por tamanho roda a cada N gravações (SUM(size) não é de graça)
+_EVICT_EVERY = 32
+
+
+def cache_key(model: str, system: str, prompt: str, schema: str = "") -> str:
+    digest = hashlib.sha256()
+    # schema (response_schema nativo) só entra quando existe: chaves antigas continuam válidas
+    for part in (model, system, prompt) + ((schema,) if schema else ()):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """Content-addressed response cache with TTL and size-bounded LRU eviction"""
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        enabled: bool = LLM_CACHE_ENABLED,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Aberto sob demanda: importar ai.py não cria o arquivo
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+        return json.loads(response)
+
+    def put(self, key: str, model: str, value: Any):
+        if not self.enabled:
+            return
+        response = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            conn.commit()
+            self.stores += 1
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._evict(conn, now)
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under max_bytes"""
+        with self._lock:
+            self._evict(self._connection(), time.time())
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        self.expired += conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total > self.max_bytes:
+            # Remove as menos usadas até ficar em 90% do limite
+            target = total - int(self.max_bytes * 0.9)
+            freed = 0
+            victims = []
+            for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access"):
+                victims.append((key,))
+                freed += size
+                if freed >= target:
+                    break
+            conn.executemany("DELETE FROM llm_cache WHERE key = ?", victims)
+            self.evictions += len(victims)
+        conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM llm_cache")
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries, size = (0, 0)
+            if self.enabled:
+                entries, size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+                ).fetchone()
+            return {
+                "enabled": self.enabled,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+
+llm_cache = LLMCache()
@@ -0,0 +1,473 @@
+"""
+Providers de LLM: Gemini, fake determinístico e gravação/replay
+
+Os agentes (ai.py) não falam com google.generativeai diretamente: pedem um
+modelo ao provider ativo (LLM_PROVIDER) e chamam generate_content /
+generate_content_async nele, com a mesma interface do GenerativeModel.
+
+- gemini: o comportamento de sempre (GenerativeModel reaproveitados por system instruction)
+- fake: sem rede nem chave; gera JSON válido para o response_schema pedido,
+  determinístico por prompt, com latência configurável (LLM_FAKE_LATENCY_SECONDS,
+  mais LLM_FAKE_SECONDS_PER_1K_INPUT_TOKENS / _OUTPUT_TOKENS pelo tamanho do prompt e da saída)
+- record: chama o Gemini e grava cada resposta como fixture em LLM_FIXTURES_DIR
+- replay: devolve as fixtures gravadas; prompt sem fixture é erro
+
+Com fake/replay dá para rodar o pipeline inteiro (e os benchmarks) sem
+GOOGLE_API_KEY e sem gastar cota.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from llm_cache import cache_key
+from llm_schemas import INLINE_SCHEMA_HINT, gemini_schema
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+LLM_FAKE_LATENCY_SECONDS = float(os.getenv("LLM_FAKE_LATENCY_SECONDS", "1.0"))
+# Tempo de decodificação simulado: a latência real cresce com o tamanho da resposta
+LLM_FAKE_SECONDS_PER_1K_OUTPUT_TOKENS = float(os.getenv("LLM_FAKE_SECONDS_PER_1K_OUTPUT_TOKENS", "0"))
+# ... e a leitura do prompt (prefill), bem mais barata por token
+LLM_FAKE_SECONDS_PER_1K_INPUT_TOKENS = float(os.getenv("LLM_FAKE_SECONDS_PER_1K_INPUT_TOKENS", "0"))
+LLM_FIXTURES_DIR = os.getenv("LLM_FIXTURES_DIR", os.path.join(BASE_DIR, "llm_fixtures"))
+# replay: 1 = espera a latência gravada (benchmarks realistas); 0 = responde na hora
+LLM_REPLAY_REALTIME = os.getenv("LLM_REPLAY_REALTIME", "0") not in ("0", "false", "False")
+
+# Pedaços do streaming simulado (fake/replay)
+_STREAM_CHUNKS = 8
+
+
+def _response(text: str, prompt_tokens: Optional[int] = None, total_tokens: Optional[int] = None):
+    """Response-like object: what ai.py reads from a GenerateContentResponse"""
+    usage = SimpleNamespace(prompt_token_count=prompt_tokens, total_token_count=total_tokens)
+    return SimpleNamespace(text=text, usage_metadata=usage)
+
+
+def _split(text: str, parts: int = _STREAM_CHUNKS) -> List[str]:
+    size = max(1, -(-len(text) // parts))
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _schema_of(generation_config: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    schema = (generation_config or {}).get("response_schema")
+    if schema is None or isinstance(schema, dict):
+        return schema
+    # protos.Schema (ai._generation_config já converteu)
+    return type(schema).to_dict(schema, use_integers_for_enums=False, preserving_proto_field_name=True)
+
+
+def _inline_schema(prompt: str) -> Optional[Dict[str, Any]]:
+    """Schema written in the prompt by llm_schemas.inline_schema_hint (call without response_schema)"""
+    start = prompt.find(INLINE_SCHEMA_HINT)
+    start = prompt.find("{", start) if start >= 0 else -1
+    if start < 0:
+        return None
+    try:
+        schema, _ = json.JSONDecoder().raw_decode(prompt, start)
+    except ValueError:
+        return None
+    return schema if isinstance(schema, dict) and "properties" in schema else None
+
+
+class LLMProvider(ABC):
+    """Interface: model(system_instruction) returns an object with generate_content(_async)"""
+
+    name = "base"
+    model_name = GEMINI_MODEL
+
+    @abstractmethod
+    def model(self, system_instruction: str):
+        """Model object for this system instruction (same interface as GenerativeModel)"""
+
+    def warm(self, system_instructions: List[str]):
+        """Prepare the models up front (Gemini raises without GOOGLE_API_KEY)"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"provider": self.name, "model": self.model_name}
+
+
+# =====================================================
+# Gemini
+# =====================================================
+
+
+class ModelRegistry:
+    """
+    Lazily configured, thread-safe registry of GenerativeModel instances,
+    one per (model name, system instruction), shared by all worker threads.
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+        self._configured = False
+
+    def _configure(self):
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise RuntimeError("Defina GOOGLE_API_KEY no seu .env")
+        genai.configure(api_key=api_key)
+        self._configured = True
+
+    def get(self, system_instruction: str, model_name: Optional[str] = None):
+        key = (model_name or GEMINI_MODEL, system_instruction)
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    if not self._configured:
+                        self._configure()
+                    model = genai.GenerativeModel(model_name=key[0], system_instruction=system_instruction)
+                    self._models[key] = model
+        return model
+
+    def warm(self, system_instructions: List[str]):
+        """Configure the SDK and build the models up front (raises without GOOGLE_API_KEY)"""
+        for system_instruction in system_instructions:
+            self.get(system_instruction)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._configured = False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"configured": self._configured, "models": len(self._models)}
+
+
+model_registry = ModelRegistry()
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, registry: ModelRegistry = model_registry):
+        self.registry = registry
+
+    def model(self, system_instruction: str):
+        return self.registry.get(system_instruction)
+
+    def warm(self, system_instructions: List[str]):
+        self.registry.warm(system_instructions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), **self.registry.stats()}
+
+
+# =====================================================
+# Fake determinístico
+# =====================================================
+
+
+class _FakeValues:
+    """Schema-valid values derived from a seed (same prompt -> same JSON)"""
+
+    def __init__(self, seed: str):
+        self.random = random.Random(seed)
+
+    def build(self, node: Dict[str, Any], name: str = "") -> Any:
+        kind = str(node.get("type") or node.get("type_") or "string").lower()
+        if node.get("enum"):
+            return self.random.choice(list(node["enum"]))
+        if kind == "object":
+            return {key: self.build(value, key) for key, value in (node.get("properties") or {}).items()}
+        if kind == "array":
+            items = node.get("items") or {"type": "string"}
+            values = [self.build(items, name) for _ in range(self.random.randint(2, 4))]
+            for number, value in enumerate(values, start=1):
+                if isinstance(value, dict) and "block_number" in value:
+                    value["block_number"] = number
+            return values
+        if kind == "integer":
+            return self._integer(name)
+        if kind == "number":
+            return round(self._integer(name) + self.random.random(), 2)
+        if kind == "boolean":
+            return self.random.random() < 0.5
+        return self._text(name)
+
+    def _integer(self, name: str) -> int:
+        if "score" in name:
+            return self.random.randint(70, 98)
+        if name == "age":
+            return self.random.randint(6, 17)
+        if "time" in name or "minutes" in name:
+            return self.random.choice([10, 15, 20, 30, 50])
+        return self.random.randint(1, 40)
+
+    def _text(self, name: str) -> str:
+        if "date" in name:
+            return f"{self.random.randint(1, 28):02d}/{self.random.randint(1, 12):02d}/{self.random.randint(2008, 2018)}"
+        label = name.replace("_", " ") or "item"
+        return f"{label.capitalize()} {self.random.randint(1, 999)}: texto gerado pelo provider fake."
+
+
+class FakeModel:
+    def __init__(self, provider: "FakeProvider", system_instruction: str):
+        self.provider = provider
+        self.system_instruction = system_instruction
+
+    def _reply(self, prompt: str, generation_config: Optional[Dict[str, Any]]) -> Tuple[str, int, int, float]:
+        # Schema registrado primeiro (o map do protos.Schema perde a ordem dos campos),
+        # se for o mesmo pedido: o PEI por seções manda schemas menores com o mesmo system.
+        # Sem response_schema vale o schema escrito no prompt (seção, personalização);
+        # o registrado só quando o prompt não traz nenhum (PEI inteiro, adaptação completa)
+        requested = _schema_of(generation_config) or _inline_schema(prompt)
+        registered = self.provider.schema_for(self.system_instruction)
+        same = registered and (requested is None or set(requested.get("properties", {})) == set(registered["properties"]))
+        schema = registered if same else requested
+        seed = hashlib.sha256(f"{self.system_instruction}\0{prompt}".encode("utf-8")).hexdigest()
+        value = _FakeValues(seed).build(schema) if schema else {"ok": True}
+        text = json.dumps(value, ensure_ascii=False)
+        prompt_tokens = (len(self.system_instruction) + len(prompt)) // 4
+        with self.provider._lock:
+            self.provider.calls += 1
+        latency = (
+            self.provider.latency
+            + prompt_tokens / 1000 * self.provider.seconds_per_1k_input_tokens
+            + len(text) / 4000 * self.provider.seconds_per_1k_output_tokens
+        )
+        return text, prompt_tokens, prompt_tokens + len(text) // 4, latency
+
+    def generate_content(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None, **kwargs):
+        text, prompt_tokens, total_tokens, latency = self._reply(prompt, generation_config)
+        time.sleep(latency)
+        return _response(text, prompt_tokens, total_tokens)
+
+    async def generate_content_async(
+        self, prompt: str, stream: bool = False, generation_config: Optional[Dict[str, Any]] = None, **kwargs
+    ):
+        text, prompt_tokens, total_tokens, latency = self._reply(prompt, generation_config)
+        if not stream:
+            await asyncio.sleep(latency)
+            return _response(text, prompt_tokens, total_tokens)
+        return self._stream(text, prompt_tokens, total_tokens, latency)
+
+    async def _stream(self, text: str, prompt_tokens: int, total_tokens: int, latency: float) -> AsyncIterator[Any]:
+        pieces = _split(text)
+        for index, piece in enumerate(pieces):
+            await asyncio.sleep(latency / len(pieces))
+            last = index == len(pieces) - 1
+            yield _response(piece, prompt_tokens, total_tokens if last else None)
+
+
+class FakeProvider(LLMProvider):
+    """
+    Offline provider: schema-valid JSON for the requested response_schema
+    (or the agent's schema registered in `schemas`), after `latency` seconds.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: float = LLM_FAKE_LATENCY_SECONDS,
+        schemas: Optional[Dict[str, Type[BaseModel]]] = None,
+        seconds_per_1k_output_tokens: float = LLM_FAKE_SECONDS_PER_1K_OUTPUT_TOKENS,
+        seconds_per_1k_input_tokens: float = LLM_FAKE_SECONDS_PER_1K_INPUT_TOKENS,
+    ):
+        self.latency = latency
+        self.seconds_per_1k_output_tokens = seconds_per_1k_output_tokens
+        self.seconds_per_1k_input_tokens = seconds_per_1k_input_tokens
+        self.schemas = dict(schemas or {})
+        self.model_name = f"fake:{GEMINI_MODEL}"  # não mistura com respostas reais no llm_cache
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def schema_for(self, system_instruction: str) -> Optional[Dict[str, Any]]:
+        schema = self.schemas.get(system_instruction)
+        return gemini_schema(schema) if schema is not None else None
+
+    def model(self, system_instruction: str):
+        return FakeModel(self, system_instruction)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "latency_seconds": self.latency,
+            "seconds_per_1k_input_tokens": self.seconds_per_1k_input_tokens,
+            "seconds_per_1k_output_tokens": self.seconds_per_1k_output_tokens,
+            "calls": self.calls,
+        }
+
+
+# =====================================================
+# Gravação / replay
+# =====================================================
+
+
+class FixtureNotFoundError(LookupError):
+    """Replay asked for a prompt that was never recorded"""
+
+
+class RecordReplayModel:
+    def __init__(self, provider: "RecordReplayProvider", system_instruction: str):
+        self.provider = provider
+        self.system_instruction = system_instruction
+
+    def _key(self, prompt: str, generation_config: Optional[Dict[str, Any]]) -> str:
+        schema = _schema_of(generation_config)
+        return cache_key(
+            self.provider.model_name, self.system_instruction, prompt,
+            schema=json.dumps(schema, sort_keys=True, ensure_ascii=False) if schema else "",
+        )
+
+    def _inner(self):
+        return self.provider.inner.model(self.system_instruction)
+
+    def generate_content(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None, **kwargs):
+        key = self._key(prompt, generation_config)
+        if self.provider.mode == "replay":
+            fixture = self.provider.load(key)
+            if self.provider.realtime:
+                time.sleep(fixture["latency_seconds"])
+            return _response(fixture["text"], fixture.get("prompt_tokens"), fixture.get("total_tokens"))
+        start = time.perf_counter()
+        call_kwargs = {"generation_config": generation_config} if generation_config else {}
+        resp = self._inner().generate_content(prompt, **call_kwargs)
+        self.provider.save(key, self.system_instruction, prompt, resp.text, resp, time.perf_counter() - start)
+        return resp
+
+    async def generate_content_async(
+        self, prompt: str, stream: bool = False, generation_config: Optional[Dict[str, Any]] = None, **kwargs
+    ):
+        key = self._key(prompt, generation_config)
+        if self.provider.mode == "replay":
+            fixture = self.provider.load(key)
+            if not stream:
+                if self.provider.realtime:
+                    await asyncio.sleep(fixture["latency_seconds"])
+                return _response(fixture["text"], fixture.get("prompt_tokens"), fixture.get("total_tokens"))
+            return self._replay_stream(fixture)
+        call_kwargs = {"generation_config": generation_config} if generation_config else {}
+        start = time.perf_counter()
+        if not stream:
+            resp = await self._inner().generate_content_async(prompt, **call_kwargs)
+            self.provider.save(key, self.system_instruction, prompt, resp.text, resp, time.perf_counter() - start)
+            return resp
+        return self._record_stream(key, prompt, await self._inner().generate_content_async(prompt, stream=True, **call_kwargs), start)
+
+    async def _replay_stream(self, fixture: Dict[str, Any]) -> AsyncIterator[Any]:
+        pieces = _split(fixture["text"])
+        for index, piece in enumerate(pieces):
+            if self.provider.realtime:
+                await asyncio.sleep(fixture["latency_seconds"] / len(pieces))
+            last = index == len(pieces) - 1
+            yield _response(piece, fixture.get("prompt_tokens"), fixture.get("total_tokens") if last else None)
+
+    async def _record_stream(self, key: str, prompt: str, response, start: float) -> AsyncIterator[Any]:
+        text, last = [], None
+        async for chunk in response:
+            last = chunk
+            try:
+                text.append(chunk.text)
+            except (AttributeError, ValueError):
+                pass  # pedaço sem texto (só metadados)
+            yield chunk
+        self.provider.save(key, self.system_instruction, prompt, "".join(text), last, time.perf_counter() - start)
+
+
+class RecordReplayProvider(LLMProvider):
+    """
+    mode='record': call `inner` and store every response as a JSON fixture;
+    mode='replay': answer from the fixtures only (FixtureNotFoundError otherwise).
+    Fixtures are keyed like llm_cache (model + system + prompt + response_schema).
+    """
+
+    def __init__(self, inner: LLMProvider, mode: str = "replay", fixtures_dir: str = LLM_FIXTURES_DIR,
+                 realtime: bool = LLM_REPLAY_REALTIME):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"mode must be 'record' or 'replay', got {mode!r}")
+        self.inner = inner
+        self.mode = mode
+        self.name = mode
+        self.model_name = inner.model_name
+        self.fixtures_dir = fixtures_dir
+        self.realtime = realtime
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.fixtures_dir, f"{key}.json")
+
+    def load(self, key: str) -> Dict[str, Any]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            raise FixtureNotFoundError(
+                f"Sem fixture para este prompt ({key[:12]}...) em {self.fixtures_dir}; grave com LLM_PROVIDER=record"
+            )
+        with self._lock:
+            self.hits += 1
+        return fixture
+
+    def save(self, key: str, system_instruction: str, prompt: str, text: str, resp, latency: float):
+        usage = getattr(resp, "usage_metadata", None)
+        fixture = {
+            "key": key,
+            "model": self.model_name,
+            "system_instruction": system_instruction[:200],
+            "prompt_preview": prompt[:500],
+            "text": text,
+            "prompt_tokens": getattr(usage, "prompt_token_count", None) or None,
+            "total_tokens": getattr(usage, "total_token_count", None) or None,
+            "latency_seconds": round(latency, 3),
+            "recorded_at": datetime.now().isoformat(),
+        }
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self.recorded += 1
+
+    def model(self, system_instruction: str):
+        return RecordReplayModel(self, system_instruction)
+
+    def warm(self, system_instructions: List[str]):
+        if self.mode == "record":
+            self.inner.warm(system_instructions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "fixtures_dir": self.fixtures_dir,
+            "hits": self.hits,
+            "misses": self.misses,
+            "recorded": self.recorded,
+        }
+
+
+def create_provider(name: str = LLM_PROVIDER, schemas: Optional[Dict[str, Type[BaseModel]]] = None) -> LLMProvider:
+    """Provider for LLM_PROVIDER: gemini | fake | record | replay"""
+    if name == "gemini":
+        return GeminiProvider()
+    if name == "fake":
+        return FakeProvider(schemas=schemas)
+    if name in ("record", "replay"):
+        return RecordReplayProvider(GeminiProvider(), mode=name)
+    raise ValueError(f"LLM_PROVIDER desconhecido: {name!r} (use gemini, fake, record ou replay)")
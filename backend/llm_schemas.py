@@ -0,0 +1,364 @@
+"""
+Schemas tipados das respostas do LLM (saída estruturada do Gemini)
+
+Em vez de colar no prompt um exemplo de JSON de vários KB (o SCHEMA dos
+agentes) e depois caçar chaves com _clean_json_text, o formato da resposta
+vai como response_schema nativo do Gemini (response_mime_type
+application/json). As orientações que estavam nos exemplos ("3-4
+parágrafos", como calcular confidence_score...) viraram description dos
+campos, que o modelo recebe junto com o schema.
+
+Os mesmos modelos Pydantic validam a resposta; falhas de parse/validação
+são contadas em structured_output_stats (GET /api/ai/stats).
+"""
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Literal, Optional, Type
+
+from pydantic import BaseModel, Field, ValidationError
+
+# =====================================================
+# PEI (PEIGeneratorAgent)
+# =====================================================
+
+
+class StudentIdentification(BaseModel):
+    name: str
+    birth_date: str = Field(description="DD/MM/YYYY")
+    age: int
+    grade: str = Field(description="ex.: 9º Ano")
+    special_needs: List[str] = Field(description="ex.: TEA Nível 1, TDAH")
+
+
+class ReportSources(BaseModel):
+    """Profissionais citados em cada seção, ex.: 'Ana Costa (Psicóloga)'"""
+    cognitive_development: List[str]
+    attention_concentration: List[str]
+    socioemotional: List[str]
+    communication: List[str]
+
+
+class DetailedReport(BaseModel):
+    cognitive_development: str = Field(description="texto descritivo detalhado (3-4 parágrafos)")
+    attention_concentration: str = Field(description="texto descritivo detalhado (2-3 parágrafos)")
+    socioemotional: str = Field(description="texto descritivo detalhado (2-3 parágrafos)")
+    communication: str = Field(description="texto descritivo detalhado (2-3 parágrafos)")
+    sources: ReportSources
+
+
+class EducationalGoals(BaseModel):
+    short_term: List[str] = Field(description="metas com prazo, ex.: '... (3 meses)'")
+    medium_term: List[str] = Field(description="metas com prazo, ex.: '... (6 meses)'")
+    long_term: List[str] = Field(description="metas com prazo, ex.: '... (12 meses)'")
+
+
+class MethodologicalStrategies(BaseModel):
+    content_presentation: List[str]
+    activities: List[str]
+    environment: List[str]
+
+
+class AssistiveResources(BaseModel):
+    required: List[str]
+    recommended: List[str]
+
+
+class DiversifiedInstruments(BaseModel):
+    """Peso (%) de cada instrumento; somam 100"""
+    practical_projects: int
+    visual_presentations: int
+    classroom_activities: int
+    adapted_tests: int
+
+
+class EvaluationCriteria(BaseModel):
+    adaptations: List[str] = Field(description="ex.: 'Tempo adicional: +50% do tempo regular'")
+    diversified_instruments: DiversifiedInstruments
+    evaluation_focus: str
+
+
+class PEIOutput(BaseModel):
+    student_identification: StudentIdentification
+    detailed_report: DetailedReport
+    strengths: List[str]
+    difficulties: List[str]
+    educational_goals: EducationalGoals
+    methodological_strategies: MethodologicalStrategies
+    assistive_resources: AssistiveResources
+    evaluation_criteria: EvaluationCriteria
+    confidence_score: int = Field(description=(
+        "0-100: completude das respostas (40%), convergência entre profissionais (30%), "
+        "especificidade das informações (30%)"
+    ))
+    warnings: List[str] = Field(description="pontos a revisar com a equipe pedagógica")
+    suggestions: List[str]
+
+
+# Geração por seções (PEIGeneratorAgent.SECTIONS): cada chamada devolve um pedaço do PEIOutput.
+# sources diz de quais respostas a seção depende (regeneração incremental)
+
+
+class ReportSectionOutput(BaseModel):
+    text: str = Field(description="texto descritivo detalhado")
+    sources: List[str] = Field(description="profissionais citados, ex.: 'Ana Costa (Psicóloga)'")
+
+
+class ProfileOutput(BaseModel):
+    student_identification: StudentIdentification
+    strengths: List[str]
+    difficulties: List[str]
+    sources: List[str] = ReportSectionOutput.model_fields["sources"]
+
+
+class GoalsOutput(BaseModel):
+    educational_goals: EducationalGoals
+    sources: List[str] = ReportSectionOutput.model_fields["sources"]
+
+
+class StrategiesOutput(BaseModel):
+    methodological_strategies: MethodologicalStrategies
+    sources: List[str] = ReportSectionOutput.model_fields["sources"]
+
+
+class ResourcesOutput(BaseModel):
+    assistive_resources: AssistiveResources
+    sources: List[str] = ReportSectionOutput.model_fields["sources"]
+
+
+class EvaluationOutput(BaseModel):
+    evaluation_criteria: EvaluationCriteria
+    sources: List[str] = ReportSectionOutput.model_fields["sources"]
+
+
+class ReviewOutput(BaseModel):
+    confidence_score: int = PEIOutput.model_fields["confidence_score"]
+    warnings: List[str] = PEIOutput.model_fields["warnings"]
+    suggestions: List[str]
+
+
+# =====================================================
+# Resumo de uma resposta (ResponseDigestAgent, modo progressivo)
+# =====================================================
+
+
+class ReportFindings(BaseModel):
+    """Achados da resposta para cada seção do relatório detalhado (vazio se não houver)"""
+    cognitive_development: List[str]
+    attention_concentration: List[str]
+    socioemotional: List[str]
+    communication: List[str]
+
+
+class ResponseDigestOutput(BaseModel):
+    source: str = Field(description="profissional, ex.: 'Ana Costa (Psicóloga)'")
+    findings: ReportFindings
+    strengths: List[str]
+    difficulties: List[str]
+    strategies_that_work: List[str] = Field(description="estratégias que o profissional viu funcionar")
+    needs: List[str] = Field(description="recursos, adaptações e cuidados indicados")
+
+
+# =====================================================
+# Material adaptado (MaterialAdapterAgent)
+# =====================================================
+
+
+class OriginalAnalysis(BaseModel):
+    content_type: Literal["teórico", "prático", "misto"]
+    complexity_level: Literal["baixo", "médio", "alto"]
+    main_concepts: List[str]
+    learning_objectives: List[str]
+    estimated_time: int = Field(description="minutos")
+
+
+# Só ficam as descriptions que o prompt não diz: as diretrizes e transformações do
+# MaterialAdapterAgent já cobrem blocos de 15-20 min, passo a passo, título visual,
+# analogias e texto sem emojis/markdown (o schema também é entrada, e paga tokens)
+
+
+class Introduction(BaseModel):
+    hook: str
+    objective: str
+
+
+class ContentBlock(BaseModel):
+    block_number: int
+    duration_minutes: int
+    title: str
+    content_type: str = Field(description="visual|prático|textual")
+    content: str
+    visual_aids: List[str]
+    activity: str
+    pause: str = Field(description="sim/não")
+
+
+class PracticeActivity(BaseModel):
+    title: str
+    type: str = Field(description="individual|grupo|manipulável")
+    duration_minutes: int
+    instructions: List[str]
+    materials_needed: List[str]
+
+
+class AdaptedContentStructure(BaseModel):
+    title: str
+    introduction: Introduction
+    blocks: List[ContentBlock]
+    practice_activities: List[PracticeActivity]
+    summary: str
+    evaluation_suggestion: str
+
+
+class CompatibilityAnalysis(BaseModel):
+    strengths_addressed: List[str]
+    needs_met: List[str]
+    strategies_applied: List[str]
+
+
+class MaterialAdaptationOutput(BaseModel):
+    original_analysis: OriginalAnalysis
+    adaptations_applied: List[str]
+    adapted_content_structure: AdaptedContentStructure
+    pei_compatibility_score: int = Field(description="0-100")
+    compatibility_analysis: CompatibilityAnalysis
+    teacher_notes: List[str]
+    warnings: List[str]
+
+
+# MaterialAdaptationOutput sem original_analysis, que vem da análise compartilhada do material
+class MaterialPersonalizationOutput(BaseModel):
+    adaptations_applied: List[str]
+    adapted_content_structure: AdaptedContentStructure
+    pei_compatibility_score: int = MaterialAdaptationOutput.model_fields["pei_compatibility_score"]
+    compatibility_analysis: CompatibilityAnalysis
+    teacher_notes: List[str]
+    warnings: List[str]
+
+
+# =====================================================
+# Conversão para o schema do Gemini
+# =====================================================
+
+# Subconjunto OpenAPI aceito pelo Gemini (protos.Schema)
+_GEMINI_SCHEMA_KEYS = {"type", "format", "description", "nullable", "enum", "properties", "required", "items"}
+
+
+def _to_gemini(node: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        return _to_gemini(defs[node["$ref"].rsplit("/", 1)[-1]], defs)
+    any_of = node.get("anyOf")
+    if any_of:  # Optional[X] -> X nullable
+        variants = [v for v in any_of if v.get("type") != "null"]
+        schema = _to_gemini(variants[0], defs)
+        schema["nullable"] = True
+        if node.get("description"):
+            schema["description"] = node["description"]
+        return schema
+    schema = {key: value for key, value in node.items() if key in _GEMINI_SCHEMA_KEYS}
+    if "enum" in schema:  # Literal[...]
+        schema.update(type="string", format="enum")
+    if "properties" in schema:
+        schema["properties"] = {name: _to_gemini(value, defs) for name, value in schema["properties"].items()}
+    if "items" in schema:
+        schema["items"] = _to_gemini(schema["items"], defs)
+    return schema
+
+
+@lru_cache(maxsize=None)
+def gemini_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """JSON schema of `model` with $refs inlined and only the keys Gemini accepts"""
+    schema = model.model_json_schema()
+    return _to_gemini(schema, schema.get("$defs", {}))
+
+
+# Sem saída estruturada (LLM_STRUCTURED_OUTPUT=0) o schema vai no prompt depois
+# deste texto; o provider fake (llm_providers.py) lê o schema de volta dali
+INLINE_SCHEMA_HINT = "Responda APENAS em JSON com este schema"
+
+
+def inline_schema_hint(model: Type[BaseModel], note: str = "") -> str:
+    """Prompt line carrying the schema of `model` when the call has no response_schema"""
+    return f"{INLINE_SCHEMA_HINT}{note}: {json.dumps(gemini_schema(model), ensure_ascii=False, separators=(',', ':'))}"
+
+
+def schema_fingerprint(model: Type[BaseModel]) -> str:
+    """Part of the llm_cache key, so a schema change does not reuse old responses"""
+    return f"{model.__name__}:{json.dumps(gemini_schema(model), sort_keys=True, ensure_ascii=False)}"
+
+
+# =====================================================
+# Métricas
+# =====================================================
+
+
+class StructuredOutputStats:
+    """Prompt size and parse/validation failure counters of the LLM calls"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_schema: Dict[str, Dict[str, int]] = {}
+
+    def _entry(self, schema: Optional[Type[BaseModel]]) -> Dict[str, int]:
+        name = schema.__name__ if schema is not None else "free_form"
+        return self.by_schema.setdefault(name, {
+            "calls": 0,
+            "prompt_chars": 0,
+            "schema_chars": 0,  # response_schema nativo (também é entrada)
+            "legacy_prompt_chars": 0,  # o mesmo prompt no formato antigo (SCHEMA de exemplo + indent=2)
+            "prompt_tokens": 0,  # usage_metadata.prompt_token_count, quando a API informa
+            "parse_failures": 0,
+            "validation_failures": 0,
+        })
+
+    def record_prompt(
+        self, schema: Optional[Type[BaseModel]], prompt_chars: int, schema_chars: int, legacy_prompt_chars: int
+    ):
+        with self._lock:
+            entry = self._entry(schema)
+            entry["calls"] += 1
+            entry["prompt_chars"] += prompt_chars
+            entry["schema_chars"] += schema_chars
+            entry["legacy_prompt_chars"] += legacy_prompt_chars
+
+    def record_prompt_tokens(self, schema: Optional[Type[BaseModel]], tokens: Optional[int]):
+        if tokens:
+            with self._lock:
+                self._entry(schema)["prompt_tokens"] += tokens
+
+    def record_failure(self, schema: Optional[Type[BaseModel]], kind: str):
+        with self._lock:
+            self._entry(schema)[kind] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for name, entry in self.by_schema.items():
+                legacy = entry["legacy_prompt_chars"]
+                prompt_saved = legacy - entry["prompt_chars"]
+                # Líquido: descontando o schema, medido como JSON compacto (estimativa conservadora)
+                net_saved = prompt_saved - entry["schema_chars"]
+                failures = entry["parse_failures"] + entry["validation_failures"]
+                result[name] = {
+                    **entry,
+                    # ~4 caracteres por token, como em _estimate_tokens
+                    "prompt_tokens_saved_estimate": prompt_saved // 4,
+                    "input_tokens_saved_estimate": net_saved // 4,
+                    "input_saved_ratio": round(net_saved / legacy, 4) if legacy else 0.0,
+                    "parse_failure_rate": round(failures / entry["calls"], 4) if entry["calls"] else 0.0,
+                }
+            return result
+
+
+structured_output_stats = StructuredOutputStats()
+
+
+def validate_output(schema: Type[BaseModel], result: Any) -> bool:
+    """Validate a parsed response against `schema`, counting failures (the dict is kept as is)"""
+    try:
+        schema.model_validate(result)
+        return True
+    except ValidationError as e:
+        structured_output_stats.record_failure(schema, "validation_failures")
+        print(f"⚠️ Resposta fora do schema {schema.__name__}: {e.error_count()} erro(s)")
+        return False
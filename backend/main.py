@@ -1,24 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from pydantic import BaseModel
+import asyncio
+import hashlib
 import json
+import time
 import uuid
 import os
 from datetime import datetime
 from pypdf import PdfReader
 import io
 
-from database import Student, Respondent, PEI, ProfessionalResponse, AdaptedMaterial, SessionLocal, get_db, init_db
+from database import Student, Respondent, PEI, ProfessionalResponse, AdaptedMaterial, AIJob, SessionLocal, ReadSessionLocal, get_db, get_read_db, get_async_db, init_db, store_blob
+from llm_cache import llm_cache
+from llm_schemas import structured_output_stats
 from ai import (
     PEAIOrchestrator, 
     StudentInfo, 
     ProfessionalResponse as AIProfessionalResponse, 
+    MaterialAnalysisAgent,
     PEIDocument,
-    WorkflowOrchestratorAgent
+    ResponseDigestAgent,
+    WorkflowOrchestratorAgent,
+    llm_concurrency,
+    llm_provider,
+    response_fingerprint as ai_response_fingerprint,
+    warm_models
 )
+from ai_jobs import JobKind, JobWorkerPool, PermanentJobError, enqueue, recover_abandoned
+from db_writer import writer
+from generation_events import (
+    GENERATION_SSE_KEEPALIVE_SECONDS,
+    GENERATION_SSE_MAX_SECONDS,
+    GENERATION_SSE_POLL_SECONDS,
+    GenerationRecorder,
+    format_sse,
+    record_event,
+    start_run,
+    stream_events,
+)
+from pagination import MAX_PAGE_SIZE, keyset_page, count_rows, set_page_headers
+from pei_cache import pei_cache
+from rate_limit import gemini_rate_limiter
+from student_import import StudentImportReport, import_students, iter_csv_rows, iter_json_rows
 from pdf_generator import generate_pdf_from_json
 from pei_pdf_generator import generate_pei_pdf
 
@@ -37,6 +67,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count"],  # paginação
 )
 
 
@@ -107,7 +138,9 @@ class PEIResponse(BaseModel):
         from_attributes = True
     
     @classmethod
-    def from_orm(cls, obj):
+    def from_orm(cls, obj, responses_count: int = 0):
+        # responses_count vem de uma contagem agregada (count_responses) para não
+        # carregar a relação professional_responses com todos os JSONs de resposta
         # Parse JSON fields
         professionals = json.loads(obj.professionals) if obj.professionals else []
         
@@ -134,7 +167,7 @@ class PEIResponse(BaseModel):
             'teaching_strategies': obj.teaching_strategies,
             'assistive_resources': json.loads(obj.assistive_resources) if obj.assistive_resources else None,
             'evaluation_methods': obj.evaluation_methods,
-            'responses_count': len(obj.professional_responses) if hasattr(obj, 'professional_responses') else 0,
+            'responses_count': responses_count,
             'total_professionals': len(professionals),
         }
         return cls(**data)
@@ -145,6 +178,10 @@ class ProfessionalResponseCreate(BaseModel):
     responses: Dict[str, Any]
 
 
+class ProfessionalResponseUpdate(BaseModel):
+    responses: Dict[str, Any]
+
+
 class ProfessionalResponseData(BaseModel):
     id: str
     pei_id: str
@@ -178,10 +215,62 @@ class PEICreate(BaseModel):
     professionals: List[Dict[str, str]]
 
 
+def count_responses(db: Session, pei_ids: List[str]) -> Dict[str, int]:
+    """Number of professional responses per PEI in a single aggregated query"""
+    if not pei_ids:
+        return {}
+    rows = db.query(ProfessionalResponse.pei_id, func.count(ProfessionalResponse.id)).filter(
+        ProfessionalResponse.pei_id.in_(pei_ids)
+    ).group_by(ProfessionalResponse.pei_id).all()
+    return {pei_id: count for pei_id, count in rows}
+
+
+def responses_count_column():
+    """Correlated COUNT of a PEI's responses, to read it in the same query as the PEI"""
+    return select(func.count(ProfessionalResponse.id)).where(
+        ProfessionalResponse.pei_id == PEI.id
+    ).scalar_subquery()
+
+
+def cached_pei_response(db: Session, pei_id: str, updated_at: datetime, responses_count: int) -> Response:
+    """Serialized PEI from pei_cache, loading and serializing the row only on a miss"""
+    def build() -> bytes:
+        pei = db.get(PEI, pei_id)
+        return PEIResponse.from_orm(pei, responses_count).model_dump_json().encode()
+
+    payload = pei_cache.get_or_build(pei_id, (updated_at, responses_count), build)
+    return Response(content=payload, media_type="application/json")
+
+
+# Workers de IA dentro da API; com AI_WORKERS_IN_API=0 eles rodam só no ai_worker.py
+AI_WORKERS_IN_API = int(os.getenv("AI_WORKERS_IN_API", "2"))
+
+# Modo progressivo: cada resposta é resumida assim que chega (job digest_response)
+# e a geração final do PEI só combina os resumos
+PEI_PROGRESSIVE_DIGESTS = os.getenv("PEI_PROGRESSIVE_DIGESTS", "0") not in ("0", "false", "False")
+
+# Alunos aceitos por upload da turma (POST /api/materials/batch-upload)
+MATERIAL_BATCH_MAX_STUDENTS = int(os.getenv("MATERIAL_BATCH_MAX_STUDENTS", "100"))
+
+
 # Initialize database on startup
 @app.on_event("startup")
 def startup_event():
     init_db()
+    writer.start()
+    recovered = recover_abandoned()
+    requeued = requeue_stuck_targets()
+    if recovered or requeued:
+        print(f"♻️  Recovered {recovered} abandoned AI job(s), requeued {requeued} stuck item(s)")
+    if AI_WORKERS_IN_API > 0:
+        warm_models()
+        ai_worker_pool.start()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    ai_worker_pool.stop()
+    writer.stop()
 
 
 # API Endpoints
@@ -190,15 +279,44 @@ def read_root():
     return {"message": "PE-AI Student API", "status": "running"}
 
 
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    """Hit/miss counters and memory usage of the in-process caches"""
+    return {"pei": pei_cache.stats(), "llm": llm_cache.stats()}
+
+
 @app.get("/api/students", response_model=List[StudentResponse])
-def get_students(db: Session = Depends(get_db)):
-    """Get all students"""
-    students = db.query(Student).all()
+def get_students(
+    response: Response,
+    status: Optional[str] = None,
+    pei_status: Optional[str] = None,
+    sort: str = Query("id", pattern="^(id|name)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: Session = Depends(get_read_db)
+):
+    """Get students (keyset pagination via `limit`/`cursor`, next page in X-Next-Cursor).
+
+    `pei_status` keeps only students with a PEI in that status (e.g. 'concluido'
+    for the class-wide material batch).
+    """
+    query = db.query(Student)
+    if status:
+        query = query.filter(Student.status == status)
+    if pei_status:
+        query = query.filter(select(PEI.id).where(PEI.student_id == Student.id, PEI.status == pei_status).exists())
+    
+    total = count_rows(query) if include_total else None
+    sort_columns = [Student.name, Student.id] if sort == "name" else [Student.id]
+    students, next_cursor = keyset_page(query, sort_columns, cursor, limit, descending=(order == "desc"))
+    set_page_headers(response, next_cursor, total)
     return students
 
 
 @app.get("/api/students/{student_id}", response_model=StudentResponse)
-def get_student(student_id: str, db: Session = Depends(get_db)):
+def get_student(student_id: str, db: Session = Depends(get_read_db)):
     """Get a specific student by ID"""
     student = db.query(Student).filter(Student.id == student_id).first()
     
@@ -223,6 +341,25 @@ def create_student(student: StudentCreate, db: Session = Depends(get_db)):
     return db_student
 
 
+@app.post("/api/students/import", response_model=StudentImportReport)
+async def import_students_bulk(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|json)$"),
+):
+    """Bulk-create students from a CSV (header row) or JSON array body.
+
+    The body is parsed while it streams in and inserted in chunks; each row
+    gets a result ('created', 'duplicate' or 'invalid') in the report.
+    """
+    content_type = request.headers.get("content-type", "")
+    body_format = format or ("csv" if "csv" in content_type else "json")
+    if body_format == "csv":
+        rows = iter_csv_rows(request.stream())
+    else:
+        rows = iter_json_rows(request.stream())
+    return await import_students(rows)
+
+
 @app.put("/api/students/{student_id}", response_model=StudentResponse)
 def update_student(student_id: str, student_update: StudentUpdate, db: Session = Depends(get_db)):
     """Update an existing student"""
@@ -256,7 +393,7 @@ def delete_student(student_id: str, db: Session = Depends(get_db)):
 
 # Respondent endpoints
 @app.get("/api/students/{student_id}/respondents", response_model=List[RespondentResponse])
-def get_student_respondents(student_id: str, db: Session = Depends(get_db)):
+def get_student_respondents(student_id: str, db: Session = Depends(get_read_db)):
     """Get all respondents for a specific student"""
     # Check if student exists
     student = db.query(Student).filter(Student.id == student_id).first()
@@ -269,14 +406,46 @@ def get_student_respondents(student_id: str, db: Session = Depends(get_db)):
 
 # PEI endpoints
 @app.get("/api/peis", response_model=List[PEIResponse])
-def get_all_peis(db: Session = Depends(get_db)):
-    """Get all PEIs ordered by creation date (most recent first)"""
-    peis = db.query(PEI).order_by(PEI.created_at.desc()).all()
-    return [PEIResponse.from_orm(pei) for pei in peis]
+def get_all_peis(
+    response: Response,
+    status: Optional[str] = None,
+    ai_processing_status: Optional[str] = None,
+    student_id: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: Session = Depends(get_read_db)
+):
+    """Get PEIs ordered by creation date (most recent first by default).
+
+    Keyset pagination on (created_at, id): pass `limit` and then the
+    X-Next-Cursor header of the previous page as `cursor`.
+    """
+    query = db.query(PEI)
+    if status:
+        query = query.filter(PEI.status == status)
+    if ai_processing_status:
+        query = query.filter(PEI.ai_processing_status == ai_processing_status)
+    if student_id:
+        query = query.filter(PEI.student_id == student_id)
+    
+    total = count_rows(query) if include_total else None
+    peis, next_cursor = keyset_page(query, [PEI.created_at, PEI.id], cursor, limit, descending=(order == "desc"))
+    set_page_headers(response, next_cursor, total)
+    counts = count_responses(db, [pei.id for pei in peis])
+    return [PEIResponse.from_orm(pei, counts.get(pei.id, 0)) for pei in peis]
+
+
+@app.get("/api/peis/counts")
+def get_pei_counts(db: Session = Depends(get_read_db)):
+    """Number of PEIs per status (one GROUP BY), for the summary cards of the PEI list"""
+    by_status = dict(db.query(PEI.status, func.count(PEI.id)).group_by(PEI.status).all())
+    return {"total": sum(by_status.values()), "by_status": by_status}
 
 
 @app.get("/api/pei/{pei_id}/download-pdf")
-async def download_pei_pdf(pei_id: str, db: Session = Depends(get_db)):
+async def download_pei_pdf(pei_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Gera e retorna o PDF do PEI
     """
@@ -284,7 +453,7 @@ async def download_pei_pdf(pei_id: str, db: Session = Depends(get_db)):
         print(f"[DEBUG] Requisição de PDF para PEI: {pei_id}")
         
         # Busca o PEI do banco
-        pei = db.query(PEI).filter_by(id=pei_id).first()
+        pei = await db.get(PEI, pei_id)
         
         if not pei:
             print(f"[ERROR] PEI não encontrado: {pei_id}")
@@ -293,7 +462,7 @@ async def download_pei_pdf(pei_id: str, db: Session = Depends(get_db)):
         print(f"[DEBUG] PEI encontrado: {pei.id}, status: {pei.status}")
         
         # Busca dados do aluno
-        student = db.query(Student).filter_by(id=pei.student_id).first()
+        student = await db.get(Student, pei.student_id)
         
         if not student:
             print(f"[ERROR] Estudante não encontrado: {pei.student_id}")
@@ -321,9 +490,8 @@ async def download_pei_pdf(pei_id: str, db: Session = Depends(get_db)):
         
         print(f"[DEBUG] Dados do PEI preparados, gerando PDF...")
         
-        # Importa e chama o gerador de PDF
-        from pei_pdf_generator import generate_pei_pdf
-        pdf_buffer = generate_pei_pdf(pei_data)
+        # Gera o PDF numa thread (CPU) para não travar o event loop
+        pdf_buffer = await run_in_threadpool(generate_pei_pdf, pei_data)
         
         print(f"[DEBUG] PDF gerado com sucesso")
         
@@ -353,31 +521,34 @@ async def download_pei_pdf(pei_id: str, db: Session = Depends(get_db)):
 
 
 @app.get("/api/pei/{pei_id}", response_model=PEIResponse)
-def get_pei(pei_id: str, db: Session = Depends(get_db)):
+def get_pei(pei_id: str, db: Session = Depends(get_read_db)):
     """Get a specific PEI by ID"""
-    pei = db.query(PEI).filter(PEI.id == pei_id).first()
+    # Só a versão (updated_at + nº de respostas); o PEI completo só é lido se não estiver no cache
+    version = db.query(PEI.updated_at, responses_count_column()).filter(PEI.id == pei_id).first()
     
-    if not pei:
+    if not version:
         raise HTTPException(status_code=404, detail=f"PEI with id '{pei_id}' not found")
     
-    return PEIResponse.from_orm(pei)
+    return cached_pei_response(db, pei_id, *version)
 
 
 @app.get("/api/students/{student_id}/pei", response_model=PEIResponse)
-def get_student_pei(student_id: str, db: Session = Depends(get_db)):
+def get_student_pei(student_id: str, db: Session = Depends(get_read_db)):
     """Get the PEI for a specific student"""
     # Check if student exists
     student = db.query(Student).filter(Student.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail=f"Student with id '{student_id}' not found")
     
-    # Get the most recent PEI for this student
-    pei = db.query(PEI).filter(PEI.student_id == student_id).order_by(PEI.created_at.desc()).first()
+    # Get the most recent PEI for this student (id + versão para o cache)
+    latest = db.query(PEI.id, PEI.updated_at, responses_count_column()).filter(
+        PEI.student_id == student_id
+    ).order_by(PEI.created_at.desc()).first()
     
-    if not pei:
+    if not latest:
         raise HTTPException(status_code=404, detail=f"No PEI found for student with id '{student_id}'")
     
-    return PEIResponse.from_orm(pei)
+    return cached_pei_response(db, *latest)
 
 
 @app.post("/api/pei", response_model=PEIResponse, status_code=201)
@@ -442,7 +613,6 @@ def create_pei(pei_data: PEICreate, db: Session = Depends(get_db)):
 def submit_professional_response(
     pei_id: str, 
     response_data: ProfessionalResponseCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Submit a professional's response to a PEI"""
@@ -458,38 +628,65 @@ def submit_professional_response(
     if not professional:
         raise HTTPException(status_code=404, detail=f"Professional with id '{response_data.professional_id}' not found in PEI")
     
-    # Check if response already exists
-    existing = db.query(ProfessionalResponse).filter(
-        ProfessionalResponse.pei_id == pei_id,
-        ProfessionalResponse.professional_id == response_data.professional_id
-    ).first()
+    # Create new response - via escritor único (group commit)
+    def save_response(session: Session):
+        # Check if response already exists (serializado na thread do escritor)
+        existing = session.query(ProfessionalResponse).filter(
+            ProfessionalResponse.pei_id == pei_id,
+            ProfessionalResponse.professional_id == response_data.professional_id
+        ).first()
+        
+        if existing:
+            raise HTTPException(status_code=400, detail="This professional has already submitted a response")
+        
+        new_response = ProfessionalResponse(
+            id=str(uuid.uuid4()),
+            pei_id=pei_id,
+            professional_id=response_data.professional_id,
+            professional_type=professional.get('type', 'Unknown'),
+            professional_name=professional.get('name', 'Unknown'),
+            responses=json.dumps(response_data.responses),
+            submitted_at=datetime.utcnow()
+        )
+        session.add(new_response)
+        session.flush()
+        
+        # Check if all professionals have responded and queue AI processing (mesma transação)
+        check_and_process_pei(session, pei_id, response_id=new_response.id)
+        return new_response
     
-    if existing:
-        raise HTTPException(status_code=400, detail="This professional has already submitted a response")
-    
-    # Create new response
-    new_response = ProfessionalResponse(
-        id=str(uuid.uuid4()),
-        pei_id=pei_id,
-        professional_id=response_data.professional_id,
-        professional_type=professional.get('type', 'Unknown'),
-        professional_name=professional.get('name', 'Unknown'),
-        responses=json.dumps(response_data.responses),
-        submitted_at=datetime.utcnow()
-    )
+    new_response = writer.execute(save_response)
+    pei_cache.invalidate(pei_id)
     
-    db.add(new_response)
-    db.commit()
-    db.refresh(new_response)
+    return ProfessionalResponseData.from_orm(new_response)
+
+
+@app.put("/api/pei/{pei_id}/responses/{professional_id}", response_model=ProfessionalResponseData)
+def correct_professional_response(pei_id: str, professional_id: str, response_data: ProfessionalResponseUpdate):
+    """Correct a submitted response; a complete PEI is regenerated only in the sections fed by it"""
+    def save_correction(session: Session):
+        existing = session.query(ProfessionalResponse).filter(
+            ProfessionalResponse.pei_id == pei_id,
+            ProfessionalResponse.professional_id == professional_id
+        ).first()
+        if not existing:
+            raise HTTPException(status_code=404, detail="This professional has not submitted a response")
+        
+        existing.responses = json.dumps(response_data.responses)
+        existing.submitted_at = datetime.utcnow()
+        session.flush()
+        
+        check_and_process_pei(session, pei_id, response_id=existing.id)
+        return existing
     
-    # Check if all professionals have responded and trigger AI processing
-    background_tasks.add_task(check_and_process_pei, pei_id, db)
+    corrected = writer.execute(save_correction)
+    pei_cache.invalidate(pei_id)
     
-    return ProfessionalResponseData.from_orm(new_response)
+    return ProfessionalResponseData.from_orm(corrected)
 
 
 @app.get("/api/pei/{pei_id}/responses", response_model=List[ProfessionalResponseData])
-def get_pei_responses(pei_id: str, db: Session = Depends(get_db)):
+def get_pei_responses(pei_id: str, db: Session = Depends(get_read_db)):
     """Get all professional responses for a PEI"""
     # Verify PEI exists
     pei = db.query(PEI).filter(PEI.id == pei_id).first()
@@ -501,8 +698,12 @@ def get_pei_responses(pei_id: str, db: Session = Depends(get_db)):
 
 
 @app.post("/api/pei/{pei_id}/process-ai")
-def trigger_ai_processing(pei_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
-    """Manually trigger AI processing for a PEI (for testing or re-processing)"""
+def trigger_ai_processing(pei_id: str, force: bool = False, db: Session = Depends(get_db)):
+    """Manually trigger AI processing for a PEI (for testing or re-processing).
+
+    Joins a queued/running generation for the same responses and skips when
+    the PEI was already generated from them, unless `force=true`.
+    """
     pei = db.query(PEI).filter(PEI.id == pei_id).first()
     if not pei:
         raise HTTPException(status_code=404, detail=f"PEI with id '{pei_id}' not found")
@@ -512,10 +713,58 @@ def trigger_ai_processing(pei_id: str, background_tasks: BackgroundTasks, db: Se
     if len(responses) == 0:
         raise HTTPException(status_code=400, detail="No professional responses available for processing")
     
-    # Trigger processing in background
-    background_tasks.add_task(process_pei_with_ai, pei_id, db)
+    # Queue processing for the AI workers (ou junta-se à geração em andamento)
+    def queue(session: Session):
+        job, outcome = queue_pei_processing(session, pei_id, force=force)
+        return (job.id if job else None), outcome
+    
+    job_id, outcome = writer.execute(queue)
+    pei_cache.invalidate(pei_id)
     
-    return {"message": "AI processing started", "pei_id": pei_id}
+    messages = {
+        'queued': "AI processing queued",
+        'joined': "AI processing already in progress for these responses",
+        'unchanged': "PEI already generated from the current responses (use force=true to regenerate)",
+    }
+    return {"message": messages[outcome], "pei_id": pei_id, "job_id": job_id, "outcome": outcome}
+
+
+@app.get("/api/ai/stats")
+def get_ai_stats():
+    """In-process AI worker, Gemini concurrency, rate limiter, structured output and shared material analyses"""
+    return {
+        "workers": {
+            "concurrency": ai_worker_pool.concurrency,
+            "running": ai_worker_pool.running(),
+            **ai_worker_pool.stats,
+        },
+        "llm": llm_concurrency.stats(),
+        "rate_limit": gemini_rate_limiter.stats(),
+        "models": llm_provider.stats(),
+        "structured_output": structured_output_stats.stats(),
+        "material_analysis": MaterialAnalysisAgent.stats(),
+    }
+
+
+@app.get("/api/ai-jobs/{job_id}")
+def get_ai_job(job_id: str, db: Session = Depends(get_read_db)):
+    """Status of a queued AI job (PEI processing or material adaptation)"""
+    job = db.get(AIJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"AI job with id '{job_id}' not found")
+    
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "target_id": job.target_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "run_after": job.run_after.isoformat() if job.run_after else None,
+        "last_error": job.last_error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
 
 
 @app.post("/api/pei/{pei_id}/approve")
@@ -543,6 +792,7 @@ def approve_pei(pei_id: str, db: Session = Depends(get_db)):
     
     db.commit()
     db.refresh(pei)
+    pei_cache.invalidate(pei_id)
     
     return {
         "message": "PEI approved successfully",
@@ -552,118 +802,300 @@ def approve_pei(pei_id: str, db: Session = Depends(get_db)):
     }
 
 
-# Background task functions
-def check_and_process_pei(pei_id: str, db: Session):
-    """Check if all professionals responded and trigger AI processing if complete"""
-    # Create new session for background task
-    db = SessionLocal()
+# AI job functions (executadas pelos workers de ai_jobs)
+def pei_input_fingerprint(pei: PEI, student: Optional[Student], responses: List[ProfessionalResponse]) -> str:
+    """Hash of everything the PEI generation reads: student data, PEI intake and the response set"""
+    def normalized(value):
+        return json.loads(value) if isinstance(value, str) else value
+    payload = {
+        "student": [student.name, student.birth_date, student.grade] if student else None,
+        "special_needs": pei.special_needs,
+        "has_diagnosis": pei.has_diagnosis,
+        "initial_observations": pei.initial_observations,
+        "responses": sorted(
+            [r.professional_id, r.professional_type, r.professional_name, normalized(r.responses)]
+            for r in responses
+        ),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def response_fingerprint(response: ProfessionalResponse) -> str:
+    """Hash of one response: its stored digest is reused only while this matches"""
+    return ai_response_fingerprint(ai_professional_response(response))
+
+
+def queue_pei_processing(session: Session, pei_id: str, force: bool = False) -> Tuple[Optional[AIJob], str]:
+    """Queue a process_pei job, deduplicated by PEI and input fingerprint (inside a writer unit).
+
+    Returns the job and the outcome: 'queued' (new job), 'joined' (an active job
+    already covers these inputs) or 'unchanged' (already generated from them).
+    """
+    pei = session.get(PEI, pei_id)
+    if not pei:
+        return None, 'unchanged'
+    
+    responses = session.query(ProfessionalResponse).filter(ProfessionalResponse.pei_id == pei_id).all()
+    fingerprint = pei_input_fingerprint(pei, session.get(Student, pei.student_id), responses)
+    
+    if not force and pei.ai_processing_status == 'completed' and pei.ai_input_fingerprint == fingerprint:
+        print(f"⏭️  PEI {pei_id} already generated from the current responses")
+        return None, 'unchanged'
+    
+    active = session.query(AIJob).filter(
+        AIJob.kind == 'process_pei',
+        AIJob.target_id == pei_id,
+        AIJob.status.in_(('queued', 'running')),
+    ).order_by(AIJob.created_at).all()
+    for job in active:
+        # Job ainda na fila lê as respostas mais recentes quando rodar
+        if job.status == 'queued':
+            job.input_fingerprint = fingerprint
+            job.force = job.force or force
+            return job, 'joined'
+        if job.input_fingerprint == fingerprint and not force:
+            return job, 'joined'
+    
+    # Nenhum job cobre estas entradas: novo job (roda depois do que estiver em andamento)
+    if pei.ai_processing_status != 'processing':
+        pei.ai_processing_status = 'pending'
+    start_run(session, 'pei', pei_id)
+    return enqueue(session, 'process_pei', pei_id, input_fingerprint=fingerprint, force=force), 'queued'
+
+
+def check_and_process_pei(session: Session, pei_id: str, response_id: Optional[str] = None):
+    """Check if all professionals responded and queue AI processing if complete.
+
+    In progressive mode a response that does not complete the set is digested
+    right away, so the final generation only combines the digests.
+    """
+    pei = session.get(PEI, pei_id)
+    if not pei:
+        return
     
-    try:
-        pei = db.query(PEI).filter(PEI.id == pei_id).first()
-        if not pei:
-            return
-        
-        # Count responses
-        responses = db.query(ProfessionalResponse).filter(ProfessionalResponse.pei_id == pei_id).all()
-        professionals = json.loads(pei.professionals) if pei.professionals else []
-        
-        print(f"📊 PEI {pei_id}: {len(responses)}/{len(professionals)} responses received")
-        
-        # If all professionals responded, trigger AI processing
-        if len(responses) >= len(professionals):
-            print(f"✅ All professionals responded for PEI {pei_id}. Starting AI processing...")
-            process_pei_with_ai(pei_id, db)
-    finally:
-        db.close()
+    # Count responses
+    responses_count = session.query(func.count(ProfessionalResponse.id)).filter(
+        ProfessionalResponse.pei_id == pei_id
+    ).scalar()
+    professionals = json.loads(pei.professionals) if pei.professionals else []
+    
+    print(f"📊 PEI {pei_id}: {responses_count}/{len(professionals)} responses received")
+    
+    # If all professionals responded, queue AI processing
+    if responses_count >= len(professionals):
+        print(f"✅ All professionals responded for PEI {pei_id}. Queuing AI processing...")
+        queue_pei_processing(session, pei_id)
+    elif PEI_PROGRESSIVE_DIGESTS and response_id:
+        enqueue(session, 'digest_response', response_id)
+
+
+def update_pei_fields(pei_id: str, **fields):
+    """Apply column updates to a PEI through the single writer and wait for the commit"""
+    def apply(session: Session):
+        pei = session.get(PEI, pei_id)
+        if pei:
+            for field, value in fields.items():
+                setattr(pei, field, value)
+    writer.execute(apply)
+    pei_cache.invalidate(pei_id)
+
+
+def ai_student_info(pei: PEI, student: Student) -> StudentInfo:
+    return StudentInfo(
+        name=student.name,
+        birth_date=student.birth_date or "Unknown",
+        grade=student.grade or "Unknown",
+        special_needs=pei.special_needs.split(', ') if pei.special_needs else [],
+        has_diagnosis=pei.has_diagnosis == 'Sim'
+    )
+
+
+def ai_professional_response(resp: ProfessionalResponse) -> AIProfessionalResponse:
+    return AIProfessionalResponse(
+        professional_id=resp.professional_id,
+        professional_type=resp.professional_type,
+        professional_name=resp.professional_name,
+        responses=json.loads(resp.responses) if isinstance(resp.responses, str) else resp.responses,
+        timestamp=resp.submitted_at.isoformat()
+    )
 
 
-def process_pei_with_ai(pei_id: str, db: Session):
-    """Process PEI with AI agents"""
+def load_pei_ai_inputs(
+    pei_id: str
+) -> Optional[Tuple[StudentInfo, List[AIProfessionalResponse], str, bool, Optional[Dict[str, Any]]]]:
+    """Read what the PEI generator needs; None when the PEI is already up to date.
+
+    The last entry is the per-section state of the previous generation, so
+    only the sections fed by changed responses are generated again.
+    """
     db = SessionLocal()
     
     try:
         pei = db.query(PEI).filter(PEI.id == pei_id).first()
         if not pei:
-            print(f"❌ PEI {pei_id} not found")
-            return
-        
-        # Update status to processing
-        pei.ai_processing_status = 'processing'
-        pei.status = 'in_review'
-        db.commit()
-        
-        print(f"🤖 Starting AI processing for PEI {pei_id}...")
+            raise PermanentJobError(f"PEI {pei_id} not found")
         
         # Get student info
         student = db.query(Student).filter(Student.id == pei.student_id).first()
         if not student:
-            raise Exception("Student not found")
+            raise PermanentJobError("Student not found")
         
         # Get professional responses
         responses = db.query(ProfessionalResponse).filter(ProfessionalResponse.pei_id == pei_id).all()
         
+        # force=true vem do job: com single-flight por PEI, o job 'running' é o deste worker
+        forced = db.query(AIJob.id).filter(
+            AIJob.kind == 'process_pei',
+            AIJob.target_id == pei_id,
+            AIJob.status == 'running',
+            AIJob.force.is_(True),
+        ).first() is not None
+        
+        # Mesmas entradas da última geração bem-sucedida: nada a fazer, e o status
+        # do PEI (completed / concluido) fica como está
+        fingerprint = pei_input_fingerprint(pei, student, responses)
+        if not forced and pei.ai_input_fingerprint == fingerprint:
+            print(f"⏭️  PEI {pei_id} already generated from the current responses, skipping")
+            if pei.ai_processing_status != 'completed':
+                update_pei_fields(pei_id, ai_processing_status='completed')
+            return None
+        
+        # Só agora, com geração garantida, o PEI passa para processing / in_review
+        update_pei_fields(pei_id, ai_processing_status='processing', status='in_review')
+        
+        print(f"🤖 Starting AI processing for PEI {pei_id}...")
+        
+        # Regeneração forçada pede uma resposta nova ao LLM em vez da que está no llm_cache
+        use_llm_cache = not forced
+        
         # Prepare data for AI
-        special_needs_list = pei.special_needs.split(', ') if pei.special_needs else []
+        student_info = ai_student_info(pei, student)
+        ai_responses = [ai_professional_response(resp) for resp in responses]
         
-        student_info = StudentInfo(
-            name=student.name,
-            birth_date=student.birth_date or "Unknown",
-            grade=student.grade or "Unknown",
-            special_needs=special_needs_list,
-            has_diagnosis=pei.has_diagnosis == 'Sim'
-        )
+        # Modo progressivo: resumos ainda válidos entram no lugar das respostas
+        if PEI_PROGRESSIVE_DIGESTS:
+            digests = json.loads(pei.ai_response_digests) if pei.ai_response_digests else {}
+            for resp, ai_response in zip(responses, ai_responses):
+                stored = digests.get(resp.professional_id)
+                if stored and stored.get('fingerprint') == response_fingerprint(resp):
+                    ai_response.digest = stored['digest']
+            reused = sum(r.digest is not None for r in ai_responses)
+            print(f"🧩 PEI {pei_id}: {reused}/{len(ai_responses)} responses with a precomputed digest")
         
-        # Convert responses to AI format
-        ai_responses = []
-        for resp in responses:
-            ai_responses.append(AIProfessionalResponse(
-                professional_id=resp.professional_id,
-                professional_type=resp.professional_type,
-                professional_name=resp.professional_name,
-                responses=json.loads(resp.responses) if isinstance(resp.responses, str) else resp.responses,
-                timestamp=resp.submitted_at.isoformat()
-            ))
+        # Regeneração forçada refaz todas as seções
+        previous = json.loads(pei.ai_sections) if pei.ai_sections and use_llm_cache else None
         
-        # Call AI orchestrator
+        return student_info, ai_responses, fingerprint, use_llm_cache, previous
+    finally:
+        db.close()
+
+
+def save_pei_ai_result(pei_id: str, fingerprint: str, result: Dict[str, Any]):
+    if result['status'] == 'success':
+        pei_doc = result['pei_document']
+        
+        # Update PEI with AI results
+        update_pei_fields(
+            pei_id,
+            cognitive_report=pei_doc['detailed_report'].get('cognitive_development', ''),
+            strengths=json.dumps(pei_doc['strengths'], ensure_ascii=False),
+            difficulties=json.dumps(pei_doc['difficulties'], ensure_ascii=False),
+            short_term_goals=json.dumps(pei_doc['educational_goals'].get('short_term', []), ensure_ascii=False),
+            medium_term_goals=json.dumps(pei_doc['educational_goals'].get('medium_term', []), ensure_ascii=False),
+            long_term_goals=json.dumps(pei_doc['educational_goals'].get('long_term', []), ensure_ascii=False),
+            teaching_strategies=json.dumps(pei_doc['methodological_strategies'], ensure_ascii=False),
+            assistive_resources=json.dumps(pei_doc['assistive_resources'].get('required', []) + pei_doc['assistive_resources'].get('recommended', []), ensure_ascii=False),
+            evaluation_methods=json.dumps(pei_doc['evaluation_criteria'], ensure_ascii=False),
+            ai_processing_status='completed',
+            ai_confidence_score=str(pei_doc['confidence_score']),
+            ai_processed_at=datetime.utcnow(),
+            ai_warnings=json.dumps(pei_doc.get('warnings', []), ensure_ascii=False),
+            ai_suggestions=json.dumps(pei_doc.get('suggestions', []), ensure_ascii=False),
+            ai_input_fingerprint=fingerprint,
+            ai_sections=json.dumps(pei_doc['sections'], ensure_ascii=False) if pei_doc.get('sections') else None,
+            status='completed',
+        )
+        print(f"✅ AI processing completed for PEI {pei_id} with confidence score {pei_doc['confidence_score']}%")
+    else:
+        print(f"❌ AI processing failed for PEI {pei_id}")
+        raise PermanentJobError(result.get('message', f"AI processing returned status '{result['status']}'"))
+
+
+async def process_pei_with_ai(pei_id: str):
+    """Process PEI with AI agents (process_pei job; exceptions make the job retry)"""
+    events = GenerationRecorder('pei', pei_id)
+    try:
+        # Leituras e escritas bloqueiam (SessionLocal/db_writer): vão para o executor,
+        # e a geração em si é await, sem prender thread
+        inputs = await asyncio.to_thread(load_pei_ai_inputs, pei_id)
+        if inputs is None:
+            await events.emit('done', payload={"skipped": True})
+            return
+        student_info, ai_responses, fingerprint, use_llm_cache, previous = inputs
+        await events.emit('started')
+        
+        # Call AI orchestrator - cada seção vai para /api/pei/{id}/events assim que fica pronta
         print(f"🧠 Calling PEI Generator Agent...")
-        result = PEAIOrchestrator.generate_pei(student_info, ai_responses)
+        result = await PEAIOrchestrator.generate_pei_async(
+            student_info, ai_responses, use_cache=use_llm_cache, on_section=events.section, previous=previous
+        )
         
-        if result['status'] == 'success':
-            pei_doc = result['pei_document']
-            
-            # Update PEI with AI results
-            pei.cognitive_report = pei_doc['detailed_report'].get('cognitive_development', '')
-            pei.strengths = json.dumps(pei_doc['strengths'], ensure_ascii=False)
-            pei.difficulties = json.dumps(pei_doc['difficulties'], ensure_ascii=False)
-            pei.short_term_goals = json.dumps(pei_doc['educational_goals'].get('short_term', []), ensure_ascii=False)
-            pei.medium_term_goals = json.dumps(pei_doc['educational_goals'].get('medium_term', []), ensure_ascii=False)
-            pei.long_term_goals = json.dumps(pei_doc['educational_goals'].get('long_term', []), ensure_ascii=False)
-            pei.teaching_strategies = json.dumps(pei_doc['methodological_strategies'], ensure_ascii=False)
-            pei.assistive_resources = json.dumps(pei_doc['assistive_resources'].get('required', []) + pei_doc['assistive_resources'].get('recommended', []), ensure_ascii=False)
-            pei.evaluation_methods = json.dumps(pei_doc['evaluation_criteria'], ensure_ascii=False)
-            
-            pei.ai_processing_status = 'completed'
-            pei.ai_confidence_score = str(pei_doc['confidence_score'])
-            pei.ai_processed_at = datetime.utcnow()
-            pei.ai_warnings = json.dumps(pei_doc.get('warnings', []), ensure_ascii=False)
-            pei.ai_suggestions = json.dumps(pei_doc.get('suggestions', []), ensure_ascii=False)
-            pei.status = 'completed'
-            
-            db.commit()
-            print(f"✅ AI processing completed for PEI {pei_id} with confidence score {pei_doc['confidence_score']}%")
-        else:
-            pei.ai_processing_status = 'failed'
-            db.commit()
-            print(f"❌ AI processing failed for PEI {pei_id}")
+        await asyncio.to_thread(save_pei_ai_result, pei_id, fingerprint, result)
+        await events.emit('done', payload={
+            "sections": events.sections,
+            "confidence_score": result['pei_document']['confidence_score'],
+        })
             
     except Exception as e:
         print(f"❌ Error processing PEI {pei_id}: {str(e)}")
-        pei.ai_processing_status = 'failed'
-        db.commit()
+        await emit_attempt_failed(events, e)
+        raise
+
+
+def load_digest_inputs(response_id: str) -> Optional[Tuple[str, StudentInfo, AIProfessionalResponse, str]]:
+    """Read what the digest of one response needs; None when its stored digest is current"""
+    db = SessionLocal()
+    try:
+        resp = db.get(ProfessionalResponse, response_id)
+        if not resp:
+            raise PermanentJobError(f"Response {response_id} not found")
+        pei = db.get(PEI, resp.pei_id)
+        student = db.get(Student, pei.student_id) if pei else None
+        if not student:
+            raise PermanentJobError(f"Student of response {response_id} not found")
+        
+        fingerprint = response_fingerprint(resp)
+        digests = json.loads(pei.ai_response_digests) if pei.ai_response_digests else {}
+        if digests.get(resp.professional_id, {}).get('fingerprint') == fingerprint:
+            return None
+        return pei.id, ai_student_info(pei, student), ai_professional_response(resp), fingerprint
     finally:
         db.close()
 
 
+def save_response_digest(pei_id: str, professional_id: str, fingerprint: str, digest: Dict[str, Any]):
+    """Merge one digest into PEI.ai_response_digests (read-modify-write inside the writer unit)"""
+    def apply(session: Session):
+        pei = session.get(PEI, pei_id)
+        if pei:
+            digests = json.loads(pei.ai_response_digests) if pei.ai_response_digests else {}
+            digests[professional_id] = {"fingerprint": fingerprint, "digest": digest}
+            pei.ai_response_digests = json.dumps(digests, ensure_ascii=False)
+    writer.execute(apply)
+    pei_cache.invalidate(pei_id)
+
+
+async def digest_professional_response(response_id: str):
+    """Digest one professional response as soon as it arrives (digest_response job)"""
+    inputs = await asyncio.to_thread(load_digest_inputs, response_id)
+    if inputs is None:
+        return
+    pei_id, student_info, ai_response, fingerprint = inputs
+    digest = await ResponseDigestAgent.run_async(student_info, ai_response)
+    await asyncio.to_thread(save_response_digest, pei_id, ai_response.professional_id, fingerprint, digest)
+    print(f"🧩 Digest of {ai_response.professional_name} saved for PEI {pei_id}")
+
+
 # ============================================
 # MATERIAL ADAPTATION ENDPOINTS
 # ============================================
@@ -687,21 +1119,22 @@ async def upload_material(
     title: str = Form(...),
     subject: Optional[str] = Form(None),
     grade: Optional[str] = Form(None),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload and process educational material for adaptation"""
     
     # Verify student exists
-    student = db.query(Student).filter(Student.id == student_id).first()
+    student = await db.get(Student, student_id)
     if not student:
         raise HTTPException(status_code=404, detail=f"Student with id '{student_id}' not found")
     
     # Get student's PEI
-    pei = db.query(PEI).filter(
-        PEI.student_id == student_id,
-        PEI.status == 'concluido'
-    ).first()
+    pei = (await db.execute(
+        select(PEI).where(
+            PEI.student_id == student_id,
+            PEI.status == 'concluido'
+        ).limit(1)
+    )).scalars().first()
     
     if not pei:
         raise HTTPException(
@@ -718,7 +1151,7 @@ async def upload_material(
     
     # Extract text from PDF
     try:
-        extracted_text = extract_text_from_pdf(pdf_content)
+        extracted_text = await run_in_threadpool(extract_text_from_pdf, pdf_content)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
@@ -729,33 +1162,214 @@ async def upload_material(
         student_id=student_id,
         pei_id=pei.id,
         original_filename=file.filename,
-        original_content=extracted_text,
         title=title,
         subject=subject,
         grade=grade,
         status='processing'
     )
     
-    db.add(material)
-    db.commit()
-    db.refresh(material)
+    def save_material(session: Session):
+        material.original_blob_id = store_blob(session, extracted_text)
+        session.add(material)
+        # AI adaptation job na mesma transação do material
+        start_run(session, 'material', material_id)
+        return enqueue(session, 'adapt_material', material_id).id
     
-    # Trigger AI adaptation in background
-    background_tasks.add_task(adapt_material_with_ai, material_id, db)
+    job_id = await writer.run(save_material)
     
     return {
         "id": material_id,
+        "job_id": job_id,
         "status": "processing",
         "message": "Material uploaded successfully. AI adaptation in progress."
     }
 
 
+def parse_student_ids(raw: str) -> List[str]:
+    """student_ids form field: JSON array or comma-separated ids, in order and without repeats"""
+    raw = raw.strip()
+    if raw.startswith('['):
+        try:
+            values = json.loads(raw)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="student_ids must be a JSON array or comma-separated ids")
+        if not isinstance(values, list):
+            raise HTTPException(status_code=400, detail="student_ids must be a JSON array or comma-separated ids")
+    else:
+        values = raw.split(',')
+    return list(dict.fromkeys(str(value).strip() for value in values if str(value).strip()))
+
+
+@app.post("/api/materials/batch-upload")
+async def upload_material_batch(
+    file: UploadFile = File(...),
+    title: str = Form(...),
+    student_ids: str = Form(...),
+    subject: Optional[str] = Form(None),
+    grade: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Adapt one material for many students (a whole class) with a single upload.
+
+    The PDF is read and its text extracted once; each student with an approved
+    PEI gets an AdaptedMaterial and an adapt_material job, all in one writer
+    unit, and the worker pool runs them side by side (sharing the material
+    analysis). Students that cannot receive the material are reported in
+    'rejected' without failing the others. Progress and results per student:
+    GET /api/materials/batches/{batch_id}.
+    """
+    ids = parse_student_ids(student_ids)
+    if not ids:
+        raise HTTPException(status_code=400, detail="student_ids is empty")
+    if len(ids) > MATERIAL_BATCH_MAX_STUDENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MATERIAL_BATCH_MAX_STUDENTS} students per batch (got {len(ids)})"
+        )
+    
+    # Check if file is PDF
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+    
+    # Alunos e PEIs aprovados em duas consultas (não uma por aluno)
+    students = set((await db.execute(select(Student.id).where(Student.id.in_(ids)))).scalars().all())
+    peis = {}
+    for pei_id, pei_student_id in (await db.execute(
+        select(PEI.id, PEI.student_id).where(PEI.student_id.in_(ids), PEI.status == 'concluido')
+    )).all():
+        peis.setdefault(pei_student_id, pei_id)
+    
+    rejected = []
+    for student_id in ids:
+        if student_id not in students:
+            rejected.append({"student_id": student_id, "error": f"Student with id '{student_id}' not found"})
+        elif student_id not in peis:
+            rejected.append({
+                "student_id": student_id,
+                "error": "Student must have an approved PEI (status='concluido') before materials can be adapted"
+            })
+    accepted = [student_id for student_id in ids if student_id in peis]
+    if not accepted:
+        raise HTTPException(status_code=400, detail={"message": "No student in the batch can receive the material", "rejected": rejected})
+    
+    # Leitura e extração uma vez só para a turma inteira
+    pdf_content = await file.read()
+    try:
+        extracted_text = await run_in_threadpool(extract_text_from_pdf, pdf_content)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    batch_id = str(uuid.uuid4())
+    materials = [
+        AdaptedMaterial(
+            id=str(uuid.uuid4()),
+            student_id=student_id,
+            pei_id=peis[student_id],
+            original_filename=file.filename,
+            title=title,
+            subject=subject,
+            grade=grade,
+            status='processing',
+            batch_id=batch_id
+        )
+        for student_id in accepted
+    ]
+    
+    def save_batch(session: Session):
+        blob_id = store_blob(session, extracted_text)  # um blob para o lote todo
+        jobs = {}
+        for material in materials:
+            material.original_blob_id = blob_id
+            session.add(material)
+            start_run(session, 'material', material.id)
+            jobs[material.id] = enqueue(session, 'adapt_material', material.id).id
+        return jobs
+    
+    jobs = await writer.run(save_batch)
+    print(f"📚 Batch {batch_id}: {len(materials)} material(s) queued, {len(rejected)} rejected")
+    
+    return {
+        "batch_id": batch_id,
+        "status": "processing",
+        "total": len(materials),
+        "materials": [
+            {"student_id": material.student_id, "id": material.id, "job_id": jobs[material.id], "status": "processing"}
+            for material in materials
+        ],
+        "rejected": rejected,
+        "message": f"{len(materials)} material(s) uploaded. AI adaptation in progress."
+    }
+
+
+def material_batch_progress(db: Session, batch_id: str) -> Optional[Dict[str, Any]]:
+    """Aggregated progress and per-student results of a batch (None if it does not exist)"""
+    rows = db.query(
+        AdaptedMaterial.id, AdaptedMaterial.student_id, Student.name, AdaptedMaterial.title,
+        AdaptedMaterial.original_filename, AdaptedMaterial.status, AdaptedMaterial.adapted_pdf_path,
+        AdaptedMaterial.uploaded_at, AdaptedMaterial.processed_at,
+    ).outerjoin(Student, Student.id == AdaptedMaterial.student_id).filter(
+        AdaptedMaterial.batch_id == batch_id
+    ).order_by(AdaptedMaterial.student_id).all()
+    if not rows:
+        return None
+    
+    counts = {'processing': 0, 'completed': 0, 'error': 0}
+    for row in rows:
+        counts[row.status] = counts.get(row.status, 0) + 1
+    finished = len(rows) - counts['processing']
+    return {
+        "batch_id": batch_id,
+        "title": rows[0].title,
+        "original_filename": rows[0].original_filename,
+        "status": "processing" if counts['processing'] else ("completed" if not counts['error'] else "completed_with_errors"),
+        "total": len(rows),
+        "counts": counts,
+        "progress": round(finished / len(rows), 4),
+        "uploaded_at": rows[0].uploaded_at.isoformat() if rows[0].uploaded_at else None,
+        "materials": [
+            {
+                "id": row.id,
+                "student_id": row.student_id,
+                "student_name": row.name,
+                "status": row.status,
+                "processed_at": row.processed_at.isoformat() if row.processed_at else None,
+                "download_url": f"/api/materials/{row.id}/download-pdf" if row.status == 'completed' and row.adapted_pdf_path else None,
+            }
+            for row in rows
+        ],
+    }
+
+
+@app.get("/api/materials/batches/{batch_id}")
+def get_material_batch(batch_id: str, db: Session = Depends(get_read_db)):
+    """Progress of a class-wide batch (counts by status) and the material of each student"""
+    progress = material_batch_progress(db, batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail=f"Material batch with id '{batch_id}' not found")
+    return progress
+
+
 @app.get("/api/students/{student_id}/materials")
-def get_student_materials(student_id: str, db: Session = Depends(get_db)):
-    """Get all adapted materials for a student"""
-    materials = db.query(AdaptedMaterial).filter(
-        AdaptedMaterial.student_id == student_id
-    ).order_by(AdaptedMaterial.uploaded_at.desc()).all()
+def get_student_materials(
+    student_id: str,
+    response: Response,
+    status: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    db: Session = Depends(get_read_db)
+):
+    """Get adapted materials for a student (keyset pagination on uploaded_at/id)"""
+    query = db.query(AdaptedMaterial).filter(AdaptedMaterial.student_id == student_id)
+    if status:
+        query = query.filter(AdaptedMaterial.status == status)
+    
+    total = count_rows(query) if include_total else None
+    materials, next_cursor = keyset_page(
+        query, [AdaptedMaterial.uploaded_at, AdaptedMaterial.id], cursor, limit, descending=(order == "desc")
+    )
+    set_page_headers(response, next_cursor, total)
     
     return [{
         "id": m.id,
@@ -766,21 +1380,22 @@ def get_student_materials(student_id: str, db: Session = Depends(get_db)):
         "status": m.status,
         "uploaded_at": m.uploaded_at.isoformat() if m.uploaded_at else None,
         "processed_at": m.processed_at.isoformat() if m.processed_at else None,
-        "has_adaptation": m.adaptation_result is not None
+        "has_adaptation": m.adaptation_blob_id is not None
     } for m in materials]
 
 
 @app.get("/api/materials/{material_id}")
-def get_material_details(material_id: str, db: Session = Depends(get_db)):
+def get_material_details(material_id: str, db: Session = Depends(get_read_db)):
     """Get detailed information about an adapted material"""
     material = db.query(AdaptedMaterial).filter(AdaptedMaterial.id == material_id).first()
     if not material:
         raise HTTPException(status_code=404, detail=f"Material with id '{material_id}' not found")
     
     adaptation_data = None
-    if material.adaptation_result:
+    adaptation_text = material.adaptation_result  # descomprime uma vez só
+    if adaptation_text:
         try:
-            adaptation_data = json.loads(material.adaptation_result)
+            adaptation_data = json.loads(adaptation_text)
         except:
             pass
     
@@ -800,31 +1415,34 @@ def get_material_details(material_id: str, db: Session = Depends(get_db)):
     }
 
 
-def adapt_material_with_ai(material_id: str, db: Session):
-    """Background task to adapt material using AI"""
+def update_material_fields(material_id: str, **fields):
+    """Apply column updates to an AdaptedMaterial through the single writer and wait for the commit"""
+    def apply(session: Session):
+        material = session.get(AdaptedMaterial, material_id)
+        if material:
+            for field, value in fields.items():
+                setattr(material, field, value)
+    writer.execute(apply)
+
+
+def load_material_ai_inputs(material_id: str) -> Tuple[str, Dict[str, Any], PEIDocument]:
+    """Read the material text and rebuild the student's PEIDocument for the adapter"""
     db = SessionLocal()
     
     try:
         material = db.query(AdaptedMaterial).filter(AdaptedMaterial.id == material_id).first()
         if not material:
-            print(f"❌ Material {material_id} not found")
-            return
+            raise PermanentJobError(f"Material {material_id} not found")
         
         # Get PEI
         pei = db.query(PEI).filter(PEI.id == material.pei_id).first()
         if not pei:
-            print(f"❌ PEI not found for material {material_id}")
-            material.status = 'error'
-            db.commit()
-            return
+            raise PermanentJobError(f"PEI not found for material {material_id}")
         
         # Get student
         student = db.query(Student).filter(Student.id == material.student_id).first()
         if not student:
-            print(f"❌ Student not found for material {material_id}")
-            material.status = 'error'
-            db.commit()
-            return
+            raise PermanentJobError(f"Student not found for material {material_id}")
         
         # Helper function to safely parse JSON fields
         def safe_json_parse(field, default):
@@ -865,66 +1483,168 @@ def adapt_material_with_ai(material_id: str, db: Session):
             print(f"❌ Error building PEIDocument: {str(pei_error)}")
             import traceback
             traceback.print_exc()
-            material.status = 'error'
-            db.commit()
-            return
+            raise PermanentJobError(f"Error building PEIDocument: {pei_error}")
         
-        # Call AI adapter
-        print(f"🤖 Adapting material {material_id} with AI...")
-        adaptation_result = PEAIOrchestrator.adapt_material(
-            material_text=material.original_content,
-            material_metadata={
-                "title": material.title,
-                "subject": material.subject,
-                "grade": material.grade
-            },
-            pei_document=pei_doc
-        )
+        # Libera a transação de leitura antes da chamada longa ao LLM
+        material_text = material.original_content
+        material_metadata = {
+            "title": material.title,
+            "subject": material.subject,
+            "grade": material.grade
+        }
+        return material_text, material_metadata, pei_doc
+    finally:
+        db.close()
+
+
+def save_material_adaptation(material_id: str, adaptation_result: Dict[str, Any]):
+    """Render the adapted PDF and store the adaptation JSON"""
+    # Save JSON result
+    adaptation_json = json.dumps(adaptation_result, ensure_ascii=False)
+    adapted_pdf_path = None
+    
+    # Generate PDF from adaptation result
+    print(f"📄 Generating PDF for material {material_id}...")
+    try:
+        pdf_buffer = generate_pdf_from_json(adaptation_result)
+        pdf_bytes = pdf_buffer.read()
         
-        # Save JSON result
-        material.adaptation_result = json.dumps(adaptation_result, ensure_ascii=False)
+        # Save PDF to file
+        pdf_dir = "adapted_pdfs"
+        os.makedirs(pdf_dir, exist_ok=True)
         
-        # Generate PDF from adaptation result
-        print(f"📄 Generating PDF for material {material_id}...")
-        try:
-            pdf_buffer = generate_pdf_from_json(adaptation_result)
-            pdf_bytes = pdf_buffer.read()
-            
-            # Save PDF to file
-            pdf_dir = "adapted_pdfs"
-            os.makedirs(pdf_dir, exist_ok=True)
-            
-            pdf_filename = f"{material_id}_adapted.pdf"
-            pdf_path = os.path.join(pdf_dir, pdf_filename)
-            
-            with open(pdf_path, "wb") as f:
-                f.write(pdf_bytes)
-            
-            material.adapted_pdf_path = pdf_path
-            print(f"✅ PDF saved to {pdf_path}")
-            
-        except Exception as pdf_error:
-            print(f"⚠️ Error generating PDF: {str(pdf_error)}")
-            # Continue even if PDF generation fails - JSON is still available
+        pdf_filename = f"{material_id}_adapted.pdf"
+        pdf_path = os.path.join(pdf_dir, pdf_filename)
         
-        material.status = 'completed'
-        material.processed_at = datetime.utcnow()
-        db.commit()
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
         
-        print(f"✅ Material {material_id} adapted successfully")
+        adapted_pdf_path = pdf_path
+        print(f"✅ PDF saved to {pdf_path}")
+        
+    except Exception as pdf_error:
+        print(f"⚠️ Error generating PDF: {str(pdf_error)}")
+        # Continue even if PDF generation fails - JSON is still available
+    
+    def save_adaptation(session: Session):
+        saved = session.get(AdaptedMaterial, material_id)
+        if saved:
+            saved.adaptation_blob_id = store_blob(session, adaptation_json)
+            saved.adapted_pdf_path = adapted_pdf_path
+            saved.status = 'completed'
+            saved.processed_at = datetime.utcnow()
+    
+    writer.execute(save_adaptation)
+    
+    print(f"✅ Material {material_id} adapted successfully")
+
+
+async def adapt_material_with_ai(material_id: str):
+    """Adapt material using AI (adapt_material job; exceptions make the job retry)"""
+    events = GenerationRecorder('material', material_id)
+    try:
+        material_text, material_metadata, pei_doc = await asyncio.to_thread(load_material_ai_inputs, material_id)
+        await events.emit('started')
+        
+        # Call AI adapter - seções e blocos vão para /api/materials/{id}/events
+        print(f"🤖 Adapting material {material_id} with AI...")
+        adaptation_result = await PEAIOrchestrator.adapt_material_async(
+            material_text=material_text,
+            material_metadata=material_metadata,
+            pei_document=pei_doc,
+            on_section=events.section
+        )
+        
+        # PDF (CPU) e gravação fora do event loop
+        await asyncio.to_thread(save_material_adaptation, material_id, adaptation_result)
+        await events.emit('done', payload={"sections": events.sections})
         
     except Exception as e:
         print(f"❌ Error adapting material {material_id}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        material.status = 'error'
-        db.commit()
-    finally:
-        db.close()
+        await emit_attempt_failed(events, e)
+        raise
+
+
+async def emit_attempt_failed(events: GenerationRecorder, error: Exception):
+    # Não terminal: o job ainda pode ser repetido; 'error' só no on_give_up
+    try:
+        await events.emit('attempt_failed', payload={"error": str(error)})
+    except Exception as e:
+        print(f"⚠️ Could not record generation event: {e}")
+
+
+def give_up_pei(pei_id: str, error: str):
+    update_pei_fields(pei_id, ai_processing_status='failed')
+    record_event('pei', pei_id, 'error', payload={"error": error})
+
+
+def give_up_digest(response_id: str, error: str):
+    # Opcional: sem o resumo a geração final usa a resposta completa
+    print(f"⚠️ Digest of response {response_id} gave up ({error}); the PEI will use the full response")
+
+
+def give_up_material(material_id: str, error: str):
+    update_material_fields(material_id, status='error')
+    record_event('material', material_id, 'error', payload={"error": error})
+
+
+# Tipos de job de IA: handler + o que fazer quando as tentativas acabam
+AI_JOB_KINDS = {
+    'process_pei': JobKind(
+        handler=process_pei_with_ai,
+        on_give_up=give_up_pei,
+    ),
+    'adapt_material': JobKind(
+        handler=adapt_material_with_ai,
+        on_give_up=give_up_material,
+    ),
+    'digest_response': JobKind(
+        handler=digest_professional_response,
+        on_give_up=give_up_digest,
+    ),
+}
+ai_worker_pool = JobWorkerPool(AI_JOB_KINDS, concurrency=AI_WORKERS_IN_API)
+
+
+# Chave do advisory lock do requeue_stuck_targets (PostgreSQL)
+REQUEUE_LOCK_KEY = 0x70656169  # 'peai'
+
+
+def requeue_stuck_targets() -> int:
+    """Queue jobs for PEIs/materials left 'processing' without an active job (e.g. old BackgroundTasks).
+
+    Runs on every API startup, so replicas starting together would both see
+    no active job and enqueue twice: on PostgreSQL the unit takes a
+    transaction-level advisory lock first, and the second replica only reads
+    the active jobs after the first has committed (READ COMMITTED). On SQLite
+    the writer's BEGIN IMMEDIATE already serializes the units across processes.
+    """
+    def apply(session: Session) -> int:
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": REQUEUE_LOCK_KEY})
+        active = {
+            (kind, target_id)
+            for kind, target_id in session.query(AIJob.kind, AIJob.target_id).filter(
+                AIJob.status.in_(('queued', 'running'))
+            )
+        }
+        stuck = [
+            ('process_pei', pei_id)
+            for (pei_id,) in session.query(PEI.id).filter(PEI.ai_processing_status.in_(('pending', 'processing')))
+        ] + [
+            ('adapt_material', material_id)
+            for (material_id,) in session.query(AdaptedMaterial.id).filter(AdaptedMaterial.status == 'processing')
+        ]
+        requeued = [(kind, target_id) for kind, target_id in stuck if (kind, target_id) not in active]
+        for kind, target_id in requeued:
+            start_run(session, 'pei' if kind == 'process_pei' else 'material', target_id)
+            enqueue(session, kind, target_id)
+        return len(requeued)
+    return writer.execute(apply)
 
 
 @app.get("/api/materials/{material_id}/download-pdf")
-def download_adapted_material_pdf(material_id: str, db: Session = Depends(get_db)):
+def download_adapted_material_pdf(material_id: str, db: Session = Depends(get_read_db)):
     """
     Download adapted material as PDF
     """
@@ -949,12 +1669,13 @@ def download_adapted_material_pdf(material_id: str, db: Session = Depends(get_db
             pdf_bytes = f.read()
     else:
         # Generate PDF on-the-fly if not already generated
-        if not material.adaptation_result:
+        adaptation_text = material.adaptation_result
+        if not adaptation_text:
             raise HTTPException(status_code=400, detail="No adaptation result available")
         
         # Parse adaptation result
         try:
-            adaptation_data = json.loads(material.adaptation_result)
+            adaptation_data = json.loads(adaptation_text)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error parsing adaptation data: {str(e)}")
         
@@ -979,83 +1700,6 @@ def download_adapted_material_pdf(material_id: str, db: Session = Depends(get_db
     )
 
 
-@app.get("/api/pei/{pei_id}/download-pdf")
-async def download_pei_pdf(pei_id: str, db: Session = Depends(get_db)):
-    """
-    Gera e retorna o PDF do PEI
-    """
-    try:
-        print(f"[DEBUG] Requisição de PDF para PEI: {pei_id}")
-        
-        # Busca o PEI do banco
-        pei = db.query(PEI).filter_by(id=pei_id).first()
-        
-        if not pei:
-            print(f"[ERROR] PEI não encontrado: {pei_id}")
-            raise HTTPException(status_code=404, detail="PEI não encontrado")
-        
-        print(f"[DEBUG] PEI encontrado: {pei.id}, status: {pei.status}")
-        
-        # Busca dados do aluno
-        student = db.query(Student).filter_by(id=pei.student_id).first()
-        
-        if not student:
-            print(f"[ERROR] Estudante não encontrado: {pei.student_id}")
-            raise HTTPException(status_code=404, detail="Estudante não encontrado")
-        
-        print(f"[DEBUG] Estudante encontrado: {student.name}")
-        
-        # Monta dados para o PDF
-        pei_data = {
-            "student_name": student.name,
-            "special_needs": pei.special_needs or "Não especificado",
-            "status": pei.status,
-            "created_at": pei.created_at.strftime("%d/%m/%Y %H:%M") if pei.created_at else "",
-            "initial_observations": pei.initial_observations or "",
-            "cognitive_report": pei.cognitive_report or "",
-            "strengths": json.loads(pei.strengths) if pei.strengths and pei.strengths != "[]" else [],
-            "difficulties": json.loads(pei.difficulties) if pei.difficulties and pei.difficulties != "[]" else [],
-            "short_term_goals": json.loads(pei.short_term_goals) if pei.short_term_goals and pei.short_term_goals != "[]" else [],
-            "medium_term_goals": json.loads(pei.medium_term_goals) if pei.medium_term_goals and pei.medium_term_goals != "[]" else [],
-            "long_term_goals": json.loads(pei.long_term_goals) if pei.long_term_goals and pei.long_term_goals != "[]" else [],
-            "teaching_strategies": pei.teaching_strategies or "",
-            "assistive_resources": json.loads(pei.assistive_resources) if pei.assistive_resources and pei.assistive_resources != "[]" else [],
-            "evaluation_methods": pei.evaluation_methods or "",
-        }
-        
-        print(f"[DEBUG] Dados do PEI preparados, gerando PDF...")
-        
-        # Importa e chama o gerador de PDF
-        from pei_pdf_generator import generate_pei_pdf
-        pdf_buffer = generate_pei_pdf(pei_data)
-        
-        print(f"[DEBUG] PDF gerado com sucesso")
-        
-        # Nome do arquivo
-        safe_name = student.name.replace(' ', '_').replace('/', '_')
-        filename = f"PEI_{safe_name}_{datetime.now().strftime('%Y%m%d')}.pdf"
-        
-        print(f"[DEBUG] Enviando arquivo: {filename}")
-        
-        # Retorna o PDF
-        return StreamingResponse(
-            pdf_buffer,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}",
-                "Content-Type": "application/pdf"
-            }
-        )
-        
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        print(f"[ERROR] Erro ao gerar PDF do PEI: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Erro ao gerar PDF: {str(e)}")
-
-
 @app.post("/api/pei/{pei_id}/approve")
 def approve_pei(pei_id: str, db: Session = Depends(get_db)):
     """
@@ -1086,6 +1730,7 @@ def approve_pei(pei_id: str, db: Session = Depends(get_db)):
         student.status = 'active'
     
     db.commit()
+    pei_cache.invalidate(pei_id)
     
     return {
         "status": "success",
@@ -1097,7 +1742,7 @@ def approve_pei(pei_id: str, db: Session = Depends(get_db)):
 
 
 @app.get("/api/pei/{pei_id}/status")
-def get_pei_status(pei_id: str, db: Session = Depends(get_db)):
+def get_pei_status(pei_id: str, db: Session = Depends(get_read_db)):
     """
     Get detailed status of PEI including workflow information
     """
@@ -1105,22 +1750,18 @@ def get_pei_status(pei_id: str, db: Session = Depends(get_db)):
     if not pei:
         raise HTTPException(status_code=404, detail=f"PEI with id '{pei_id}' not found")
     
-    # Get professional responses
-    responses = db.query(ProfessionalResponse).filter(ProfessionalResponse.pei_id == pei_id).all()
+    # Só os ids de quem respondeu - sem carregar os JSONs de resposta
+    responded_ids = {
+        professional_id for (professional_id,) in db.query(ProfessionalResponse.professional_id).filter(
+            ProfessionalResponse.pei_id == pei_id
+        )
+    }
     professionals = json.loads(pei.professionals) if pei.professionals else []
     
-    # Check completion status
+    # Check completion status (só usa a quantidade de respostas)
     completion_status = WorkflowOrchestratorAgent.check_completion_status(
         total_professionals=len(professionals),
-        responses_received=[
-            AIProfessionalResponse(
-                professional_id=r.professional_id,
-                professional_type=r.professional_type,
-                professional_name=r.professional_name,
-                responses=json.loads(r.responses) if isinstance(r.responses, str) else r.responses,
-                timestamp=r.submitted_at.isoformat()
-            ) for r in responses
-        ]
+        responses_received=list(responded_ids)
     )
     
     return {
@@ -1129,14 +1770,14 @@ def get_pei_status(pei_id: str, db: Session = Depends(get_db)):
         "ai_processing_status": pei.ai_processing_status,
         "ai_confidence_score": pei.ai_confidence_score,
         "completion_status": completion_status,
-        "responses_received": len(responses),
+        "responses_received": len(responded_ids),
         "total_professionals": len(professionals),
         "professionals": [
             {
                 "id": p.get('id'),
                 "name": p.get('name'),
                 "type": p.get('type'),
-                "has_responded": any(r.professional_id == p.get('id') for r in responses)
+                "has_responded": p.get('id') in responded_ids
             } for p in professionals
         ],
         "created_at": pei.created_at.isoformat() if pei.created_at else None,
@@ -1144,6 +1785,82 @@ def get_pei_status(pei_id: str, db: Session = Depends(get_db)):
     }
 
 
+def generation_events_response(target_kind: str, target_id: str, request: Request) -> StreamingResponse:
+    last_event_id = request.headers.get("last-event-id")
+    return StreamingResponse(
+        stream_events(target_kind, target_id, int(last_event_id) if last_event_id and last_event_id.isdigit() else None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/pei/{pei_id}/events")
+async def stream_pei_generation(pei_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-Sent Events with the PEI sections as the AI generates them
+    (queued, started, section..., done | error)
+    """
+    if not await db.get(PEI, pei_id):
+        raise HTTPException(status_code=404, detail=f"PEI with id '{pei_id}' not found")
+    return generation_events_response('pei', pei_id, request)
+
+
+@app.get("/api/materials/{material_id}/events")
+async def stream_material_generation(material_id: str, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-Sent Events with the adapted material sections and blocks as the AI generates them
+    """
+    if not await db.get(AdaptedMaterial, material_id):
+        raise HTTPException(status_code=404, detail=f"Material with id '{material_id}' not found")
+    return generation_events_response('material', material_id, request)
+
+
+def read_material_batch(batch_id: str) -> Optional[Dict[str, Any]]:
+    db = ReadSessionLocal()
+    try:
+        return material_batch_progress(db, batch_id)
+    finally:
+        db.close()
+
+
+async def stream_batch_progress(batch_id: str) -> AsyncIterator[str]:
+    """SSE body: a 'progress' event whenever a material of the batch finishes, then 'done'"""
+    yield f"retry: {int(GENERATION_SSE_POLL_SECONDS * 4000)}\n\n"
+    sent, event_id = None, 0
+    started = last_activity = time.monotonic()
+    while time.monotonic() - started < GENERATION_SSE_MAX_SECONDS:
+        progress = await asyncio.to_thread(read_material_batch, batch_id)
+        if progress is None:
+            return
+        if progress["counts"] != sent:
+            sent = progress["counts"]
+            event_id += 1
+            last_activity = time.monotonic()
+            yield format_sse(event_id, 'progress', progress)
+        if not progress["counts"]["processing"]:
+            yield format_sse(event_id + 1, 'done', {"status": progress["status"]})
+            return
+        if time.monotonic() - last_activity >= GENERATION_SSE_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_activity = time.monotonic()
+        await asyncio.sleep(GENERATION_SSE_POLL_SECONDS)
+
+
+@app.get("/api/materials/batches/{batch_id}/events")
+async def stream_material_batch(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Server-Sent Events with the aggregated progress of a class-wide batch
+    (progress... as students finish, then done)
+    """
+    if not (await db.execute(select(AdaptedMaterial.id).where(AdaptedMaterial.batch_id == batch_id).limit(1))).first():
+        raise HTTPException(status_code=404, detail=f"Material batch with id '{batch_id}' not found")
+    return StreamingResponse(
+        stream_batch_progress(batch_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/notifications/send-survey-links")
 def send_survey_links(pei_id: str, db: Session = Depends(get_db)):
     """
@@ -0,0 +1,35 @@
+"""
+Migration: Add PEI.ai_input_fingerprint and AIJob.input_fingerprint columns
+
+Usadas para deduplicar gatilhos de geração de PEI (mesmas respostas = mesma
+geração). Bancos sem a tabela ai_jobs a recebem completa pelo create_all.
+"""
+from sqlalchemy import inspect
+
+from database import AIJob, engine
+
+NEW_COLUMNS = [
+    ("peis", "ai_input_fingerprint"),
+    ("ai_jobs", "input_fingerprint"),
+]
+
+
+def migrate():
+    try:
+        AIJob.__table__.create(bind=engine, checkfirst=True)
+        with engine.begin() as conn:
+            inspector = inspect(conn)
+            for table, column in NEW_COLUMNS:
+                columns = [col["name"] for col in inspector.get_columns(table)]
+                if column in columns:
+                    print(f"✅ Column {table}.{column} already exists.")
+                    continue
+                print(f"Adding {table}.{column} column...")
+                conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} VARCHAR")
+        print("✅ Migration completed successfully!")
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+
+
+if __name__ == "__main__":
+    migrate()
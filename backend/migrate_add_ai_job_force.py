@@ -0,0 +1,29 @@
+"""
+Migration: Add AIJob.force column
+
+Marca o job de um `process-ai?force=true`: o worker gera o PEI de novo mesmo
+com as respostas inalteradas, sem o llm_cache e sem reaproveitar as seções
+da geração anterior. Bancos sem a tabela ai_jobs a recebem completa pelo create.
+"""
+from sqlalchemy import inspect
+
+from database import AIJob, engine
+
+
+def migrate():
+    try:
+        AIJob.__table__.create(bind=engine, checkfirst=True)
+        with engine.begin() as conn:
+            columns = [col["name"] for col in inspect(conn).get_columns("ai_jobs")]
+            if "force" in columns:
+                print("✅ Column ai_jobs.force already exists.")
+                return
+            print("Adding ai_jobs.force column...")
+            conn.exec_driver_sql("ALTER TABLE ai_jobs ADD COLUMN force BOOLEAN")
+        print("✅ Migration completed successfully!")
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,28 @@
+"""
+Migration: Add PEI.ai_sections column
+
+Estado por seção da última geração do PEI (resultado, fontes e hash das
+respostas), usado para regenerar só as seções afetadas por respostas alteradas.
+"""
+from sqlalchemy import inspect
+
+from database import engine
+
+
+def migrate():
+    try:
+        with engine.begin() as conn:
+            columns = [col["name"] for col in inspect(conn).get_columns("peis")]
+            if "ai_sections" in columns:
+                print("✅ Column peis.ai_sections already exists.")
+                return
+            print("Adding peis.ai_sections column...")
+            column_type = "JSONB" if conn.dialect.name == "postgresql" else "TEXT"
+            conn.exec_driver_sql(f"ALTER TABLE peis ADD COLUMN ai_sections {column_type}")
+        print("✅ Migration completed successfully!")
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+
+
+if __name__ == "__main__":
+    migrate()
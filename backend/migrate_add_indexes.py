@@ -0,0 +1,44 @@
+"""
+Migration: Add lookup indexes (students, respondents, peis, professional_responses, adapted_materials)
+
+Os índices são lidos dos modelos em database.py, então esta migração
+sempre cria exatamente o que o create_all criaria num banco novo.
+"""
+from sqlalchemy import inspect
+
+from database import Base, engine
+
+# Índices substituídos por versões que incluem o id (paginação keyset)
+SUPERSEDED_INDEXES = [
+    "ix_students_name",
+    "ix_peis_created_at",
+    "ix_peis_student_created",
+    "ix_adapted_materials_student_uploaded",
+]
+
+
+def migrate():
+    try:
+        with engine.begin() as conn:
+            inspector = inspect(conn)
+            for table in Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue  # criada pelo create_all / pela migração própria
+                existing = {index["name"] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name in existing:
+                        print(f"✅ Index {index.name} already exists.")
+                        continue
+                    print(f"Adding index {index.name} on {table.name}...")
+                    index.create(bind=conn)
+            for index_name in SUPERSEDED_INDEXES:
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index_name}")
+            # Atualiza as estatísticas usadas pelo planejador de consultas
+            conn.exec_driver_sql("ANALYZE")
+        print("✅ Migration completed successfully!")
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,30 @@
+"""
+Migration: Add AdaptedMaterial.batch_id column
+
+Agrupa os materiais criados por um upload da turma inteira
+(POST /api/materials/batch-upload) para o progresso e os resultados do lote.
+"""
+from sqlalchemy import inspect
+
+from database import engine
+
+
+def migrate():
+    try:
+        with engine.begin() as conn:
+            columns = [col["name"] for col in inspect(conn).get_columns("adapted_materials")]
+            if "batch_id" in columns:
+                print("✅ Column adapted_materials.batch_id already exists.")
+                return
+            print("Adding adapted_materials.batch_id column...")
+            conn.exec_driver_sql("ALTER TABLE adapted_materials ADD COLUMN batch_id VARCHAR")
+            conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS ix_adapted_materials_batch_id ON adapted_materials (batch_id)"
+            )
+        print("✅ Migration completed successfully!")
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,28 @@
+"""
+Migration: Add PEI.ai_response_digests column
+
+Resumos por profissional do modo progressivo (PEI_PROGRESSIVE_DIGESTS=1),
+gravados à medida que as respostas chegam e usados na geração final do PEI.
+"""
+from sqlalchemy import inspect
+
+from database import engine
+
+
+def migrate():
+    try:
+        with engine.begin() as conn:
+            columns = [col["name"] for col in inspect(conn).get_columns("peis")]
+            if "ai_response_digests" in columns:
+                print("✅ Column peis.ai_response_digests already exists.")
+                return
+            print("Adding peis.ai_response_digests column...")
+            column_type = "JSONB" if conn.dialect.name == "postgresql" else "TEXT"
+            conn.exec_driver_sql(f"ALTER TABLE peis ADD COLUMN ai_response_digests {column_type}")
+        print("✅ Migration completed successfully!")
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+
+
+if __name__ == "__main__":
+    migrate()
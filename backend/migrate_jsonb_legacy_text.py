@@ -0,0 +1,42 @@
+"""
+Migration: Tag legacy free text stored as JSONB strings (PostgreSQL only)
+
+Antes desta correção, o JSONText gravava texto livre que não é JSON (ex.:
+special_needs "TEA, TDAH") como string JSONB e devolvia qualquer string JSONB
+sem aspas, então json.dumps("x") voltava como x. Agora o texto livre fica em
+{"__peai_legacy_text__": texto} e as strings JSONB voltam como JSON. As
+strings JSONB já gravadas eram lidas como texto livre; esta migração as
+marca assim, para que continuem sendo lidas do mesmo jeito.
+"""
+from sqlalchemy import inspect
+
+from database import IS_SQLITE, Base, JSONText, engine
+
+
+def migrate():
+    if IS_SQLITE:
+        print("✅ SQLite guarda JSONText como TEXT; nada a migrar.")
+        return
+    try:
+        with engine.begin() as conn:
+            existing = set(inspect(conn).get_table_names())
+            for table in Base.metadata.sorted_tables:
+                if table.name not in existing:
+                    continue
+                for column in table.columns:
+                    if not isinstance(column.type, JSONText):
+                        continue
+                    updated = conn.exec_driver_sql(
+                        f'UPDATE {table.name} SET "{column.name}" = '
+                        f"jsonb_build_object('{JSONText.LEGACY_TEXT_KEY}', \"{column.name}\" #>> '{{}}') "
+                        f"WHERE jsonb_typeof(\"{column.name}\") = 'string'"
+                    ).rowcount
+                    if updated:
+                        print(f"   {table.name}.{column.name}: {updated} linha(s)")
+        print("✅ Migration completed successfully!")
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+
+
+if __name__ == "__main__":
+    migrate()
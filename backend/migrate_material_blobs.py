@@ -0,0 +1,92 @@
+"""
+Migration: Move AdaptedMaterial.original_content / adaptation_result into material_blobs
+
+Os textos grandes passam a ficar comprimidos (zlib) na tabela material_blobs,
+endereçados pelo sha256 do conteúdo. As colunas antigas são esvaziadas e o
+banco é compactado com VACUUM.
+"""
+import sqlite3
+import zlib
+
+from database import DATABASE_PATH, blob_id_for
+
+
+def migrate():
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS material_blobs (
+                id VARCHAR NOT NULL PRIMARY KEY,
+                codec VARCHAR NOT NULL,
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL
+            )
+        """)
+        
+        cursor.execute("PRAGMA table_info(adapted_materials)")
+        columns = [col[1] for col in cursor.fetchall()]
+        
+        for column in ("original_blob_id", "adaptation_blob_id"):
+            if column not in columns:
+                print(f"Adding {column} column...")
+                cursor.execute(f"""
+                    ALTER TABLE adapted_materials 
+                    ADD COLUMN {column} VARCHAR REFERENCES material_blobs(id)
+                """)
+        
+        legacy = [c for c in ("original_content", "adaptation_result") if c in columns]
+        if not legacy:
+            conn.commit()
+            print("✅ No inline material payloads found. No data migration needed.")
+            return
+        
+        size_before = 0
+        moved = 0
+        rows = cursor.execute(
+            f"SELECT id, {', '.join(legacy)} FROM adapted_materials"
+        ).fetchall()
+        for row in rows:
+            material_id, values = row[0], dict(zip(legacy, row[1:]))
+            updates = {}
+            for legacy_column, blob_column in (
+                ("original_content", "original_blob_id"),
+                ("adaptation_result", "adaptation_blob_id"),
+            ):
+                text = values.get(legacy_column)
+                if text is None:
+                    continue
+                raw = text.encode("utf-8")
+                size_before += len(raw)
+                blob_id = blob_id_for(text)
+                cursor.execute(
+                    "INSERT OR IGNORE INTO material_blobs (id, codec, size, data) VALUES (?, 'zlib', ?, ?)",
+                    (blob_id, len(raw), zlib.compress(raw, 6)),
+                )
+                updates[blob_column] = blob_id
+                updates[legacy_column] = None
+            if updates:
+                assignments = ", ".join(f"{column} = ?" for column in updates)
+                cursor.execute(
+                    f"UPDATE adapted_materials SET {assignments} WHERE id = ?",
+                    (*updates.values(), material_id),
+                )
+                moved += 1
+        
+        conn.commit()
+        size_after = cursor.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM material_blobs").fetchone()[0]
+        print(f"✅ {moved} materials migrated ({size_before / 1024:.1f} KB inline → {size_after / 1024:.1f} KB compressed)")
+        
+        print("Compacting database (VACUUM)...")
+        cursor.execute("VACUUM")
+        print("✅ Migration completed successfully!")
+    
+    except Exception as e:
+        print(f"❌ Migration failed: {str(e)}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
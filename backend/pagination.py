@@ -0,0 +1,87 @@
+"""
+Paginação por cursor (keyset) para os endpoints de listagem
+
+Em vez de OFFSET, cada página continua a partir dos valores da última linha
+da página anterior (ex: created_at + id), então o custo de cada página é o
+mesmo independentemente do tamanho da tabela, desde que exista um índice
+com as colunas de ordenação.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import DateTime, and_, or_
+from sqlalchemy.orm import Query
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> List[Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if not isinstance(payload, list) or len(payload) != len(columns):
+            raise ValueError("tamanho do cursor não confere")
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) and value else value
+            for column, value in zip(columns, payload)
+        ]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def _after(columns: Sequence, values: Sequence[Any], descending: bool):
+    """(c1, c2, ...) < (v1, v2, ...) expandido em ORs, para o planner usar o índice"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal_prefix = [columns[j] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def keyset_page(
+    query: Query,
+    columns: Sequence,
+    cursor: Optional[str],
+    limit: Optional[int],
+    descending: bool = True,
+) -> Tuple[list, Optional[str]]:
+    """Return one page of `query` ordered by `columns` and the cursor for the next page.
+
+    The last column must be unique (the primary key) so the order is total.
+    Without `limit` and `cursor` the whole result is returned, as before.
+    """
+    ordering = [c.desc() if descending else c.asc() for c in columns]
+    if limit is None and cursor is None:
+        return query.order_by(*ordering).all(), None
+
+    limit = limit or DEFAULT_PAGE_SIZE
+    if cursor:
+        query = query.filter(_after(columns, decode_cursor(cursor, columns), descending))
+
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], c.key) for c in columns])
+    return rows, next_cursor
+
+
+def count_rows(query: Query) -> int:
+    """COUNT(*) with the same filters as `query`, without loading rows"""
+    return query.order_by(None).count()
+
+
+def set_page_headers(response: Response, next_cursor: Optional[str], total: Optional[int] = None):
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
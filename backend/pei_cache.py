@@ -0,0 +1,96 @@
+"""
+Cache em memória dos PEIs serializados (read-through, versionado)
+
+GET /api/pei/{id} e /api/students/{id}/pei faziam json.loads de ~10 colunas
+e a validação Pydantic completa a cada chamada, mas o PEI só muda quando a
+IA grava o resultado, quando é aprovado ou quando chega uma resposta.
+
+Cada entrada guarda os bytes do JSON já pronto junto com a versão do PEI
+(updated_at + número de respostas). A versão é lida do banco a cada request,
+então escritas feitas por outro processo/réplica também invalidam a entrada;
+as escritas deste processo chamam `invalidate` para liberar a memória na hora.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+PEI_CACHE_MAX_BYTES = int(os.getenv("PEI_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+
+class PEICache:
+    """Thread-safe LRU of serialized payloads, bounded by total payload size"""
+
+    def __init__(self, max_bytes: int = PEI_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Hashable, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, pei_id: str, version: Hashable) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(pei_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(pei_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, pei_id: str, version: Hashable, payload: bytes):
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(pei_id)
+            self._entries[pei_id] = (version, payload)
+            self._bytes += len(payload)
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def get_or_build(self, pei_id: str, version: Hashable, build: Callable[[], bytes]) -> bytes:
+        """Return the cached payload for this version or build, store and return it"""
+        payload = self.get(pei_id, version)
+        if payload is None:
+            payload = build()
+            self.put(pei_id, version, payload)
+        return payload
+
+    def invalidate(self, pei_id: str):
+        with self._lock:
+            if self._discard(pei_id):
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _discard(self, pei_id: str) -> bool:
+        entry = self._entries.pop(pei_id, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry[1])
+        return True
+
+
+pei_cache = PEICache()
@@ -0,0 +1,219 @@
+"""
+Limite de taxa das chamadas ao Gemini (requisições/min e tokens/min) com retry
+
+Quando uma turma inteira sobe materiais de uma vez, todos os jobs chamam o
+Gemini ao mesmo tempo e a cota estoura (429). Aqui cada chamada primeiro
+reserva espaço em dois token buckets compartilhados pelo processo, um de
+requisições por minuto e outro de tokens por minuto. Se o bucket está vazio,
+a chamada espera a sua vez em vez de falhar.
+
+Se mesmo assim vier 429 ou 5xx, a chamada é repetida com backoff
+exponencial e jitter. Um retry-after informado pela API tem prioridade.
+Num 429 o bucket inteiro pausa, então as outras chamadas também esperam.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "1000000"))
+GEMINI_BURST_FRACTION = float(os.getenv("GEMINI_BURST_FRACTION", "0.1"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "2"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "60"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `per_minute`.
+
+    `reserve` takes the tokens right away (the balance may go negative) and
+    returns how long the caller must wait, so callers are served in arrival
+    order and sync and async code can share one bucket.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Pedido maior que o bucket: espera encher por completo, não para sempre
+            self._tokens -= min(amount, self.capacity)
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def adjust(self, delta: float):
+        """Give back (positive) or charge (negative) tokens after the real usage is known"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + delta)
+
+    def pause(self, seconds: float):
+        """Hold every caller for `seconds` (the API said the quota is exhausted)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    code = getattr(error, "code", None)  # google.api_core.exceptions.GoogleAPICallError
+    if isinstance(code, int):
+        return code
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Delay the API asked for: Retry-After header, RetryInfo detail or 'retry in 12.5s'"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    match = re.search(r"retry (?:in|after) ([\d.]+)\s*s", str(error), re.IGNORECASE) or \
+        re.search(r'"?retryDelay"?\s*:\s*"([\d.]+)s"', str(error))
+    return float(match.group(1)) if match else None
+
+
+class RateLimiter:
+    """Shared rpm/tpm buckets plus retry with backoff for the Gemini calls of this process"""
+
+    def __init__(
+        self,
+        rpm: float = GEMINI_RPM,
+        tpm: float = GEMINI_TPM,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base: float = LLM_RETRY_BASE_SECONDS,
+        retry_max: float = LLM_RETRY_MAX_SECONDS,
+        window_seconds: float = 60.0,
+        burst_fraction: float = GEMINI_BURST_FRACTION,
+    ):
+        # Bucket cheio = só uma fração da cota da janela (a do Gemini é por minuto):
+        # com capacidade = cota inteira, a primeira janela deixaria passar quase o dobro
+        self.requests = TokenBucket(rpm, capacity=max(1.0, rpm * window_seconds / 60 * burst_fraction))
+        self.tokens = TokenBucket(tpm, capacity=max(1.0, tpm * window_seconds / 60 * burst_fraction))
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._lock = threading.Lock()
+        self.metrics: Dict[str, Any] = {
+            "calls": 0,
+            "throttled": 0,  # chamadas que esperaram o bucket
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "retries": 0,
+            "retries_429": 0,
+            "retries_5xx": 0,
+            "failures": 0,
+            "tokens_used": 0,
+        }
+
+    def _reserve(self, estimated_tokens: int) -> float:
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        with self._lock:
+            self.metrics["calls"] += 1
+            if wait > 0:
+                self.metrics["throttled"] += 1
+                self.metrics["wait_seconds"] += wait
+                self.metrics["max_wait_seconds"] = max(self.metrics["max_wait_seconds"], wait)
+        return wait
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Settle the tokens bucket with the usage reported by the API"""
+        if actual_tokens is None:
+            return
+        self.tokens.adjust(estimated_tokens - actual_tokens)
+        with self._lock:
+            self.metrics["tokens_used"] += actual_tokens
+
+    def _retry_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying, or None if the error is not retryable"""
+        code = status_code(error)
+        if code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+            with self._lock:
+                self.metrics["failures"] += 1
+            return None
+        # Full jitter: espalha as retentativas de quem falhou junto
+        delay = random.uniform(0, min(self.retry_max, self.retry_base * (2 ** attempt)))
+        hinted = retry_after(error)
+        if hinted is not None:
+            delay = max(delay, hinted)
+        if code == 429:
+            self.requests.pause(delay)
+        with self._lock:
+            self.metrics["retries"] += 1
+            self.metrics["retries_429" if code == 429 else "retries_5xx"] += 1
+        return delay
+
+    def call(self, fn: Callable[[], T], estimated_tokens: int = 0) -> T:
+        attempt = 0
+        while True:
+            wait = self._reserve(estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                print(f"⏳ Gemini {status_code(e)}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                attempt += 1
+
+    async def call_async(self, fn: Callable[[], Awaitable[T]], estimated_tokens: int = 0) -> T:
+        attempt = 0
+        while True:
+            wait = self._reserve(estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                print(f"⏳ Gemini {status_code(e)}, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+        calls = metrics["calls"]
+        metrics["avg_wait_ms"] = round(metrics["wait_seconds"] / calls * 1000, 2) if calls else 0.0
+        metrics["wait_seconds"] = round(metrics["wait_seconds"], 3)
+        metrics["max_wait_seconds"] = round(metrics["max_wait_seconds"], 3)
+        metrics["rpm"] = self.requests.rate * 60
+        metrics["tpm"] = self.tokens.rate * 60
+        return metrics
+
+
+gemini_rate_limiter = RateLimiter()
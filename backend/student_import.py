@@ -0,0 +1,286 @@
+"""
+Importação em lote de alunos (CSV ou array JSON)
+
+O corpo do request é lido em streaming e convertido em linhas à medida que
+chega; a cada IMPORT_CHUNK_SIZE linhas válidas, uma única unidade do
+escritor (db_writer) verifica duplicatas com um SELECT ... IN e insere o
+bloco com um INSERT em lote. O resultado de cada linha volta no relatório.
+
+Depois que um bloco foi gravado o request não falha mais: ao passar de
+MAX_IMPORT_ROWS a leitura para (o resto do corpo não é lido), e um JSON
+malformado no meio do corpo ou um bloco que não pôde ser gravado (ex.: id
+inserido por outro request entre o SELECT e o INSERT) encerram a importação
+com `error` no relatório. Antes do primeiro bloco, esses erros ainda fazem o
+request falhar (nada foi gravado).
+"""
+import codecs
+import csv
+import json
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from database import Student
+from db_writer import writer
+
+IMPORT_CHUNK_SIZE = 500
+MAX_IMPORT_ROWS = 10000
+
+
+class StudentImportRow(BaseModel):
+    id: Optional[str] = None
+    name: str = Field(min_length=1)
+    status: str = 'pending_form'
+    hasAccess: bool = False
+    birth_date: Optional[str] = None
+    grade: Optional[str] = None
+    school: Optional[str] = None
+
+
+class StudentImportResult(BaseModel):
+    row: int
+    id: Optional[str] = None
+    result: str  # 'created', 'duplicate', 'invalid'
+    error: Optional[str] = None
+
+
+class StudentImportReport(BaseModel):
+    total: int
+    created: int
+    duplicates: int
+    invalid: int
+    rejected: int = 0  # registros além de MAX_IMPORT_ROWS lidos antes de parar (0 ou 1)
+    error: Optional[str] = None  # importação interrompida depois de blocos já gravados
+    rows: List[StudentImportResult]
+
+
+async def _decode(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, str]]:
+    """Yield CSV records (header line = field names) as the body arrives"""
+    header: Optional[List[str]] = None
+    pending = ""  # linhas de um registro com campo entre aspas ainda aberto
+    buffer = ""
+
+    def parse(record: str):
+        nonlocal header
+        values = next(csv.reader([record]), [])
+        if header is None:
+            header = [h.strip() for h in values]
+            return None
+        if not any(v.strip() for v in values):
+            return None
+        return dict(zip(header, values))
+
+    async for text in _decode(chunks):
+        buffer += text
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            pending += line + "\n"
+            # Aspas em número ímpar: o campo continua na próxima linha
+            if pending.count('"') % 2:
+                continue
+            row = parse(pending.rstrip("\r\n"))
+            pending = ""
+            if row is not None:
+                yield row
+
+    pending += buffer
+    if pending.strip():
+        row = parse(pending.rstrip("\r\n"))
+        if row is not None:
+            yield row
+
+
+async def iter_json_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[object]:
+    """Yield the elements of a top-level JSON array without loading the whole body"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    finished = False
+    source = _decode(chunks)
+    exhausted = False
+
+    async def fill() -> bool:
+        nonlocal buffer, position, exhausted
+        try:
+            text = await source.__anext__()
+        except StopAsyncIteration:
+            exhausted = True
+            return False
+        buffer = buffer[position:] + text
+        position = 0
+        return True
+
+    def skip(chars: str):
+        nonlocal position
+        while position < len(buffer) and buffer[position] in chars:
+            position += 1
+
+    while not finished:
+        skip(" \t\r\n" + ("," if started else ""))
+        if position >= len(buffer):
+            if exhausted or not await fill():
+                break
+            continue
+        if not started:
+            if buffer[position] != "[":
+                raise HTTPException(status_code=400, detail="JSON body must be an array of students")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            finished = True
+            break
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if exhausted or not await fill():
+                raise HTTPException(status_code=400, detail="Malformed JSON array")
+            continue
+        # Um número no fim do buffer pode continuar no próximo pedaço
+        if end == len(buffer) and not exhausted and not isinstance(value, (dict, list, str)):
+            if await fill():
+                continue
+        position = end
+        yield value
+
+    if not finished:
+        raise HTTPException(status_code=400, detail="Malformed JSON array")
+
+
+def _clean(raw: object) -> object:
+    if not isinstance(raw, dict):
+        return raw
+    # CSV: células vazias = campo não informado
+    return {
+        key.strip(): value.strip() if isinstance(value, str) else value
+        for key, value in raw.items()
+        if key and not (isinstance(value, str) and not value.strip())
+    }
+
+
+def _insert_chunk(chunk: List[Tuple[int, dict]]):
+    """Writer unit: set-based duplicate check + one batched INSERT for the chunk"""
+    def apply(session: Session) -> set:
+        ids = [values["id"] for _, values in chunk]
+        existing = set(session.scalars(select(Student.id).where(Student.id.in_(ids))))
+        new_rows = [values for _, values in chunk if values["id"] not in existing]
+        if new_rows:
+            session.execute(insert(Student), new_rows)
+        return existing
+    return apply
+
+
+def _add_row(
+    raw: object,
+    row_number: int,
+    results: List[StudentImportResult],
+    seen_ids: set,
+    chunk: List[Tuple[int, dict]],
+):
+    """Validate one row: invalid/duplicate go straight to the report, the rest to the chunk"""
+    try:
+        student = StudentImportRow.model_validate(_clean(raw))
+    except ValidationError as e:
+        error = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'row'}: {err['msg']}" for err in e.errors())
+        results.append(StudentImportResult(row=row_number, result='invalid', error=error))
+        return
+
+    values = student.model_dump()
+    values["id"] = values["id"] or uuid.uuid4().hex[:8]
+    if values["id"] in seen_ids:
+        results.append(StudentImportResult(
+            row=row_number, id=values["id"], result='duplicate', error="Duplicate id in import file"
+        ))
+        return
+    seen_ids.add(values["id"])
+    chunk.append((row_number, values))
+
+
+async def import_students(rows: AsyncIterator[object]) -> StudentImportReport:
+    results: List[StudentImportResult] = []
+    seen_ids: set = set()
+    chunk: List[Tuple[int, dict]] = []
+    committed = False
+    error: Optional[str] = None
+
+    def stop(message: str):
+        nonlocal error
+        error = f"{error}; {message}" if error else message
+
+    async def flush() -> bool:
+        """Write the pending chunk; False if it failed after earlier chunks were committed"""
+        nonlocal committed
+        try:
+            existing = await writer.run(_insert_chunk(chunk))
+        except Exception as e:
+            if not committed:
+                raise
+            # O bloco inteiro foi desfeito; os anteriores continuam gravados
+            detail = str(getattr(e, "orig", e)).splitlines()[0]
+            stop(f"Rows {chunk[0][0]}-{chunk[-1][0]} were not saved: {detail}")
+            for row_number, values in chunk:
+                results.append(StudentImportResult(
+                    row=row_number, id=values["id"], result='invalid', error="Not saved: chunk write failed"
+                ))
+            chunk.clear()
+            return False
+        committed = True
+        for row_number, values in chunk:
+            duplicate = values["id"] in existing
+            results.append(StudentImportResult(
+                row=row_number,
+                id=values["id"],
+                result='duplicate' if duplicate else 'created',
+                error=f"Student with id '{values['id']}' already exists" if duplicate else None,
+            ))
+        chunk.clear()
+        return True
+
+    row_number = 0
+    rejected = 0
+    try:
+        async for raw in rows:
+            if row_number == MAX_IMPORT_ROWS:
+                # Para de ler: o resto do corpo não custa memória nem CPU
+                rejected = 1
+                stop(f"Import is limited to {MAX_IMPORT_ROWS} rows")
+                break
+            row_number += 1
+            _add_row(raw, row_number, results, seen_ids, chunk)
+            if len(chunk) >= IMPORT_CHUNK_SIZE and not await flush():
+                break
+    except HTTPException as e:
+        if not committed:
+            raise
+        stop(f"{e.detail} (after row {row_number})")
+
+    if chunk:
+        await flush()
+
+    results.sort(key=lambda r: r.row)
+    return StudentImportReport(
+        total=row_number,
+        created=sum(1 for r in results if r.result == 'created'),
+        duplicates=sum(1 for r in results if r.result == 'duplicate'),
+        invalid=sum(1 for r in results if r.result == 'invalid'),
+        rejected=rejected,
+        error=error,
+        rows=results,
+    )
+
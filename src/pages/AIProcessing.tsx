@@ -1,10 +1,10 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Sparkle, Users, CheckCircle, Clock, ArrowRight, Eye } from '@phosphor-icons/react';
 import { Navbar } from '../components/Navbar';
 import { Button } from '../components/ui/button';
 import { useToast } from '../hooks/use-toast';
-import { getAllPEIs, getPEIResponses, triggerAIProcessing, type PEI, type ProfessionalResponse } from '../services/api';
+import { getAllPEIs, getPEIResponses, subscribeToGeneration, triggerAIProcessing, type PEI, type ProfessionalResponse } from '../services/api';
 
 export default function AIProcessing() {
   const navigate = useNavigate();
@@ -13,6 +13,14 @@ export default function AIProcessing() {
   const [responses, setResponses] = useState<Record<string, ProfessionalResponse[]>>({});
   const [loading, setLoading] = useState(true);
   const [processing, setProcessing] = useState<Record<string, boolean>>({});
+  // Seções do PEI já geradas, recebidas por SSE enquanto a IA trabalha
+  const [generatedSections, setGeneratedSections] = useState<Record<string, string[]>>({});
+  const subscriptions = useRef<Record<string, () => void>>({});
+
+  useEffect(() => {
+    const active = subscriptions.current;
+    return () => Object.values(active).forEach((unsubscribe) => unsubscribe());
+  }, []);
 
   const loadData = useCallback(async () => {
     try {
@@ -47,30 +55,45 @@ export default function AIProcessing() {
   }, [loadData]);
 
   const handleProcessAI = async (peiId: string) => {
-    setProcessing({ ...processing, [peiId]: true });
+    setProcessing((current) => ({ ...current, [peiId]: true }));
+    setGeneratedSections((current) => ({ ...current, [peiId]: [] }));
     
     try {
       await triggerAIProcessing(peiId);
       
       toast({
         title: 'Processamento Iniciado!',
-        description: 'A IA está processando o PEI. Aguarde alguns segundos...',
+        description: 'A IA está gerando o PEI. As seções aparecem conforme ficam prontas.',
       });
 
-      // Reload data after 5 seconds to see results
-      setTimeout(async () => {
-        await loadData();
-        setProcessing({ ...processing, [peiId]: false });
+      subscriptions.current[peiId]?.();
+      subscriptions.current[peiId] = subscribeToGeneration('pei', peiId, async (event) => {
+        if (event.event === 'section' && event.name) {
+          setGeneratedSections((current) => ({
+            ...current,
+            [peiId]: [...(current[peiId] || []).filter((name) => name !== event.name), event.name as string],
+          }));
+        }
         
-        toast({
-          title: 'Processamento Concluído!',
-          description: 'O PEI foi gerado com sucesso pela IA.',
-        });
-      }, 5000);
+        if (event.event === 'done' || event.event === 'error') {
+          delete subscriptions.current[peiId];
+          await loadData();
+          setProcessing((current) => ({ ...current, [peiId]: false }));
+          
+          toast(event.event === 'done' ? {
+            title: 'Processamento Concluído!',
+            description: 'O PEI foi gerado com sucesso pela IA.',
+          } : {
+            title: 'Erro',
+            description: 'Não foi possível processar o PEI com a IA.',
+            variant: 'destructive',
+          });
+        }
+      });
       
     } catch (error) {
       console.error('Error processing AI:', error);
-      setProcessing({ ...processing, [peiId]: false });
+      setProcessing((current) => ({ ...current, [peiId]: false }));
       toast({
         title: 'Erro',
         description: 'Não foi possível processar o PEI com a IA.',
@@ -241,6 +264,13 @@ export default function AIProcessing() {
                         )}
                       </div>
                       
+                      {isProcessing && (
+                        <p className="text-xs text-blue-600 mt-1">
+                          Seções geradas: {generatedSections[pei.id]?.length || 0}
+                          {generatedSections[pei.id]?.length ? ` (${generatedSections[pei.id].join(', ')})` : ''}
+                        </p>
+                      )}
+                      
                       {pei.ai_processed_at && (
                         <p className="text-xs text-gray-500 mt-1">
                           Processado em: {new Date(pei.ai_processed_at).toLocaleString('pt-BR')}
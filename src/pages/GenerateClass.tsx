@@ -5,9 +5,26 @@ import { ArrowLeft, FolderOpen, Download, Loader2 } from 'lucide-react';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
-import { getStudent, getStudentPEI, getStudentMaterials, uploadMaterial, type Student, type PEI, type AdaptedMaterial } from '@/services/api';
+import { Checkbox } from '@/components/ui/checkbox';
+import { Progress } from '@/components/ui/progress';
+import {
+  getMaterialBatch,
+  getStudent,
+  getStudentPEI,
+  getStudentMaterials,
+  getStudentsPage,
+  subscribeToMaterialBatch,
+  uploadMaterialBatch,
+  type Student,
+  type PEI,
+  type AdaptedMaterial,
+  type MaterialBatch,
+} from '@/services/api';
 import { useToast } from '@/hooks/use-toast';
 
+// MATERIAL_BATCH_MAX_STUDENTS do backend: mais colegas que isso não cabem num lote
+const MAX_CLASSMATES = 100;
+
 const GenerateClass = () => {
   const navigate = useNavigate();
   const { studentId } = useParams();
@@ -21,6 +38,10 @@ const GenerateClass = () => {
   const [pei, setPei] = useState<PEI | null>(null);
   const [materials, setMaterials] = useState<AdaptedMaterial[]>([]);
   const [loading, setLoading] = useState(true);
+  // Colegas com PEI aprovado: o mesmo material sai para todos num lote só
+  const [classmates, setClassmates] = useState<Student[]>([]);
+  const [selectedClassmates, setSelectedClassmates] = useState<string[]>([]);
+  const [batch, setBatch] = useState<MaterialBatch | null>(null);
 
   useEffect(() => {
     const fetchData = async () => {
@@ -54,6 +75,15 @@ const GenerateClass = () => {
           console.log('No materials found for student:', studentId);
           setMaterials([]);
         }
+
+        try {
+          // Só os alunos com PEI aprovado, já filtrados e paginados no servidor
+          const page = await getStudentsPage({ peiStatus: 'concluido', sort: 'name', limit: MAX_CLASSMATES });
+          setClassmates(page.items.filter((s) => s.id !== studentId));
+        } catch (err) {
+          console.log('Could not load classmates:', err);
+          setClassmates([]);
+        }
       } catch (err) {
         toast({
           title: 'Erro',
@@ -69,6 +99,23 @@ const GenerateClass = () => {
     fetchData();
   }, [studentId, toast]);
 
+  // Progresso do lote por SSE; o stream fecha sozinho no 'done'
+  const batchId = batch?.batch_id;
+  useEffect(() => {
+    if (!batchId || !studentId) return;
+    return subscribeToMaterialBatch(batchId, setBatch, async () => {
+      try {
+        setMaterials(await getStudentMaterials(studentId));
+      } catch (err) {
+        console.error('Error refreshing materials:', err);
+      }
+    });
+  }, [batchId, studentId]);
+
+  const toggleClassmate = (id: string, checked: boolean) => {
+    setSelectedClassmates((current) => (checked ? [...current, id] : current.filter((c) => c !== id)));
+  };
+
   const handleLogout = () => {
     console.log('Logging out...');
   };
@@ -123,8 +170,8 @@ const GenerateClass = () => {
     try {
       setUploading(true);
       
-      const result = await uploadMaterial(
-        studentId,
+      const result = await uploadMaterialBatch(
+        [studentId, ...selectedClassmates],
         selectedFile,
         materialTitle,
         materialSubject || undefined,
@@ -133,14 +180,25 @@ const GenerateClass = () => {
 
       toast({
         title: 'Sucesso!',
-        description: 'Material enviado para adaptação. A IA está processando...',
+        description: result.total > 1
+          ? `Material enviado para ${result.total} alunos. A IA está processando...`
+          : 'Material enviado para adaptação. A IA está processando...',
       });
+      if (result.rejected.length > 0) {
+        toast({
+          title: 'Atenção',
+          description: `${result.rejected.length} aluno(s) sem PEI aprovado ficaram de fora`,
+          variant: 'destructive',
+        });
+      }
+      setBatch(await getMaterialBatch(result.batch_id));
 
       // Clear form
       setSelectedFile(null);
       setMaterialTitle('');
       setMaterialSubject('');
       setMaterialGrade('');
+      setSelectedClassmates([]);
 
       // Refresh materials list
       setTimeout(async () => {
@@ -418,6 +476,27 @@ const GenerateClass = () => {
               />
             </div>
 
+            {/* Classmates */}
+            {classmates.length > 0 && (
+              <div>
+                <Label className="text-[#1D1D1D] font-medium mb-2 block">
+                  Adaptar também para (opcional)
+                </Label>
+                <div className="grid grid-cols-2 gap-2 max-h-40 overflow-y-auto bg-white rounded-[10px] p-3">
+                  {classmates.map((classmate) => (
+                    <label key={classmate.id} className="flex items-center gap-2 text-sm text-[#1D1D1D] cursor-pointer">
+                      <Checkbox
+                        checked={selectedClassmates.includes(classmate.id)}
+                        onCheckedChange={(checked) => toggleClassmate(classmate.id, checked === true)}
+                        disabled={uploading}
+                      />
+                      {classmate.name}
+                    </label>
+                  ))}
+                </div>
+              </div>
+            )}
+
             {/* Upload Button */}
             <div className="flex justify-center pt-4">
               <Button
@@ -425,9 +504,24 @@ const GenerateClass = () => {
                 disabled={!selectedFile || !materialTitle.trim() || uploading}
                 className="bg-[#E65100] hover:bg-[#D14900] text-white px-8 py-3 text-base font-semibold"
               >
-                {uploading ? 'Enviando...' : 'Enviar para Adaptação'}
+                {uploading
+                  ? 'Enviando...'
+                  : selectedClassmates.length > 0
+                    ? `Enviar para ${selectedClassmates.length + 1} alunos`
+                    : 'Enviar para Adaptação'}
               </Button>
             </div>
+
+            {/* Batch Progress */}
+            {batch && batch.total > 1 && (
+              <div className="bg-white rounded-[10px] p-4 space-y-2">
+                <p className="text-[#1D1D1D] text-sm font-medium">
+                  {batch.title}: {batch.counts.completed} de {batch.total} alunos prontos
+                  {batch.counts.error > 0 && ` (${batch.counts.error} com erro)`}
+                </p>
+                <Progress value={batch.progress * 100} />
+              </div>
+            )}
           </div>
         </div>
       </main>
@@ -4,36 +4,59 @@ import { Navbar } from '@/components/Navbar';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Search, Eye, Download, RefreshCw, CheckCircle, Clock, AlertCircle } from 'lucide-react';
-import { getAllPEIs, getStudent, type PEI, type Student } from '@/services/api';
+import { getPEICounts, getPEIsPage, getStudent, type PEI, type PEICounts, type Student } from '@/services/api';
+
+const PAGE_SIZE = 50;
 
 const PEIs = () => {
   const navigate = useNavigate();
   const [peis, setPeis] = useState<PEI[]>([]);
   const [students, setStudents] = useState<{ [key: string]: Student }>({});
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [totalPEIs, setTotalPEIs] = useState<number | null>(null);
+  const [counts, setCounts] = useState<PEICounts | null>(null);
   const [searchTerm, setSearchTerm] = useState('');
   const [statusFilter, setStatusFilter] = useState<string>('all');
 
+  // Fetch student data only for students not loaded yet
+  const fetchStudents = async (peisData: PEI[], known: { [key: string]: Student }) => {
+    const missingIds = [...new Set(peisData.map(pei => pei.student_id))].filter(id => !known[id]);
+    const studentsData = await Promise.all(
+      missingIds.map(id => getStudent(id).catch(() => null))
+    );
+    
+    const studentsMap: { [key: string]: Student } = {};
+    studentsData.forEach((student, index) => {
+      if (student) {
+        studentsMap[missingIds[index]] = student;
+      }
+    });
+    setStudents(prev => ({ ...prev, ...studentsMap }));
+  };
+
+  // Cards de resumo: contagem por status de todos os PEIs, feita no servidor
+  useEffect(() => {
+    getPEICounts()
+      .then(setCounts)
+      .catch((error) => console.error('Error fetching PEI counts:', error));
+  }, []);
+
+  // Filtro de status é aplicado no servidor; busca por texto continua local
   useEffect(() => {
     const fetchData = async () => {
       try {
         setLoading(true);
-        const peisData = await getAllPEIs();
-        setPeis(peisData);
-
-        // Fetch student data for each PEI
-        const studentPromises = peisData.map(pei => 
-          getStudent(pei.student_id).catch(() => null)
-        );
-        const studentsData = await Promise.all(studentPromises);
-        
-        const studentsMap: { [key: string]: Student } = {};
-        studentsData.forEach((student, index) => {
-          if (student) {
-            studentsMap[peisData[index].student_id] = student;
-          }
+        const page = await getPEIsPage({
+          limit: PAGE_SIZE,
+          status: statusFilter !== 'all' ? statusFilter : undefined,
+          includeTotal: true,
         });
-        setStudents(studentsMap);
+        setPeis(page.items);
+        setNextCursor(page.nextCursor);
+        setTotalPEIs(page.total);
+        await fetchStudents(page.items, students);
       } catch (error) {
         console.error('Error fetching PEIs:', error);
       } finally {
@@ -42,7 +65,26 @@ const PEIs = () => {
     };
 
     fetchData();
-  }, []);
+  }, [statusFilter]);
+
+  const handleLoadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const page = await getPEIsPage({
+        limit: PAGE_SIZE,
+        cursor: nextCursor,
+        status: statusFilter !== 'all' ? statusFilter : undefined,
+      });
+      setPeis(prev => [...prev, ...page.items]);
+      setNextCursor(page.nextCursor);
+      await fetchStudents(page.items, students);
+    } catch (error) {
+      console.error('Error fetching PEIs:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   const handleLogout = () => {
     console.log('Logging out...');
@@ -98,19 +140,19 @@ const PEIs = () => {
     const student = students[pei.student_id];
     const matchesSearch = student?.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
                          pei.special_needs?.toLowerCase().includes(searchTerm.toLowerCase());
-    const matchesStatus = statusFilter === 'all' || pei.status === statusFilter;
-    
-    return matchesSearch && matchesStatus;
+    return matchesSearch;
   });
 
-  // Calculate statistics
+  // Statistics from the server counts (the list only holds the loaded pages)
+  const byStatus = counts?.by_status ?? {};
   const stats = {
-    total: peis.length,
-    completed: peis.filter(p => p.status === 'completed').length,
-    in_review: peis.filter(p => p.status === 'in_review').length,
-    in_collection: peis.filter(p => p.status === 'in_collection').length,
-    expired: peis.filter(p => p.status === 'expired').length,
+    total: counts?.total ?? 0,
+    completed: byStatus.completed ?? 0,
+    in_review: byStatus.in_review ?? 0,
+    in_collection: byStatus.in_collection ?? 0,
+    expired: byStatus.expired ?? 0,
   };
+  const listedTotal = totalPEIs ?? peis.length;
 
   if (loading) {
     return (
@@ -273,7 +315,16 @@ const PEIs = () => {
         {/* Results count */}
         {filteredPEIs.length > 0 && (
           <div className="mt-4 text-[#6C757D] text-sm text-center">
-            Mostrando {filteredPEIs.length} de {peis.length} PEI{peis.length !== 1 ? 's' : ''}
+            Mostrando {filteredPEIs.length} de {listedTotal} PEI{listedTotal !== 1 ? 's' : ''}
+          </div>
+        )}
+
+        {/* Next page */}
+        {nextCursor && (
+          <div className="mt-4 flex justify-center">
+            <Button onClick={handleLoadMore} variant="outline" disabled={loadingMore}>
+              {loadingMore ? 'Carregando...' : 'Carregar mais'}
+            </Button>
           </div>
         )}
       </main>
@@ -100,6 +100,46 @@ export async function getStudents(): Promise<Student[]> {
   }
 }
 
+export interface StudentPageParams {
+  limit?: number;
+  cursor?: string | null;
+  status?: string;
+  peiStatus?: string;
+  sort?: 'id' | 'name';
+  includeTotal?: boolean;
+}
+
+/**
+ * Fetch one page of students (keyset pagination); `peiStatus` keeps only students with a PEI in that status
+ */
+export async function getStudentsPage(params: StudentPageParams = {}): Promise<Page<Student>> {
+  try {
+    const query = new URLSearchParams();
+    query.set('limit', String(params.limit ?? 50));
+    if (params.cursor) query.set('cursor', params.cursor);
+    if (params.status) query.set('status', params.status);
+    if (params.peiStatus) query.set('pei_status', params.peiStatus);
+    if (params.sort) query.set('sort', params.sort);
+    if (params.includeTotal) query.set('include_total', 'true');
+
+    const response = await fetch(`${API_BASE_URL}/api/students?${query.toString()}`);
+    
+    if (!response.ok) {
+      throw new APIError(response.status, `Failed to fetch students: ${response.statusText}`);
+    }
+    
+    const total = response.headers.get('X-Total-Count');
+    return {
+      items: await response.json(),
+      nextCursor: response.headers.get('X-Next-Cursor'),
+      total: total !== null ? Number(total) : null,
+    };
+  } catch (error) {
+    if (error instanceof APIError) throw error;
+    throw new Error(`Network error: ${error instanceof Error ? error.message : 'Unknown error'}`);
+  }
+}
+
 /**
  * Fetch a single student by ID
  */
@@ -229,6 +269,75 @@ export async function getAllPEIs(): Promise<PEI[]> {
   }
 }
 
+export interface PEIPageParams {
+  limit?: number;
+  cursor?: string | null;
+  status?: string;
+  aiProcessingStatus?: string;
+  studentId?: string;
+  includeTotal?: boolean;
+}
+
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+  total: number | null;
+}
+
+/**
+ * Fetch one page of PEIs (keyset pagination, most recent first)
+ */
+export async function getPEIsPage(params: PEIPageParams = {}): Promise<Page<PEI>> {
+  try {
+    const query = new URLSearchParams();
+    query.set('limit', String(params.limit ?? 50));
+    if (params.cursor) query.set('cursor', params.cursor);
+    if (params.status) query.set('status', params.status);
+    if (params.aiProcessingStatus) query.set('ai_processing_status', params.aiProcessingStatus);
+    if (params.studentId) query.set('student_id', params.studentId);
+    if (params.includeTotal) query.set('include_total', 'true');
+
+    const response = await fetch(`${API_BASE_URL}/api/peis?${query.toString()}`);
+    
+    if (!response.ok) {
+      throw new APIError(response.status, `Failed to fetch PEIs: ${response.statusText}`);
+    }
+    
+    const total = response.headers.get('X-Total-Count');
+    return {
+      items: await response.json(),
+      nextCursor: response.headers.get('X-Next-Cursor'),
+      total: total !== null ? Number(total) : null,
+    };
+  } catch (error) {
+    if (error instanceof APIError) throw error;
+    throw new Error(`Network error: ${error instanceof Error ? error.message : 'Unknown error'}`);
+  }
+}
+
+export interface PEICounts {
+  total: number;
+  by_status: Record<string, number>;
+}
+
+/**
+ * Number of PEIs per status across all PEIs (not just the loaded page)
+ */
+export async function getPEICounts(): Promise<PEICounts> {
+  try {
+    const response = await fetch(`${API_BASE_URL}/api/peis/counts`);
+    
+    if (!response.ok) {
+      throw new APIError(response.status, `Failed to fetch PEI counts: ${response.statusText}`);
+    }
+    
+    return await response.json();
+  } catch (error) {
+    if (error instanceof APIError) throw error;
+    throw new Error(`Network error: ${error instanceof Error ? error.message : 'Unknown error'}`);
+  }
+}
+
 /**
  * Fetch PEI by ID
  */
@@ -381,6 +490,43 @@ export async function triggerAIProcessing(peiId: string): Promise<{ message: str
   }
 }
 
+export type GenerationEventType = 'queued' | 'started' | 'section' | 'attempt_failed' | 'done' | 'error';
+
+export interface GenerationEvent {
+  id: number;
+  event: GenerationEventType;
+  name: string | null;
+  payload: any;
+}
+
+/**
+ * Follow an AI generation over Server-Sent Events.
+ * Sections arrive as soon as the model finishes them; the stream closes after 'done' or 'error'.
+ * Returns a function that stops listening.
+ */
+export function subscribeToGeneration(
+  target: 'pei' | 'material',
+  id: string,
+  onEvent: (event: GenerationEvent) => void,
+): () => void {
+  const path = target === 'pei' ? `/api/pei/${id}/events` : `/api/materials/${id}/events`;
+  const source = new EventSource(`${API_BASE_URL}${path}`);
+  const events: GenerationEventType[] = ['queued', 'started', 'section', 'attempt_failed', 'done', 'error'];
+
+  for (const type of events) {
+    source.addEventListener(type, (message) => {
+      const { data, lastEventId } = message as MessageEvent;
+      const parsed = JSON.parse(data);
+      onEvent({ id: Number(lastEventId), event: type, name: parsed.name, payload: parsed.payload });
+      if (type === 'done' || type === 'error') {
+        source.close();
+      }
+    });
+  }
+
+  return () => source.close();
+}
+
 /**
  * Approve PEI (simulates auditor approval) - changes status to 'concluido'
  */
@@ -436,6 +582,112 @@ export async function uploadMaterial(
   }
 }
 
+export interface MaterialBatchUpload {
+  batch_id: string;
+  status: string;
+  total: number;
+  materials: Array<{ student_id: string; id: string; job_id: string; status: string }>;
+  rejected: Array<{ student_id: string; error: string }>;
+  message: string;
+}
+
+/**
+ * Upload one material for a whole class: the PDF is sent and extracted once,
+ * then adapted for every student in parallel
+ */
+export async function uploadMaterialBatch(
+  studentIds: string[],
+  file: File,
+  title: string,
+  subject?: string,
+  grade?: string
+): Promise<MaterialBatchUpload> {
+  try {
+    const formData = new FormData();
+    formData.append('file', file);
+    formData.append('title', title);
+    formData.append('student_ids', JSON.stringify(studentIds));
+    if (subject) formData.append('subject', subject);
+    if (grade) formData.append('grade', grade);
+
+    const response = await fetch(`${API_BASE_URL}/api/materials/batch-upload`, {
+      method: 'POST',
+      body: formData,
+    });
+    
+    if (!response.ok) {
+      const error = await response.json();
+      const detail = typeof error.detail === 'string' ? error.detail : error.detail?.message;
+      throw new APIError(response.status, detail || 'Failed to upload material');
+    }
+    
+    return await response.json();
+  } catch (error) {
+    if (error instanceof APIError) throw error;
+    throw new Error(`Network error: ${error instanceof Error ? error.message : 'Unknown error'}`);
+  }
+}
+
+export interface MaterialBatch {
+  batch_id: string;
+  title: string;
+  original_filename: string;
+  status: 'processing' | 'completed' | 'completed_with_errors';
+  total: number;
+  counts: { processing: number; completed: number; error: number };
+  progress: number;
+  uploaded_at: string | null;
+  materials: Array<{
+    id: string;
+    student_id: string;
+    student_name: string | null;
+    status: 'processing' | 'completed' | 'error';
+    processed_at: string | null;
+    download_url: string | null;
+  }>;
+}
+
+/**
+ * Follow a class-wide batch: aggregated progress and the material of each student
+ */
+export async function getMaterialBatch(batchId: string): Promise<MaterialBatch> {
+  try {
+    const response = await fetch(`${API_BASE_URL}/api/materials/batches/${batchId}`);
+    
+    if (!response.ok) {
+      throw new APIError(response.status, `Failed to fetch material batch: ${response.statusText}`);
+    }
+    
+    return await response.json();
+  } catch (error) {
+    if (error instanceof APIError) throw error;
+    throw new Error(`Network error: ${error instanceof Error ? error.message : 'Unknown error'}`);
+  }
+}
+
+/**
+ * Follow a class-wide batch over Server-Sent Events: 'progress' carries the same
+ * payload as getMaterialBatch whenever a student finishes; the stream closes after 'done'.
+ * Returns a function that stops listening.
+ */
+export function subscribeToMaterialBatch(
+  batchId: string,
+  onProgress: (batch: MaterialBatch) => void,
+  onDone: (status: MaterialBatch['status']) => void,
+): () => void {
+  const source = new EventSource(`${API_BASE_URL}/api/materials/batches/${batchId}/events`);
+
+  source.addEventListener('progress', (message) => {
+    onProgress(JSON.parse((message as MessageEvent).data));
+  });
+  source.addEventListener('done', (message) => {
+    source.close();
+    onDone(JSON.parse((message as MessageEvent).data).status);
+  });
+
+  return () => source.close();
+}
+
 /**
  * Get all adapted materials for a student
  */